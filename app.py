@@ -1,63 +1,169 @@
 import pandas as pd
-from collections import Counter
+import numpy as np
+from functools import cached_property
+import argparse
 import os
 import json
-import sys
-
-SLA_LIMITS = {
-    'Created': 30,
-    'Assigned': 30,
-    'In Progress': 240,
-    'Waiting for Customer': 1440,
-    'Code Review': 180,
-    'QA Review': 180,
-    'Resolved': 60,
-    'Closed': 60,
-    'Reopened': 120
-}
+from concurrent.futures import ProcessPoolExecutor
+
+from ml_backend.event_log import load_events, split_cases
+from ml_backend import analytics_store, instrument
+from ml_backend.instrument import stage
+from ml_backend.incremental import case_hashes, changed_cases, concat_case_tables, load_state, merge_case_tables, save_state, state_key
+from ml_backend.variants import INDEX_FILE as VARIANT_INDEX_FILE, VariantIndex
+from ml_backend.process_graph import directly_follows
+from ml_backend.time_windows import WindowedMetrics
+from ml_backend.report_writer import FORMATS, write_json, write_pages
+from ml_backend.sla import (
+    STREAM_THRESHOLD,
+    find_sla_violations,
+    iter_violation_records,
+    load_sla_rules,
+    stream_violations,
+    violation_records,
+)
 
 OUTPUT_DIR = "output"
 
-def save_json(data, filename):
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    path = os.path.join(OUTPUT_DIR, filename)
-    with open(path, 'w') as f:
-        json.dump(data, f, indent=2)
+# Columns every report groups by; load_events already dictionary-encodes them,
+# other frames are encoded once per run
+GROUP_KEYS = ['case_id', 'user', 'role', 'activity']
+
+def save_json(data, filename, output_dir=OUTPUT_DIR, report_format='json'):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, filename)
+    rows = len(data) if isinstance(data, list) else None
+    with stage(f'write_json:{filename}', rows=rows):
+        write_json(data, path, report_format)
     print(f"Saved: {path}")
 
+def save_pages(records, name, output_dir=OUTPUT_DIR, summary=None):
+    # Paged report: <name>/index.json plus <name>/page-NNNNN.json, written
+    # while the records are produced
+    path = os.path.join(output_dir, name)
+    with stage(f'write_pages:{name}') as record:
+        index = write_pages(records, path, summary=summary)
+        record['rows'] = index['total']
+    print(f"Saved: {path}/ ({index['total']} records, {len(index['pages'])} pages)")
+
 def load_log(filepath):
     try:
-        df = pd.read_csv(filepath)
-        df.columns = [col.lower().strip() for col in df.columns]
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df = df.sort_values(by=['case_id', 'timestamp'])
-        if 'role' not in df.columns or 'story_points' not in df.columns:
-            raise ValueError("Missing required columns: role or story_points")
-        return df
+        with stage('parse_csv') as record:
+            df = load_events(filepath, errors='raise')
+            record['rows'] = len(df)
+        return prepare_log(df)
     except Exception as e:
         print(f"Error loading file: {e}")
         return None
 
+def prepare_log(df):
+    # Order and check an already loaded event log for run_reports
+    with stage('sort_events', rows=len(df)):
+        df = df.sort_values(by=['case_id', 'timestamp'])
+    if 'role' not in df.columns or 'story_points' not in df.columns:
+        raise ValueError("Missing required columns: role or story_points")
+    return df
+
 def prepare_data(df):
     df['step'] = df.groupby('case_id').cumcount()
     df['duration'] = df.groupby('case_id')['timestamp'].diff()
     return df
 
-def show_common_paths(df):
-    variants = df.groupby('case_id')['activity'].apply(list)
-    variant_strings = variants.apply(lambda x: ' -> '.join(x))
-    counter = Counter(variant_strings)
-
+class AnalyticsContext:
+    # Intermediates shared by the report builders. Each one is computed at most
+    # once, on first use, so a run restricted with --only pays for what it needs.
+    def __init__(self, df, sla_rules=None, output_dir=OUTPUT_DIR, report_format='json'):
+        for col in GROUP_KEYS:
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+        self.df = df
+        self.sla_rules = sla_rules if sla_rules is not None else load_sla_rules()
+        self.output_dir = output_dir
+        self.report_format = report_format
+
+    def save(self, data, filename):
+        save_json(data, filename, self.output_dir, self.report_format)
+
+    @property
+    def paged(self):
+        return self.report_format == 'pages'
+
+    @cached_property
+    def timed(self):
+        # Events with a duration, i.e. every step but the first of each case
+        timed = self.df.dropna(subset=['duration'])
+        timed = timed.assign(duration_minutes=timed['duration'].dt.total_seconds() / 60)
+        return timed
+
+    @cached_property
+    def user_events(self):
+        return self.timed.dropna(subset=['user', 'role', 'story_points'])
+
+    @cached_property
+    def case_activities(self):
+        # The frame is sorted by case, so each case is one contiguous run of rows
+        cases = self.df[self.df['case_id'].notna()]
+        if cases.empty:
+            return pd.Series([], dtype=object)
+        codes = cases['case_id'].cat.codes.to_numpy()
+        starts = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+        runs = np.split(cases['activity'].astype(object).to_numpy(), starts)
+        labels = cases['case_id'].to_numpy()[np.r_[0, starts]]
+        return pd.Series([run.tolist() for run in runs], index=labels)
+
+    @cached_property
+    def variants(self):
+        return VariantIndex.from_paths(self.case_activities)
+
+    # Per-case tables the reports are built from. Each is indexed (or keyed)
+    # by case first, so an incremental run can compute them for the changed
+    # cases only and merge them with the saved rows of the others.
+
+    @cached_property
+    def user_stats(self):
+        # Per (case, user, role, activity): step time, steps and story points
+        return self.user_events.groupby(['case_id', 'user', 'role', 'activity'], observed=True).agg(
+            duration=('duration', 'sum'),
+            occurrences=('duration', 'size'),
+            story_points=('story_points', 'sum'),
+        )
+
+    @cached_property
+    def case_role_minutes(self):
+        return self.timed.dropna(subset=['role']).groupby(['case_id', 'role'], observed=True)['duration_minutes'].sum()
+
+    @cached_property
+    def case_total_minutes(self):
+        return self.timed.dropna(subset=['role']).groupby('case_id', observed=True)['duration_minutes'].sum()
+
+    @cached_property
+    def violations(self):
+        return find_sla_violations(self.timed, self.sla_rules)
+
+    @cached_property
+    def step_stats(self):
+        # Per (case, activity): step time and steps, story point sum and count
+        steps = self.timed.groupby(['case_id', 'activity'], observed=True)['duration'].agg(duration='sum', steps='count')
+        points = self.df.groupby(['case_id', 'activity'], observed=True, dropna=False)['story_points'].agg(
+            story_points='sum', story_point_n='count')
+        return points.join(steps, how='outer')
+
+# Context attributes an incremental run keeps per case (see use_saved_cases)
+CASE_TABLES = ['user_stats', 'case_role_minutes', 'case_total_minutes', 'violations', 'case_activities', 'step_stats']
+
+def show_common_paths(ctx):
     top_variants = [
-        {"path": path, "count": count}
-        for path, count in counter.most_common(5)
+        {"path": ' -> '.join(path), "count": count}
+        for path, count in ctx.variants.top_variants(5)
     ]
-    save_json(top_variants, "common_paths.json")
+    ctx.save(top_variants, "common_paths.json")
 
-def show_step_durations(df):
-    df['duration'] = df.groupby('case_id')['timestamp'].diff()
-    avg_durations = df.groupby('activity')['duration'].mean().dropna()
-    avg_story_points = df.groupby('activity')['story_points'].mean().dropna()
+def show_step_durations(ctx):
+    stats = ctx.step_stats.groupby(level='activity', observed=True).sum()
+    timed = stats[stats['steps'] > 0]
+    avg_durations = timed['duration'] / timed['steps']
+    points = stats[stats['story_point_n'] > 0]
+    avg_story_points = points['story_points'] / points['story_point_n']
 
     durations = []
     for step, dur in avg_durations.items():
@@ -70,52 +176,65 @@ def show_step_durations(df):
             "bottleneck": mins > 60
         })
 
-    save_json(durations, "step_durations.json")
+    ctx.save(durations, "step_durations.json")
+
+def first_cases(events, keys, limit):
+    # One pass over the distinct (keys, case_id) pairs: for every key, the first
+    # `limit` cases in case order and the number of distinct cases
+    pairs = events[keys + ['case_id']].drop_duplicates()
+    counts = pairs.groupby(keys, observed=True).size()
+    head = pairs[pairs.groupby(keys, observed=True).cumcount() < limit]
+    cases = {}
+    for *key, case_id in zip(*(head[col].astype(object) for col in keys + ['case_id'])):
+        cases.setdefault(tuple(key), []).append(case_id)
+    return cases, counts
+
+def show_user_delays(ctx):
+    per_case = ctx.user_stats
+
+    keys = ['user', 'role', 'activity']
+    stats = per_case.groupby(level=keys, observed=True).sum()
+    stats['avg_duration'] = stats['duration'] / stats['occurrences']
+    stats['avg_story_points'] = stats['story_points'] / stats['occurrences']
+    pairs = per_case.index.to_frame(index=False)
+    cases, case_counts = first_cases(pairs, keys, 5)
 
-def show_user_delays(df):
-    df_filtered = df.dropna(subset=['duration', 'user', 'role', 'story_points'])
-
-    grouped = df_filtered.groupby(['user', 'role', 'activity'])
     detailed_stats = []
-
-    for (user, role, activity), group in grouped:
-        avg_duration = group['duration'].mean().total_seconds() / 60
-        avg_story_points = group['story_points'].mean()
-        cases = group['case_id'].unique().tolist()
+    for key, avg_duration, avg_story_points, occurrences in zip(
+            stats.index, stats['avg_duration'], stats['avg_story_points'], stats['occurrences']):
+        user, role, activity = key
         detailed_stats.append({
             "user": user,
             "role": role,
             "activity": activity,
-            "average_minutes": round(avg_duration, 2),
+            "average_minutes": round(avg_duration.total_seconds() / 60, 2),
             "average_story_points": round(avg_story_points, 2),
-            "occurrences": len(group),
-            "cases": cases[:5],
-            "more_cases": len(cases) > 5
+            "occurrences": int(occurrences),
+            "cases": cases[key],
+            "more_cases": bool(case_counts[key] > 5)
         })
 
     # Slowest user overall
-    user_durations = df_filtered.groupby('user')['duration'].mean()
+    user_totals = stats.groupby(level='user', observed=True)[['duration', 'occurrences']].sum()
+    user_durations = user_totals['duration'] / user_totals['occurrences']
     slowest_user = user_durations.idxmax()
     slowest_time = round(user_durations.max().total_seconds() / 60, 2)
 
     # Role-wise slowest user
-    role_user_group = df_filtered.groupby(['role', 'user'])
-
-    role_user_avg = role_user_group['duration'].mean().reset_index()
+    role_user_totals = stats.groupby(level=['role', 'user'], observed=True)[['duration', 'occurrences']].sum()
+    role_user_avg = (role_user_totals['duration'] / role_user_totals['occurrences']).rename('duration').reset_index()
     role_user_avg['avg_minutes'] = role_user_avg['duration'].dt.total_seconds() / 60
+    slowest_per_role = role_user_avg.loc[role_user_avg.groupby('role', observed=True)['avg_minutes'].idxmax()]
+    role_cases, role_case_counts = first_cases(pairs, ['role', 'user'], 10)
 
     slowest_roles = []
-    for role in role_user_avg['role'].unique():
-        role_users = role_user_avg[role_user_avg['role'] == role]
-        slowest = role_users.sort_values(by='avg_minutes', ascending=False).iloc[0]
-        user_cases = df_filtered[(df_filtered['role'] == role) & (df_filtered['user'] == slowest['user'])]['case_id'].unique().tolist()
-
+    for role, user, avg_minutes in zip(slowest_per_role['role'], slowest_per_role['user'], slowest_per_role['avg_minutes']):
         slowest_roles.append({
             "role": role,
-            "slowest_user": slowest['user'],
-            "average_minutes": round(slowest['avg_minutes'], 2),
-            "case_ids": user_cases[:10],  # limit to 10 for readability
-            "more_cases": len(user_cases) > 10
+            "slowest_user": user,
+            "average_minutes": round(avg_minutes, 2),
+            "case_ids": role_cases[(role, user)],  # limit to 10 for readability
+            "more_cases": bool(role_case_counts[(role, user)] > 10)
         })
 
     result = {
@@ -127,132 +246,334 @@ def show_user_delays(df):
         "slowest_roles": slowest_roles
     }
 
-    save_json(result, "user_delays.json")
-
-
-def show_case_durations(df):
-    df['duration_minutes'] = df['duration'].dt.total_seconds() / 60
-    df_filtered = df.dropna(subset=['duration_minutes', 'role'])
+    ctx.save(result, "user_delays.json")
+
+
+def show_case_durations(ctx):
+    case_group = ctx.case_role_minutes
+    case_total = ctx.case_total_minutes
+
+    # case_group is sorted by case, so each case owns one contiguous range of
+    # its rows; walk the ranges once instead of filtering per case
+    case_codes = case_group.index.codes[0]
+    bounds = np.r_[0, np.flatnonzero(np.diff(case_codes)) + 1, len(case_codes)]
+    roles = case_group.index.get_level_values('role').astype(object).tolist()
+    role_minutes = case_group.tolist()
+
+    def iter_cases():
+        for i, (case_id, total) in enumerate(zip(case_total.index.astype(object), case_total.tolist())):
+            role_data = [
+                {
+                    "role": roles[j],
+                    "total_minutes": round(role_minutes[j], 2)
+                }
+                for j in range(bounds[i], bounds[i + 1])
+            ]
+            yield {
+                "case_id": case_id,
+                "total_minutes": round(total, 2),
+                "roles": role_data
+            }
 
-    case_group = df_filtered.groupby(['case_id', 'role'])['duration_minutes'].sum().reset_index()
-    case_total = df_filtered.groupby('case_id')['duration_minutes'].sum()
+    # Identify the slowest case (the first one on ties, as max() does)
+    slowest = {}
 
-    cases = []
-    for case_id in case_total.index:
-        case_roles = case_group[case_group['case_id'] == case_id]
-        role_data = [
-            {
-                "role": row['role'],
-                "total_minutes": round(row['duration_minutes'], 2)
-            }
-            for _, row in case_roles.iterrows()
-        ]
-        cases.append({
-            "case_id": case_id,
-            "total_minutes": round(case_total[case_id], 2),
-            "roles": role_data
-        })
+    def track_slowest(cases):
+        for case in cases:
+            if not slowest or case["total_minutes"] > slowest["duration_minutes"]:
+                slowest.update(case_id=case["case_id"], duration_minutes=case["total_minutes"])
+            yield case
 
-    # Identify the slowest case
-    slowest = max(cases, key=lambda x: x["total_minutes"])
+    if ctx.paged:
+        save_pages(track_slowest(iter_cases()), "case_durations", ctx.output_dir,
+                   summary=lambda: {"slowest_case": slowest})
+        return
 
+    cases = list(track_slowest(iter_cases()))
     result = {
         "cases": cases,
-        "slowest_case": {
-            "case_id": slowest["case_id"],
-            "duration_minutes": slowest["total_minutes"]
-        }
+        "slowest_case": slowest
     }
 
-    save_json(result, "case_durations.json")
-
+    ctx.save(result, "case_durations.json")
 
 
-def show_sla_violations(df):
-    df['duration_mins'] = df['duration'].dt.total_seconds() / 60
-    violations = []
 
-    for _, row in df.dropna(subset=['duration']).iterrows():
-        activity = row['activity']
-        mins = row['duration_mins']
-        limit = SLA_LIMITS.get(activity)
-        if limit and mins > limit:
-            violations.append({
-                "case_id": row['case_id'],
-                "activity": activity,
-                "user": row['user'],
-                "role": row['role'],
-                "duration_minutes": round(mins),
-                "sla_limit": limit,
-                "story_points": row['story_points']
-            })
+def show_sla_violations(ctx):
+    violations = ctx.violations
 
-    save_json(violations, "sla_violations.json")
+    if ctx.paged:
+        save_pages(iter_violation_records(violations), "sla_violations", ctx.output_dir)
+    elif ctx.report_format == 'json' and len(violations) > STREAM_THRESHOLD:
+        os.makedirs(ctx.output_dir, exist_ok=True)
+        path = os.path.join(ctx.output_dir, "sla_violations.json")
+        with stage('write_json:sla_violations.json', rows=len(violations)):
+            stream_violations(violations, path)
+        print(f"Saved: {path}")
+    else:
+        ctx.save(violation_records(violations), "sla_violations.json")
 
 def save_cleaned_log(df, output_path="output/cleaned_log.csv"):
-    os.makedirs("output", exist_ok=True)
-    df.to_csv(output_path, index=False)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with stage(f'write_csv:{os.path.basename(output_path)}', rows=len(df)):
+        df.to_csv(output_path, index=False)
     print(f"Cleaned log saved to {output_path}")
 
-def show_path_tree(df):
-    tree = {}
-    case_activities = df.groupby('case_id')['activity'].apply(list)
-
-    # Build hierarchical tree with counts
-    for activity_list in case_activities:
-        current = tree
-        for act in activity_list:
-            if act not in current:
-                current[act] = {"_count": 0, "_children": {}}
-            current[act]["_count"] += 1
-            current = current[act]["_children"]
-
-    def format_tree(node):
-        return [
-            {
-                "name": name,
-                "count": data["_count"],
-                "children": format_tree(data["_children"]) if data["_children"] else []
-            }
-            for name, data in node.items()
-        ]
+def show_path_tree(ctx):
+    case_activities = ctx.case_activities
 
-    result = format_tree(tree)
-    save_json(result, "path_tree.json")
+    # Hierarchical tree with counts, plus the index itself so subtrees and
+    # prefix queries can be served without re-reading the log
+    ctx.save(ctx.variants.tree(), "path_tree.json")
+    with stage('save_variant_index'):
+        ctx.variants.save(os.path.join(ctx.output_dir, VARIANT_INDEX_FILE))
 
     # Also save individual case paths for each ticket
-    case_paths = []
-    for case_id, activities in case_activities.items():
-        case_paths.append({"case_id": case_id, "path": activities})
-    save_json(case_paths, "case_paths.json")
-
-# --- Entry point ---
-def main():
-   print("Enterprise Workflow Optimizer (Full Mode)")
-   with open('uploads/latest.txt', 'r') as file:
-    content = file.read().strip()
-    path = content
-    print(content)
-
+    case_paths = ({"case_id": case_id, "path": activities} for case_id, activities in case_activities.items())
+    if ctx.paged:
+        save_pages(case_paths, "case_paths", ctx.output_dir)
+    else:
+        ctx.save(list(case_paths), "case_paths.json")
+
+def edge_records(edges):
+    return [
+        {
+            "source": source,
+            "target": target,
+            "count": count,
+            "mean_minutes": None if np.isnan(mean) else round(mean, 2),
+            "p90_minutes": None if np.isnan(p90) else round(p90, 2),
+        }
+        for source, target, count, mean, p90 in zip(
+            edges['source'], edges['target'], edges['count'].tolist(),
+            edges['mean_minutes'].tolist(), edges['p90_minutes'].tolist())
+    ]
 
-   if not os.path.exists(path):
-       print(f"File not found: {path}")
-       return
+def show_process_graph(ctx):
+    # Directly-follows edges between activities and between roles, with the
+    # time between the two events; the edges holding the most total time
+    # come first in "bottlenecks"
+    activity_graph, role_graph, starts, ends = directly_follows(ctx.df)
+    activity_edges = activity_graph.edges()
+    role_edges = role_graph.edges()
+    bottlenecks = activity_edges.sort_values('total_minutes', ascending=False, kind='stable').head(5)
+    handoffs = edge_records(role_edges)
+    for edge in handoffs:
+        edge["handoff"] = edge["source"] != edge["target"]
+
+    labels = activity_graph.labels
+    result = {
+        "activities": edge_records(activity_edges),
+        "roles": handoffs,
+        "start_activities": [{"activity": labels[i], "count": int(starts[i])} for i in np.flatnonzero(starts)],
+        "end_activities": [{"activity": labels[i], "count": int(ends[i])} for i in np.flatnonzero(ends)],
+        "bottlenecks": edge_records(bottlenecks),
+    }
+    ctx.save(result, "process_graph.json")
+
+def show_trends(ctx):
+    # Weekly throughput, cycle time, WIP and SLA breach series for dashboards
+    metrics = WindowedMetrics('week', ctx.sla_rules)
+    metrics.update(ctx.df)
+    ctx.save(metrics.to_json(), "trends.json")
+
+# Report name -> builder, in the order a full run produces them
+REPORTS = {
+    'user_delays': show_user_delays,
+    'case_durations': show_case_durations,
+    'sla_violations': show_sla_violations,
+    'common_paths': show_common_paths,
+    'step_durations': show_step_durations,
+    'cleaned_log': lambda ctx: save_cleaned_log(ctx.df, os.path.join(ctx.output_dir, "cleaned_log.csv")),
+    'path_tree': show_path_tree,
+    'process_graph': show_process_graph,
+    'trends': show_trends,
+}
 
-   df = load_log(path)
-   if df is None:
-       return
+def store_tables(ctx):
+    # Tables of the analytics store (see ml_backend/analytics_store.py), from
+    # the same intermediates as the reports
+    df = ctx.df[ctx.df['case_id'].notna()]
+    cases = df.groupby('case_id', observed=True).agg(
+        start=('timestamp', 'min'),
+        end=('timestamp', 'max'),
+        events=('activity', 'size'),
+        story_points=('story_points', 'max'),
+    )
+    cases['total_minutes'] = ctx.case_total_minutes.reindex(cases.index, fill_value=0).round(2)
+    violations = ctx.violations
+    cases['violations'] = violations['case_id'].value_counts().reindex(cases.index, fill_value=0)
+    variants = ctx.variants
+    cases['variant_pre'] = pd.Series(variants.pre[variants.case_node], index=variants.case_ids).reindex(cases.index.astype(object)).to_numpy()
+    cases['path'] = ctx.case_activities.reindex(cases.index.astype(object)).map(json.dumps).to_numpy()
+    for col in ('start', 'end'):
+        cases[col] = cases[col].dt.strftime(analytics_store.TIMESTAMP_FORMAT)
+    cases = cases.reset_index()
+
+    case_roles = ctx.case_role_minutes.round(2).rename('total_minutes').reset_index()
+    case_steps = df.groupby(['case_id', 'user', 'role', 'activity'], observed=True).size().rename('steps').reset_index()
+
+    per_user = ctx.user_stats.groupby(level=['user', 'role'], observed=True)
+    users = per_user.sum()
+    users = pd.DataFrame({
+        'total_minutes': (users['duration'].dt.total_seconds() / 60).round(2),
+        'steps': users['occurrences'],
+        'story_points': users['story_points'],
+        'cases': per_user.apply(lambda stats: stats.index.get_level_values('case_id').nunique()),
+    }).reset_index()
+
+    stats = ctx.step_stats.groupby(level='activity', observed=True).sum()
+    activities = pd.DataFrame({
+        'steps': stats['steps'].astype(np.int64),
+        'average_minutes': (stats['duration'].dt.total_seconds() / 60 / stats['steps'].where(stats['steps'] > 0)).round(2),
+        'average_story_points': (stats['story_points'] / stats['story_point_n'].where(stats['story_point_n'] > 0)).round(2),
+        'violations': violations['activity'].value_counts().reindex(stats.index, fill_value=0),
+    }).reset_index()
+
+    nodes = pd.DataFrame({
+        'node': np.arange(len(variants.parent)),
+        'parent': variants.parent,
+        'activity': [variants.activities[label] if label >= 0 else None for label in variants.label],
+        'depth': variants.depth,
+        'count': variants.count,
+        'ends': variants.ends,
+        'pre': variants.pre,
+        'size': variants.size,
+    })
+    tables = {
+        'cases': cases,
+        'case_roles': case_roles,
+        'case_steps': case_steps,
+        'users': users,
+        'activities': activities,
+        'violations': violations,
+        'variants': nodes,
+    }
+    # SQLite takes plain labels, typed like the labels so numeric ids are
+    # stored (and sorted) as numbers
+    def labels(values):
+        dtype = values.cat.categories.dtype
+        return values.astype(object if values.isna().any() or dtype == object else dtype)
+
+    return {
+        name: table.assign(**{col: labels(table[col]) for col in table.columns if isinstance(table[col].dtype, pd.CategoricalDtype)})
+        for name, table in tables.items()
+    }
 
-   df = prepare_data(df)
+def save_analytics_store(ctx, store_dir):
+    # One store per fingerprint: a rerun of the same upload and rules finds
+    # its store in place; the pointer next to the reports names it either way
+    key = analytics_store.fingerprint(ctx.df, ctx.sla_rules.to_json())
+    path = analytics_store.store_path(store_dir, key)
+    if os.path.exists(path):
+        print(f"Analytics store up to date: {path}")
+    else:
+        analytics_store.write_store(path, store_tables(ctx))
+        print(f"Saved: {path}")
+    os.makedirs(ctx.output_dir, exist_ok=True)
+    with open(os.path.join(ctx.output_dir, analytics_store.POINTER_FILE), 'w') as f:
+        f.write(os.path.abspath(path))
+    return path
+
+def case_tables(df, sla_rules=None):
+    ctx = AnalyticsContext(df, sla_rules)
+    return {name: getattr(ctx, name) for name in CASE_TABLES}
+
+def sharded_case_tables(df, sla_rules, workers):
+    # The per-case tables of a log, built on `workers` processes that each take
+    # a hash partition of its cases. Every case lives in one shard, so putting
+    # the shards' rows back in case order gives exactly the single-process
+    # tables; per-user and per-activity totals are summed from them as usual.
+    shards = split_cases(df, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(case_tables, shards, [sla_rules] * len(shards)))
+    cases = pd.Index(df['case_id'].unique())
+    return {name: concat_case_tables([part[name] for part in parts], cases) for name in CASE_TABLES}
+
+def use_case_tables(ctx, tables):
+    for name, table in tables.items():
+        # cached_property looks in the instance dict first
+        ctx.__dict__[name] = table
+    limits = ctx.violations['sla_limit']
+    if limits.dtype.kind == 'f' and np.all(limits == np.round(limits)):
+        ctx.violations['sla_limit'] = limits.astype(np.int64)
+
+def use_saved_cases(ctx, state_path, workers=None):
+    # Incremental run: build the per-case tables for new and changed cases
+    # only, take the other cases' rows from the state saved on state_path by
+    # the previous run, and save the merged tables for the next one
+    hashes = case_hashes(ctx.df)
+    key = state_key(ctx.df, sla_rules=ctx.sla_rules.to_json())
+    state = load_state(state_path)
+    changed = changed_cases(state, hashes, key)
+    if len(changed) < len(hashes):
+        events = ctx.df[ctx.df['case_id'].isin(changed)]
+        fresh = sharded_case_tables(events, ctx.sla_rules, workers) if workers and workers > 1 else case_tables(events, ctx.sla_rules)
+        use_case_tables(ctx, {
+            name: merge_case_tables(state['tables'][name], fresh[name], changed, hashes.index)
+            for name in CASE_TABLES
+        })
+    elif workers and workers > 1:
+        use_case_tables(ctx, sharded_case_tables(ctx.df, ctx.sla_rules, workers))
+    save_state(state_path, key, hashes, {name: getattr(ctx, name) for name in CASE_TABLES})
+    print(f"Recomputed {len(changed)} of {len(hashes)} cases")
+
+def run_reports(df, only=None, sla_rules=None, state_path=None, output_dir=OUTPUT_DIR, workers=None, report_format='json', store_dir=None):
+    names = list(REPORTS) if not only else only
+    unknown = [name for name in names if name not in REPORTS]
+    if unknown:
+        raise ValueError(f"Unknown report(s): {', '.join(unknown)}")
+    with stage('prepare_data', rows=len(df)):
+        ctx = AnalyticsContext(prepare_data(df), sla_rules, output_dir, report_format)
+    if state_path:
+        with stage('saved_case_tables', rows=len(df)):
+            use_saved_cases(ctx, state_path, workers)
+    elif workers and workers > 1:
+        with stage('sharded_case_tables', rows=len(df)):
+            use_case_tables(ctx, sharded_case_tables(ctx.df, ctx.sla_rules, workers))
+    for name in names:
+        with stage(f'report:{name}'):
+            REPORTS[name](ctx)
+    if store_dir:
+        with stage('analytics_store', rows=len(df)):
+            save_analytics_store(ctx, store_dir)
+    return ctx
 
-   # Call all analytics functions
-   show_user_delays(df)
-   show_case_durations(df)
-   show_sla_violations(df)
-   show_common_paths(df)
-   show_step_durations(df)
-   save_cleaned_log(df)
-   show_path_tree(df)
+# --- Entry point ---
+def main():
+    parser = argparse.ArgumentParser(description='Generate workflow analytics JSON reports from the latest uploaded event log.')
+    parser.add_argument('--only', type=str, default=None, help=f"Comma-separated reports to build (default: all). Choices: {', '.join(REPORTS)}")
+    parser.add_argument('--sla_config', type=str, default=None, help='JSON file with per-activity, per-role and per-story-point SLA limits')
+    parser.add_argument('--state_path', type=str, default=None, help='Reuse and update per-case state saved here, recomputing only new or changed cases')
+    parser.add_argument('--output_dir', type=str, default=OUTPUT_DIR, help='Directory for the report files')
+    parser.add_argument('--workers', type=int, default=None, help='Build the per-case tables on this many processes, each taking a share of the cases')
+    parser.add_argument('--report_format', type=str, choices=FORMATS, default='json', help="'json': indented documents; 'compact': no whitespace; 'pages': also split case_durations, sla_violations and case_paths into JSON pages with an index")
+    parser.add_argument('--store_dir', type=str, default=None, help='Also save the per-case, per-user, per-activity and variant tables to a queryable SQLite store in this directory')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    only = [name.strip() for name in args.only.split(',') if name.strip()] if args.only else None
+    unknown = [name for name in only or [] if name not in REPORTS]
+    if unknown:
+        parser.error(f"Unknown report(s): {', '.join(unknown)}")
+
+    print("Enterprise Workflow Optimizer (Full Mode)")
+    with open('uploads/latest.txt', 'r') as file:
+        content = file.read().strip()
+        path = content
+        print(content)
+
+    if not os.path.exists(path):
+        print(f"File not found: {path}")
+        return
+
+    instrument.start_from_args(args)
+    with stage('load_log'):
+        df = load_log(path)
+    if df is None:
+        return
+
+    run_reports(df, only, load_sla_rules(args.sla_config), args.state_path, args.output_dir, args.workers, args.report_format, args.store_dir)
+    instrument.finish(os.path.join(args.output_dir, 'timings.json'))
 
 if __name__ == "__main__":
-   main()
+    main()
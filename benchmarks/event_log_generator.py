@@ -0,0 +1,158 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_backend.sla import SLA_LIMITS
+
+ROLES = ['Scrum Master', 'Developer', 'QA', 'Support']
+# Role that usually performs each activity; activities whose role is not in
+# the configured roles go to a random one
+ACTIVITY_ROLES = {
+    'Created': 'Scrum Master',
+    'Assigned': 'Scrum Master',
+    'In Progress': 'Developer',
+    'Waiting for Customer': 'Support',
+    'Code Review': 'Developer',
+    'QA Review': 'QA',
+    'Resolved': 'Developer',
+    'Closed': 'Support',
+    'Reopened': 'Support',
+}
+# Activity -> {next activity: probability}; Closed ends a case. The rework
+# edges (back to In Progress, or Reopened) are scaled by `rework`.
+TRANSITIONS = {
+    'Created': {'Assigned': 0.9, 'Closed': 0.1},
+    'Assigned': {'In Progress': 0.9, 'Waiting for Customer': 0.1},
+    'In Progress': {'Code Review': 0.6, 'Waiting for Customer': 0.15, 'Resolved': 0.25},
+    'Waiting for Customer': {'In Progress': 0.8, 'Closed': 0.2},
+    'Code Review': {'QA Review': 1.0},
+    'QA Review': {'Resolved': 1.0},
+    'Resolved': {'Closed': 1.0},
+    'Reopened': {'In Progress': 1.0},
+    'Closed': {},
+}
+REWORK_EDGES = {'Code Review': 'In Progress', 'QA Review': 'In Progress', 'Resolved': 'Reopened'}
+STORY_POINTS = [1, 2, 3, 5, 8, 13]
+# Steps take SLA limit x this on average, so roughly a quarter breach it
+DURATION_FACTOR = 0.7
+MAX_STEPS = 40
+
+def transition_matrix(rework=0.15):
+    # Cumulative next-activity probabilities, one row per activity of SLA_LIMITS
+    activities = list(SLA_LIMITS)
+    matrix = np.zeros((len(activities), len(activities)))
+    for activity, nexts in TRANSITIONS.items():
+        row = dict(nexts)
+        if activity in REWORK_EDGES:
+            row = {name: p * (1 - rework) for name, p in row.items()}
+            row[REWORK_EDGES[activity]] = row.get(REWORK_EDGES[activity], 0) + rework
+        for name, p in row.items():
+            matrix[activities.index(activity), activities.index(name)] = p
+    cumulative = np.cumsum(matrix, axis=1)
+    # Exactly 1 at the end of every row, so a draw below 1 always lands
+    totals = cumulative[:, -1:]
+    return activities, np.divide(cumulative, totals, out=cumulative, where=totals > 0)
+
+def simulate_paths(n_cases, rework, rng):
+    # Walk every case through the transition matrix at once; returns the case
+    # and activity code of each event, ordered by case then step
+    activities, cumulative = transition_matrix(rework)
+    closed = activities.index('Closed')
+    current = np.full(n_cases, activities.index('Created'))
+    active = np.arange(n_cases)
+    cases, codes, steps = [active], [current], [np.zeros(n_cases, dtype=np.int64)]
+    for step in range(1, MAX_STEPS):
+        running = current != closed
+        active = active[running]
+        if not len(active):
+            break
+        rows = cumulative[current[running]]
+        current = (rng.random(len(active))[:, None] >= rows).sum(axis=1)
+        if step == MAX_STEPS - 1:
+            current[:] = closed
+        cases.append(active)
+        codes.append(current)
+        steps.append(np.full(len(active), step))
+    cases, codes, steps = (np.concatenate(parts) for parts in (cases, codes, steps))
+    order = np.lexsort((steps, cases))
+    return activities, cases[order], codes[order]
+
+def generate_event_log(n_events, n_cases=None, n_users=40, roles=ROLES, rework=0.15, missing_story_points=0.05, seed=42):
+    # Synthetic Jira event log in the upload CSV's columns, sorted by time.
+    # Without n_cases, cases are added until there are n_events events and the
+    # last one is cut off there, like a case still in flight.
+    rng = np.random.default_rng(seed)
+    if n_cases is None:
+        n_cases = max(1, n_events // 4)
+        activities, cases, codes = simulate_paths(n_cases, rework, rng)
+        while len(cases) < n_events:
+            n_cases *= 2
+            activities, cases, codes = simulate_paths(n_cases, rework, rng)
+        cases, codes = cases[:n_events], codes[:n_events]
+    else:
+        activities, cases, codes = simulate_paths(n_cases, rework, rng)
+    n_cases = int(cases.max()) + 1 if len(cases) else 0
+
+    # Users belong to one role each; a step is done by a user of its role
+    roles = list(roles)
+    user_roles = np.arange(n_users) % len(roles)
+    user_names = np.array([f"{roles[r].replace(' ', '_')}_{i:03d}" for i, r in enumerate(user_roles)], dtype=object)
+    activity_role = np.array([
+        roles.index(ACTIVITY_ROLES[a]) if ACTIVITY_ROLES.get(a) in roles else rng.integers(len(roles))
+        for a in activities
+    ])
+    role_codes = activity_role[codes]
+    users = np.empty(len(codes), dtype=np.int64)
+    for r in range(len(roles)):
+        members = np.flatnonzero(user_roles == r)
+        if not len(members):
+            members = np.arange(n_users)
+        at = np.flatnonzero(role_codes == r)
+        users[at] = members[rng.integers(len(members), size=len(at))]
+
+    # Each step takes an exponential time around its activity's SLA limit
+    limits = np.array([SLA_LIMITS[a] for a in activities], dtype=float)
+    minutes = rng.exponential(limits[codes] * DURATION_FACTOR)
+    first = np.r_[True, cases[1:] != cases[:-1]]
+    minutes[first] = 0
+    elapsed = np.cumsum(minutes)
+    elapsed -= np.maximum.accumulate(np.where(first, elapsed, 0))
+    start = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.uniform(0, 365 * 24 * 60, n_cases), unit='m')
+    timestamps = (start[cases] + pd.to_timedelta(elapsed, unit='m')).floor('min')
+
+    points = rng.choice(STORY_POINTS, n_cases).astype(float)
+    points[rng.random(n_cases) < missing_story_points] = np.nan
+    width = max(5, len(str(n_cases)))
+    case_ids = np.array([f'TKT{i:0{width}d}' for i in range(n_cases)], dtype=object)
+    df = pd.DataFrame({
+        'case_id': case_ids[cases],
+        'timestamp': timestamps,
+        'activity': np.asarray(activities, dtype=object)[codes],
+        'user': user_names[users],
+        'role': np.asarray(roles, dtype=object)[role_codes],
+        'story_points': points[cases],
+    })
+    return df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a seeded synthetic Jira event log CSV.')
+    parser.add_argument('--events', type=int, default=100000, help='Number of events (ignored with --cases)')
+    parser.add_argument('--cases', type=int, default=None, help='Number of cases to simulate to completion')
+    parser.add_argument('--users', type=int, default=40, help='Number of users, spread over the roles')
+    parser.add_argument('--roles', type=str, default=','.join(ROLES), help='Comma-separated roles')
+    parser.add_argument('--rework', type=float, default=0.15, help='Probability of each rework transition')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--output', type=str, default='synthetic_events.csv', help='CSV to write')
+    args = parser.parse_args()
+
+    roles = [role.strip() for role in args.roles.split(',') if role.strip()]
+    df = generate_event_log(args.events, args.cases, args.users, roles, args.rework, seed=args.seed)
+    df.to_csv(args.output, index=False)
+    print(f"Saved: {args.output} ({len(df)} events, {df['case_id'].nunique()} cases)")
+
+if __name__ == '__main__':
+    main()
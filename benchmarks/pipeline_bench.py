@@ -0,0 +1,203 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+import app
+from benchmarks.event_log_generator import generate_event_log
+from ml_backend import event_log
+from ml_backend.aggregate_event_log import aggregate_event_log
+from ml_backend.event_log import load_events
+from ml_backend.heuristic_recommend import heuristic_recommend
+from ml_backend.predict import predict
+from ml_backend.process_insights import process_insights
+from ml_backend.train_model import train
+from ml_backend.instrument import max_rss_mb
+
+# Stage name -> (inputs it needs, function of those inputs). Each run gets its
+# own forked process, so stages do not share cached intermediates and the
+# process's peak RSS is the stage's own.
+STAGES = {
+    'load_log': (['csv_path'], lambda csv_path: app.load_log(csv_path)),
+    **{
+        f'show_{name}' if name != 'cleaned_log' else 'save_cleaned_log': (
+            ['prepared', 'output_dir'],
+            lambda prepared, output_dir, name=name: app.REPORTS[name](app.AnalyticsContext(prepared, output_dir=output_dir)),
+        )
+        for name in app.REPORTS
+    },
+    'aggregate_event_log': (['events'], lambda events: aggregate_event_log(events)),
+    'heuristic_recommend': (['agg'], lambda agg: heuristic_recommend(agg)),
+    'process_insights': (['agg', 'events'], lambda agg, events: process_insights(agg, event_log=events)),
+    'train': (['labeled'], lambda labeled: train(labeled, 'random_forest')),
+    'predict': (['labeled', 'bundle'], lambda labeled, bundle: predict(labeled, bundle)),
+}
+
+# Input name -> (inputs it is built from, builder)
+INPUTS = {
+    'prepared': (['csv_path'], lambda csv_path: app.prepare_data(app.load_log(csv_path))),
+    'events': (['csv_path'], lambda csv_path: load_events(csv_path)),
+    'agg': (['events'], lambda events: aggregate_event_log(events.copy())),
+    # Heuristic recommendations as training labels
+    'labeled': (['agg'], lambda agg: heuristic_recommend(agg.copy()).drop(columns=['recommendation_text'])
+                .rename(columns={'heuristic_recommendation': 'recommendation_label'})),
+    'bundle': (['labeled'], lambda labeled: train(labeled, 'random_forest')[0]),
+}
+
+def _measure(fn, conn):
+    # A forked child starts with its parent's current RSS as its peak, so the
+    # growth of the peak is what the stage itself allocated
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        start_rss = max_rss_mb()
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        peak = max_rss_mb()
+        conn.send({'seconds': seconds, 'peak_rss_mb': peak, 'stage_rss_mb': peak - start_rss})
+    except Exception as e:
+        conn.send({'error': f'{type(e).__name__}: {e}'})
+
+def measure(fn):
+    ctx = multiprocessing.get_context('fork')
+    parent, child = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_measure, args=(fn, child))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = {'error': f'stage process exited with code {process.exitcode}'}
+    process.join()
+    return result
+
+class Inputs:
+    # Stage inputs for one log size, built once on first use
+    def __init__(self, csv_path, output_dir):
+        self.values = {'csv_path': csv_path, 'output_dir': output_dir}
+
+    def get(self, name):
+        if name not in self.values:
+            needs, build = INPUTS[name]
+            self.values[name] = build(*(self.get(need) for need in needs))
+        return self.values[name]
+
+def run_size(n_events, stages, repeat, seed, workdir):
+    events = generate_event_log(n_events, seed=seed)
+    csv_path = os.path.join(workdir, f'events_{n_events}.csv')
+    events.to_csv(csv_path, index=False)
+    n_cases = events['case_id'].nunique()
+    del events
+    inputs = Inputs(csv_path, os.path.join(workdir, 'output'))
+
+    rows = []
+    for stage in stages:
+        needs, fn = STAGES[stage]
+        args = [inputs.get(need) for need in needs]
+        runs = [measure(lambda: fn(*args)) for _ in range(repeat)]
+        failed = [run for run in runs if 'error' in run]
+        row = {'events': n_events, 'cases': n_cases, 'stage': stage}
+        if failed:
+            row['error'] = failed[0]['error']
+        else:
+            # Best time of the repeats; the memory figures of the largest run
+            row['seconds'] = round(min(run['seconds'] for run in runs), 4)
+            row['peak_rss_mb'] = round(max(run['peak_rss_mb'] for run in runs), 1)
+            row['stage_rss_mb'] = round(max(run['stage_rss_mb'] for run in runs), 1)
+        rows.append(row)
+        if 'error' in row:
+            print(f"{n_events:>10} events  {stage:<22} FAILED: {row['error']}")
+        else:
+            print(f"{n_events:>10} events  {stage:<22} {row['seconds']:9.3f}s  {row['stage_rss_mb']:8.1f} MB")
+    os.remove(csv_path)
+    return rows
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, tolerance):
+    # Stages at least `tolerance` times slower than in the baseline results
+    before = {(row['events'], row['stage']): row for row in baseline['results'] if 'seconds' in row}
+    regressions = []
+    for row in results['results']:
+        old = before.get((row['events'], row['stage']))
+        if old is None or 'seconds' not in row or old['seconds'] <= 0:
+            continue
+        ratio = row['seconds'] / old['seconds']
+        flag = ratio >= tolerance
+        print(f"{row['events']:>10} events  {row['stage']:<22} {old['seconds']:9.3f}s -> {row['seconds']:9.3f}s  {ratio:5.2f}x{'  REGRESSION' if flag else ''}")
+        if flag:
+            regressions.append(row)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the analytics and ML stages on seeded synthetic event logs and record peak memory.')
+    parser.add_argument('--sizes', type=str, default='10000,100000,1000000', help='Comma-separated event counts (e.g. up to 10000000)')
+    parser.add_argument('--stages', type=str, default=None, help=f"Comma-separated stages (default: all). Choices: {', '.join(STAGES)}")
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per stage and size (best time is kept)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the synthetic logs')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='JSON file for the results')
+    parser.add_argument('--compare', type=str, default=None, help='Earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.2, help='With --compare, slowdown ratio reported as a regression')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    stages = [name.strip() for name in args.stages.split(',') if name.strip()] if args.stages else list(STAGES)
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(unknown)}")
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        parser.error("The benchmark runs each stage in a forked process, which this platform does not support")
+
+    # Every stage parses the CSV; the parsed-upload cache would make the first
+    # run that reads a log pay for all the later ones
+    event_log.CACHE_DIR = ''
+    rows = []
+    with tempfile.TemporaryDirectory(prefix='pipeline_bench_') as workdir:
+        for n_events in sizes:
+            rows.extend(run_size(n_events, stages, args.repeat, args.seed, workdir))
+
+    results = {
+        'commit': git_commit(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+        },
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': rows,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} stage(s) slower than {args.tolerance}x the baseline")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
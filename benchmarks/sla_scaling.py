@@ -0,0 +1,86 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_backend.sla import SLA_LIMITS, find_sla_violations
+
+ROLES = ['Scrum Master', 'Developer', 'QA', 'Support']
+
+def synthetic_events(n, seed=42):
+    # Timed events only: the shape show_sla_violations receives after prepare_data
+    rng = np.random.default_rng(seed)
+    activities = list(SLA_LIMITS)
+    minutes = rng.exponential(120, n).round(1)
+    return pd.DataFrame({
+        'case_id': np.char.add('TKT', (np.arange(n) // 8).astype(str)),
+        'activity': pd.Categorical(rng.choice(activities, n)),
+        'user': pd.Categorical(rng.choice([f'user_{i}' for i in range(40)], n)),
+        'role': pd.Categorical(rng.choice(ROLES, n)),
+        'story_points': rng.choice([1, 2, 3, 5, 8, 13], n),
+        'duration': pd.to_timedelta(minutes, unit='m'),
+        'duration_minutes': minutes,
+    })
+
+def legacy_violations(df):
+    # The per-row loop show_sla_violations used before the vectorized engine
+    violations = []
+    for _, row in df.iterrows():
+        activity = row['activity']
+        mins = row['duration_minutes']
+        limit = SLA_LIMITS.get(activity)
+        if limit and mins > limit:
+            violations.append({
+                "case_id": row['case_id'],
+                "activity": activity,
+                "user": row['user'],
+                "role": row['role'],
+                "duration_minutes": round(mins),
+                "sla_limit": limit,
+                "story_points": row['story_points']
+            })
+    return violations
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def scaling_exponent(sizes, timings):
+    # Slope of log(time) against log(n): 1.0 is linear, 2.0 quadratic
+    return np.polyfit(np.log(sizes), np.log(timings), 1)[0]
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare SLA violation detection: vectorized engine vs the legacy iterrows loop.')
+    parser.add_argument('--sizes', type=str, default='10000,20000,40000,80000,160000,1000000', help='Comma-separated event counts')
+    parser.add_argument('--legacy_max', type=int, default=160000, help='Largest size to run the legacy loop on')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions per size (best is kept)')
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    rows = []
+    for n in sizes:
+        df = synthetic_events(n)
+        engine = best_of(lambda: find_sla_violations(df), args.repeat)
+        legacy = best_of(lambda: legacy_violations(df), 1) if n <= args.legacy_max else None
+        if legacy is not None:
+            assert len(legacy_violations(df)) == len(find_sla_violations(df))
+        rows.append((n, engine, legacy))
+        legacy_text = f"{legacy:9.3f}s  {legacy / engine:7.1f}x" if legacy is not None else f"{'-':>10}  {'-':>8}"
+        print(f"{n:>9} events  engine {engine:8.4f}s ({engine / n * 1e9:7.1f} ns/event)  legacy {legacy_text}")
+
+    engine_sizes = [n for n, _, _ in rows]
+    print(f"engine scaling exponent: {scaling_exponent(engine_sizes, [e for _, e, _ in rows]):.2f}")
+    legacy_rows = [(n, legacy) for n, _, legacy in rows if legacy is not None]
+    if len(legacy_rows) > 1:
+        print(f"legacy scaling exponent: {scaling_exponent(*zip(*legacy_rows)):.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Command name -> (script, arguments, stdin). Each one does a real run on a
+# small generated log, as the Node routes would for a small upload, so the
+# time is that of the command's first useful output: imports plus the work.
+# The arguments name the inputs made by make_inputs and {out}, a fresh
+# directory for the run's own files; runs start in the inputs directory.
+COMMANDS = {
+    'app': ('app.py', ['--output_dir', '{out}'], None),
+    'aggregate_event_log': ('ml_backend/aggregate_event_log.py', ['--csv_path', '{log}', '--output_path', '{out}/agg.csv'], None),
+    'heuristic_recommend': ('ml_backend/heuristic_recommend.py', ['--agg_csv', '{agg}', '--output_csv', '{out}/rec.csv'], None),
+    'process_insights': ('ml_backend/process_insights.py', ['--agg_csv', '{agg}', '--event_log', '{log}', '--output_txt', '{out}/insights.txt'], None),
+    'train_model': ('ml_backend/train_model.py', ['--csv_path', '{labeled}', '--model_path', '{out}/model.joblib', '--n_jobs', '1'], None),
+    'predict': ('ml_backend/predict.py', ['--csv_path', '{agg}', '--model_path', '{model}'], None),
+    'ml_recommend_model': ('ml_backend/ml_recommend_model.py', ['--agg_csv', '{agg}', '--model_path', '{model}', '--output_csv', '{out}/ml_rec.csv'], None),
+    'time_windows': ('ml_backend/time_windows.py', ['--event_log', '{log}', '--output', '{out}/trends.json'], None),
+    'analytics_store': ('ml_backend/analytics_store.py', ['{store}', '--limit', '10'], None),
+    'pipeline': ('ml_backend/pipeline.py', ['--event_log', '{log}', '--output_dir', '{out}'], None),
+    'batch': ('ml_backend/batch.py', ['--output_root', '{out}', '--workers', '1', '{log}'], None),
+    'worker': ('ml_backend/worker.py', ['--pool_size', '1'],
+               '{{"jsonrpc": "2.0", "id": 1, "method": "aggregate", "params": {{"csv_path": "{log}", "output_path": "{out}/agg.csv"}}}}\n'),
+    'stream_monitor': ('ml_backend/stream_monitor.py', ['--input', '{events}', '--output', '{out}/alerts.ndjson'], None),
+}
+# Packages reported when a run loads them, for spotting imports a command does
+# not need
+HEAVY_PACKAGES = ['sklearn', 'scipy', 'joblib']
+TOP_IMPORTS = 5
+DEFAULT_EVENTS = 5000
+
+def parse_importtime(stderr):
+    # `-X importtime` lines: "import time: self [us] | cumulative | package",
+    # nested imports indented under the package that pulled them in. Returns
+    # (package, self_us, cumulative_us, depth) in the order they finished.
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        package = name.strip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((package, int(self_us), int(cumulative_us), depth))
+    return imports
+
+def _run(args, cwd, stdin=None, env=None):
+    proc = subprocess.run([sys.executable, *args], cwd=cwd, input=stdin, capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f'exit code {proc.returncode}')
+    return proc
+
+def make_inputs(workdir, n_events, env):
+    # The files the commands read, made once (and not timed) with the same
+    # scripts: the log and its NDJSON feed, the aggregated and labeled CSVs, a
+    # model trained on them and an analytics store
+    import pandas as pd
+    from benchmarks.event_log_generator import generate_event_log
+
+    paths = {name: os.path.join(workdir, name) for name in ['log.csv', 'events.ndjson', 'agg.csv', 'rec.csv', 'labeled.csv', 'model.joblib']}
+    log = generate_event_log(n_events)
+    log.to_csv(paths['log.csv'], index=False)
+    pd.read_csv(paths['log.csv'], dtype=str).to_json(paths['events.ndjson'], orient='records', lines=True)
+    os.makedirs(os.path.join(workdir, 'uploads'))
+    with open(os.path.join(workdir, 'uploads', 'latest.txt'), 'w') as f:
+        f.write(paths['log.csv'])
+
+    script = lambda name: os.path.join(ROOT_DIR, 'ml_backend', name)
+    _run([script('aggregate_event_log.py'), '--csv_path', paths['log.csv'], '--output_path', paths['agg.csv']], workdir, env=env)
+    _run([script('heuristic_recommend.py'), '--agg_csv', paths['agg.csv'], '--output_csv', paths['rec.csv']], workdir, env=env)
+    # Heuristic recommendations as training labels
+    pd.read_csv(paths['rec.csv']).drop(columns=['recommendation_text']).rename(
+        columns={'heuristic_recommendation': 'recommendation_label'}).to_csv(paths['labeled.csv'], index=False)
+    _run([script('train_model.py'), '--csv_path', paths['labeled.csv'], '--model_path', paths['model.joblib'], '--n_jobs', '1'], workdir, env=env)
+    store_dir = os.path.join(workdir, 'store')
+    _run([os.path.join(ROOT_DIR, 'app.py'), '--output_dir', os.path.join(workdir, 'setup_output'), '--store_dir', store_dir], workdir, env=env)
+    return {
+        'log': paths['log.csv'], 'events': paths['events.ndjson'], 'agg': paths['agg.csv'],
+        'labeled': paths['labeled.csv'], 'model': paths['model.joblib'],
+        'store': os.path.join(store_dir, os.listdir(store_dir)[0]),
+    }
+
+def run_command(command, inputs, workdir, repeat, env):
+    # Best wall time of `repeat` runs, and the import breakdown of that run
+    script, args, stdin = command
+    best = None
+    for i in range(repeat):
+        out = os.path.join(workdir, 'runs', f'{len(os.listdir(os.path.join(workdir, "runs")))}')
+        os.makedirs(out)
+        values = {**inputs, 'out': out}
+        start = time.perf_counter()
+        try:
+            proc = _run(['-X', 'importtime', os.path.join(ROOT_DIR, script), *[arg.format(**values) for arg in args]],
+                        workdir, stdin.format(**values) if stdin else None, env)
+        except RuntimeError as e:
+            return {'error': str(e)}
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = (seconds, parse_importtime(proc.stderr))
+
+    seconds, imports = best
+    # Imports at depth 0 were made by the script itself (or by the
+    # interpreter's startup), and together cover every module loaded
+    top_level = [(name, cumulative) for name, _, cumulative, depth in imports if depth == 0]
+    packages = {name.split('.')[0] for name, *_ in imports}
+    import_seconds = sum(us for _, us in top_level) / 1e6
+    return {
+        'seconds': round(seconds, 3),
+        'import_seconds': round(import_seconds, 3),
+        'work_seconds': round(seconds - import_seconds, 3),
+        'modules': len(imports),
+        'top_imports': {name: round(us / 1e6, 3) for name, us in sorted(top_level, key=lambda item: -item[1])[:TOP_IMPORTS]},
+        'heavy': [name for name in HEAVY_PACKAGES if name in packages],
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Time how long each command takes to produce its output for a small event log, and how much of that is imports.')
+    parser.add_argument('--commands', type=str, default=None, help=f"Comma-separated commands (default: all). Choices: {', '.join(COMMANDS)}")
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per command (best time is kept)')
+    parser.add_argument('--events', type=int, default=DEFAULT_EVENTS, help='Events in the generated log each command runs on')
+    parser.add_argument('--output', type=str, default='startup_results.json', help='JSON file for the results')
+    parser.add_argument('--max_seconds', type=float, default=None, help='Exit non-zero when a command fails or takes longer than this')
+    args = parser.parse_args()
+    commands = [name.strip() for name in args.commands.split(',') if name.strip()] if args.commands else list(COMMANDS)
+    unknown = [name for name in commands if name not in COMMANDS]
+    if unknown:
+        parser.error(f"Unknown command(s): {', '.join(unknown)}")
+
+    # Caching off, so every run parses its input as a first upload would
+    env = {**os.environ, 'EVENT_CACHE_DIR': '', 'PYTHONPATH': ROOT_DIR}
+    workdir = tempfile.mkdtemp(prefix='startup_bench_')
+    rows = []
+    try:
+        sys.path.insert(0, ROOT_DIR)
+        inputs = make_inputs(workdir, args.events, env)
+        os.makedirs(os.path.join(workdir, 'runs'))
+        for name in commands:
+            row = {'command': name, **run_command(COMMANDS[name], inputs, workdir, args.repeat, env)}
+            rows.append(row)
+            if 'error' in row:
+                print(f"{name:<22} FAILED: {row['error']}")
+            else:
+                heavy = f"  loads {', '.join(row['heavy'])}" if row['heavy'] else ''
+                print(f"{name:<22} {row['seconds']:7.3f}s  imports {row['import_seconds']:6.3f}s  work {row['work_seconds']:6.3f}s  {row['modules']:5d} modules{heavy}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'commit': git_commit(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+        },
+        'repeat': args.repeat,
+        'events': args.events,
+        'results': rows,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved: {args.output}")
+
+    if args.max_seconds is not None:
+        slow = [row for row in rows if 'error' in row or row['seconds'] > args.max_seconds]
+        if slow:
+            print(f"{len(slow)} command(s) failed or took over {args.max_seconds}s")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,6 @@
 # This file marks the directory as a Python package.
+#
+# It deliberately re-exports nothing: a name like aggregate_event_log would
+# shadow the submodule of the same name, and importing the package (e.g. for
+# ml_backend.instrument) would pull in pandas. Import the stage functions from
+# their modules (see the Library API section of README.md).
@@ -1,39 +1,186 @@
 import pandas as pd
+import numpy as np
 import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
-parser = argparse.ArgumentParser(description='Aggregate Jira event log CSV into one row per case_id with engineered features.')
-parser.add_argument('--csv_path', type=str, required=True, help='Path to event log CSV file')
-parser.add_argument('--output_path', type=str, default='aggregated_data.csv', help='Path to save the aggregated CSV')
-args = parser.parse_args()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_backend.event_log import iter_case_partitions, load_events, parse_memory_budget, split_cases
+from ml_backend import instrument
+from ml_backend.instrument import stage, timings_path
+from ml_backend.incremental import case_hashes, changed_cases, load_state, merge_case_tables, save_state, state_key
 
-def aggregate_event_log(df):
+# Feature name -> activity whose occurrences it counts per case
+COUNT_ACTIVITIES = {
+    'num_reopens': 'Reopened',
+    'num_qareviews': 'QA Review',
+    'num_resolved': 'Resolved',
+    'num_closed': 'Closed',
+}
+
+def _per_case(case_codes, n_cases, codes, n_codes, weights=None):
+    # (case, code) totals in one bincount over a flattened case x code grid;
+    # rows with a missing case or code are skipped
+    valid = (case_codes >= 0) & (codes >= 0)
+    flat = case_codes[valid] * n_codes + codes[valid]
+    totals = np.bincount(flat, weights=None if weights is None else weights[valid], minlength=n_cases * n_codes)
+    return totals.reshape(n_cases, n_codes)
+
+def activity_count_features(df, case_codes, n_cases, count_activities=COUNT_ACTIVITIES):
+    activities = list(dict.fromkeys(count_activities.values()))
+    codes = pd.Index(activities).get_indexer(df['activity'])
+    counts = _per_case(case_codes, n_cases, codes, len(activities))
+    return pd.DataFrame(
+        {feature: counts[:, activities.index(activity)] for feature, activity in count_activities.items()}
+    )
+
+def role_time_share_features(df, case_codes, n_cases):
+    # Share of each case's elapsed time spent in steps done by each role; a
+    # step's duration is the time since the case's previous event, as in app.py
+    durations = df.groupby('case_id', sort=False)['timestamp'].diff().dt.total_seconds().fillna(0).to_numpy()
+    roles = pd.Categorical(df['role'])
+    by_role = _per_case(case_codes, n_cases, roles.codes.astype(np.int64), len(roles.categories), durations).astype(float)
+    total = by_role.sum(axis=1, keepdims=True)
+    shares = np.divide(by_role, total, out=np.zeros_like(by_role), where=total > 0)
+    columns = {
+        'time_share_' + '_'.join(str(role).lower().split()): shares[:, i]
+        for i, role in enumerate(roles.categories)
+    }
+    return pd.DataFrame(dict(sorted(columns.items())))
+
+def rework_features(df, case_codes, n_cases):
+    # Steps that repeat an activity the case already went through
+    repeats = df.duplicated(['case_id', 'activity']).to_numpy() & df['activity'].notna().to_numpy()
+    return pd.DataFrame({'num_rework_loops': np.bincount(case_codes[repeats & (case_codes >= 0)], minlength=n_cases)})
+
+def aggregate_event_log(df, count_activities=COUNT_ACTIVITIES, extra_features=False):
     # Parse timestamps
     df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
     # Sort for each case
     df = df.sort_values(['case_id', 'timestamp'])
     # Feature engineering per case_id
-    features = df.groupby('case_id').agg(
+    grouped = df.groupby('case_id', observed=True)
+    features = grouped.agg(
         start_time=('timestamp', 'min'),
         end_time=('timestamp', 'max'),
         total_steps=('activity', 'count'),
         unique_users=('user', 'nunique'),
         unique_roles=('role', 'nunique'),
         total_story_points=('story_points', 'max'),
-        num_reopens=('activity', lambda x: (x == 'Reopened').sum()),
-        num_qareviews=('activity', lambda x: (x == 'QA Review').sum()),
-        num_resolved=('activity', lambda x: (x == 'Resolved').sum()),
-        num_closed=('activity', lambda x: (x == 'Closed').sum()),
     ).reset_index()
+    # Per-activity counts for every listed activity in a single pass
+    case_codes = grouped.ngroup().to_numpy()
+    n_cases = len(features)
+    features = pd.concat([features, activity_count_features(df, case_codes, n_cases, count_activities)], axis=1)
     features['total_duration_hours'] = (features['end_time'] - features['start_time']).dt.total_seconds() / 3600.0
     # Drop raw times, keep only engineered features
     features = features.drop(['start_time', 'end_time'], axis=1)
+    if extra_features:
+        features = pd.concat([
+            features,
+            rework_features(df, case_codes, n_cases),
+            role_time_share_features(df, case_codes, n_cases),
+        ], axis=1)
     return features
 
+def parse_count_activities(text):
+    # "num_blocked=Blocked,num_reviews=Code Review" -> {feature: activity}
+    pairs = [item.split('=', 1) for item in text.split(',') if item.strip()]
+    if not pairs or any(len(pair) != 2 for pair in pairs):
+        raise ValueError(f"Invalid activity counts: {text}")
+    return {feature.strip(): activity.strip() for feature, activity in pairs}
+
+def align_role_shares(agg, roles=None):
+    # Role share columns last, in name order, for `roles` (default: every role
+    # seen); a role missing from some of the merged parts spent no time there
+    shares = [col for col in agg.columns if col.startswith('time_share_')]
+    if roles is not None:
+        shares = ['time_share_' + '_'.join(str(role).lower().split()) for role in roles]
+    agg = agg.reindex(columns=[col for col in agg.columns if not col.startswith('time_share_')] + sorted(shares))
+    agg[shares] = agg[shares].fillna(0.0)
+    return agg
+
+def aggregate_event_log_streaming(csv_path, memory_budget, count_activities=COUNT_ACTIVITIES, extra_features=False):
+    # Every case lives in exactly one partition, so per-partition features are
+    # final and only need concatenating back into case order
+    parts = [
+        aggregate_event_log(part, count_activities, extra_features)
+        for part in iter_case_partitions(csv_path, memory_budget)
+    ]
+    agg = pd.concat(parts).sort_values('case_id').reset_index(drop=True)
+    return align_role_shares(agg) if extra_features else agg
+
+def aggregate_event_log_sharded(df, workers, count_activities=COUNT_ACTIVITIES, extra_features=False):
+    # Hash-partition the cases across `workers` processes; as with streaming,
+    # every case's features come from one shard and are final
+    shards = split_cases(df, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(
+            aggregate_event_log, shards,
+            [count_activities] * len(shards), [extra_features] * len(shards),
+        ))
+    agg = pd.concat(parts).sort_values('case_id').reset_index(drop=True)
+    return align_role_shares(agg, pd.Categorical(df['role']).categories) if extra_features else agg
+
+def aggregate_event_log_incremental(df, state_path, count_activities=COUNT_ACTIVITIES, extra_features=False, workers=None):
+    # Features of new and changed cases only; the rest come from the state
+    # saved by the previous run on state_path, which is then updated
+    def aggregate(events):
+        if workers and workers > 1:
+            return aggregate_event_log_sharded(events, workers, count_activities, extra_features)
+        return aggregate_event_log(events, count_activities, extra_features)
+
+    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+    hashes = case_hashes(df)
+    key = state_key(df, count_activities=count_activities, extra_features=extra_features)
+    state = load_state(state_path)
+    changed = changed_cases(state, hashes, key)
+    if len(changed) == len(hashes):
+        agg = aggregate(df)
+    else:
+        saved = state['tables']['features']
+        fresh = aggregate(df[df['case_id'].isin(changed)].copy()) if len(changed) else saved.iloc[:0]
+        agg = merge_case_tables(saved, fresh, changed, hashes.index)
+        if extra_features:
+            agg = align_role_shares(agg, pd.Categorical(df['role']).categories)
+    save_state(state_path, key, hashes, {'features': agg})
+    print(f"Recomputed {len(changed)} of {len(hashes)} cases")
+    return agg
+
 def main():
-    df = pd.read_csv(args.csv_path)
-    agg = aggregate_event_log(df)
-    agg.to_csv(args.output_path, index=False)
+    parser = argparse.ArgumentParser(description='Aggregate Jira event log CSV into one row per case_id with engineered features.')
+    parser.add_argument('--csv_path', type=str, required=True, help='Path to event log CSV file')
+    parser.add_argument('--output_path', type=str, default='aggregated_data.csv', help='Path to save the aggregated CSV')
+    parser.add_argument('--memory_budget', type=str, default=None, help='Stream the log in case partitions that fit this budget (e.g. 512MB)')
+    parser.add_argument('--count_activities', type=str, default=None, help='Activities to count per case as feature=Activity pairs (e.g. "num_reopens=Reopened,num_blocked=Blocked")')
+    parser.add_argument('--extra_features', action='store_true', help='Also add per-role time share and rework loop features')
+    parser.add_argument('--state_path', type=str, default=None, help='Reuse and update per-case state saved here, recomputing only new or changed cases')
+    parser.add_argument('--workers', type=int, default=None, help='Aggregate on this many processes, each taking a share of the cases')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    count_activities = parse_count_activities(args.count_activities) if args.count_activities else COUNT_ACTIVITIES
+    instrument.start_from_args(args)
+
+    if args.memory_budget:
+        with stage('aggregate_event_log_streaming') as record:
+            agg = aggregate_event_log_streaming(args.csv_path, parse_memory_budget(args.memory_budget), count_activities, args.extra_features)
+            record['rows'] = len(agg)
+    else:
+        with stage('load_events') as record:
+            df = load_events(args.csv_path)
+            record['rows'] = len(df)
+        with stage('aggregate_event_log', rows=len(df)):
+            if args.state_path:
+                agg = aggregate_event_log_incremental(df, args.state_path, count_activities, args.extra_features, args.workers)
+            elif args.workers and args.workers > 1:
+                agg = aggregate_event_log_sharded(df, args.workers, count_activities, args.extra_features)
+            else:
+                agg = aggregate_event_log(df, count_activities, args.extra_features)
+    with stage('write_csv', rows=len(agg)):
+        agg.to_csv(args.output_path, index=False)
     print(f"Aggregated data saved to {args.output_path}")
+    instrument.finish(timings_path(args.output_path))
 
 if __name__ == '__main__':
     main()
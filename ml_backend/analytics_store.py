@@ -0,0 +1,181 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from contextlib import closing
+
+# Queryable cache of one analytics run. app.py --store_dir fills a SQLite file
+# named after the upload's fingerprint (its events and SLA rules) with the
+# per-case, per-user, per-activity and variant tables the reports are built
+# from. Filtering cases by role, user, activity, SLA breach, date range or
+# path prefix is then an indexed query on that file instead of a rerun of
+# the pipeline. A run whose fingerprint already has a store skips the write.
+
+STORE_VERSION = 2
+# Written next to the reports; holds the path of the run's store
+POINTER_FILE = 'analytics_store.txt'
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+INDEXES = {
+    'cases': [['start'], ['end'], ['violations'], ['variant_pre']],
+    'case_roles': [['role', 'case_id']],
+    'case_steps': [['user', 'case_id'], ['activity', 'case_id']],
+    'violations': [['case_id'], ['activity'], ['role']],
+    'variants': [['parent', 'activity']],
+}
+# Columns query_cases can order by
+CASE_ORDER = ['case_id', 'start', 'end', 'events', 'total_minutes', 'violations']
+
+def fingerprint(df, sla_rules_json):
+    # pandas loads only where a frame is hashed or a date parsed, so a query
+    # from the command line runs on sqlite3 alone
+    import pandas as pd
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{STORE_VERSION}\n{sla_rules_json}\n'.encode())
+    digest.update(','.join(f'{col}:{dtype}' for col, dtype in df.dtypes.items()).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def store_path(store_dir, key):
+    return os.path.join(store_dir, f'{key}.sqlite')
+
+def write_store(path, tables):
+    # tables: name -> DataFrame; written to a temporary file that replaces
+    # path once every table and index is in place
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    with closing(sqlite3.connect(tmp_path)) as conn:
+        # A half-written file is never renamed into place, so it needs no journal
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        for name, table in tables.items():
+            table.head(0).to_sql(name, conn, index=False)
+            rows = table.astype(object).where(table.notna(), None).itertuples(index=False, name=None)
+            conn.executemany(f'INSERT INTO {name} VALUES ({", ".join("?" * len(table.columns))})', rows)
+            for columns in INDEXES.get(name, []):
+                conn.execute(f'CREATE INDEX {name}_{"_".join(columns)} ON {name} ({", ".join(columns)})')
+        conn.execute('CREATE TABLE meta (key TEXT, value TEXT)')
+        conn.execute('INSERT INTO meta VALUES (?, ?)', ('version', str(STORE_VERSION)))
+        conn.commit()
+    os.replace(tmp_path, path)
+
+def connect(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No analytics store at {path}")
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _timestamp(value):
+    import pandas as pd
+
+    return pd.Timestamp(value).strftime(TIMESTAMP_FORMAT)
+
+def _prefix_range(conn, prefix):
+    # Preorder range of the variant node for an activity prefix, or None
+    node = 0
+    for activity in prefix:
+        row = conn.execute('SELECT node FROM variants WHERE parent = ? AND activity = ?', (node, activity)).fetchone()
+        if row is None:
+            return None
+        node = row['node']
+    row = conn.execute('SELECT pre, size FROM variants WHERE node = ?', (node,)).fetchone()
+    return row['pre'], row['pre'] + row['size']
+
+def query_cases(path, role=None, user=None, activity=None, breached=None, since=None, until=None,
+                prefix=None, order_by='case_id', descending=False, limit=100, offset=0):
+    # Cases matching every given filter. since/until select cases active at
+    # some point in that range; breached=True/False keeps cases with/without
+    # SLA violations; prefix is a list of activities the path starts with.
+    if order_by not in CASE_ORDER:
+        raise ValueError(f"Cannot order cases by {order_by}; choose from {', '.join(CASE_ORDER)}")
+    where, params = [], []
+    if role is not None:
+        where.append('case_id IN (SELECT case_id FROM case_roles WHERE role = ?)')
+        params.append(role)
+    if user is not None:
+        where.append('case_id IN (SELECT case_id FROM case_steps WHERE user = ?)')
+        params.append(user)
+    if activity is not None:
+        where.append('case_id IN (SELECT case_id FROM case_steps WHERE activity = ?)')
+        params.append(activity)
+    if breached is not None:
+        where.append('violations > 0' if breached else 'violations = 0')
+    if since is not None:
+        where.append('"end" >= ?')
+        params.append(_timestamp(since))
+    if until is not None:
+        where.append('start <= ?')
+        params.append(_timestamp(until))
+    with closing(connect(path)) as conn:
+        if prefix:
+            bounds = _prefix_range(conn, prefix)
+            if bounds is None:
+                return {'total': 0, 'cases': []}
+            where.append('variant_pre >= ? AND variant_pre < ?')
+            params.extend(bounds)
+        clause = f' WHERE {" AND ".join(where)}' if where else ''
+        total = conn.execute(f'SELECT COUNT(*) FROM cases{clause}', params).fetchone()[0]
+        rows = conn.execute(
+            f'SELECT * FROM cases{clause} ORDER BY "{order_by}" {"DESC" if descending else "ASC"}, case_id LIMIT ? OFFSET ?',
+            params + [int(limit), int(offset)],
+        ).fetchall()
+    cases = []
+    for row in rows:
+        case = dict(row)
+        case['path'] = json.loads(case['path'])
+        cases.append(case)
+    return {'total': total, 'cases': cases}
+
+def query_table(path, table, **filters):
+    # Rows of the users, activities or violations table whose columns equal
+    # the given values
+    columns = {'users': ['user', 'role'], 'activities': ['activity'], 'violations': ['case_id', 'activity', 'user', 'role']}
+    if table not in columns:
+        raise ValueError(f"Unknown table {table}; choose from {', '.join(columns)}")
+    unknown = [col for col in filters if col not in columns[table]]
+    if unknown:
+        raise ValueError(f"Cannot filter {table} by {', '.join(unknown)}")
+    clause = ' AND '.join(f'"{col}" = ?' for col in filters)
+    with closing(connect(path)) as conn:
+        rows = conn.execute(f'SELECT * FROM {table}{" WHERE " + clause if clause else ""}', list(filters.values())).fetchall()
+    return [dict(row) for row in rows]
+
+def read_pointer(output_dir):
+    with open(os.path.join(output_dir, POINTER_FILE)) as f:
+        return f.read().strip()
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the cases of an analytics store written by app.py --store_dir.')
+    parser.add_argument('store', type=str, help='Store file, or a report directory holding analytics_store.txt')
+    parser.add_argument('--role', type=str, default=None, help='Cases with a step done by this role')
+    parser.add_argument('--user', type=str, default=None, help='Cases with a step done by this user')
+    parser.add_argument('--activity', type=str, default=None, help='Cases that went through this activity')
+    parser.add_argument('--breached', choices=['yes', 'no'], default=None, help='Cases with (yes) or without (no) SLA violations')
+    parser.add_argument('--since', type=str, default=None, help='Cases still open at or after this time')
+    parser.add_argument('--until', type=str, default=None, help='Cases started at or before this time')
+    parser.add_argument('--prefix', type=str, default=None, help='Comma-separated activities the path starts with')
+    parser.add_argument('--order_by', type=str, choices=CASE_ORDER, default='case_id')
+    parser.add_argument('--descending', action='store_true')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--offset', type=int, default=0)
+    args = parser.parse_args()
+
+    path = read_pointer(args.store) if os.path.isdir(args.store) else args.store
+    breached = None if args.breached is None else args.breached == 'yes'
+    prefix = [name.strip() for name in args.prefix.split(',') if name.strip()] if args.prefix else None
+    try:
+        result = query_cases(path, args.role, args.user, args.activity, breached, args.since, args.until,
+                             prefix, args.order_by, args.descending, args.limit, args.offset)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+ML_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(ML_BACKEND_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import app
+from ml_backend.aggregate_event_log import aggregate_event_log
+from ml_backend.event_log import load_events
+from ml_backend.heuristic_recommend import heuristic_recommend, load_rules
+from ml_backend.process_insights import process_insights
+from ml_backend.report_writer import FORMATS
+from ml_backend.sla import load_sla_rules
+
+# Batch analytics for many uploaded logs: every log runs the full pipeline
+# (aggregation, recommendations, insights and the app.py reports) in its own
+# output directory, across a pool of processes.
+
+LOG_EXTENSIONS = ('.csv',)
+
+def find_logs(paths):
+    # Files as given; a directory contributes its CSV files in name order
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.lower().endswith(LOG_EXTENSIONS))
+            logs.extend(os.path.join(path, name) for name in names)
+        else:
+            logs.append(path)
+    return logs
+
+def output_dirs(logs, output_root):
+    # One directory per log, named after the file; repeated names get a suffix
+    seen = Counter()
+    dirs = []
+    for log in logs:
+        name = os.path.splitext(os.path.basename(log))[0]
+        seen[name] += 1
+        dirs.append(os.path.join(output_root, name if seen[name] == 1 else f'{name}-{seen[name]}'))
+    return dirs
+
+def run_log(csv_path, output_dir, only=None, sla_config=None, rules_config=None, report_format='json'):
+    # The upload route's pipeline for one log, writing only under output_dir
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    # Parsed once for every stage; the reports need valid timestamps, so bad
+    # ones fail the log here as app.load_log would
+    events = load_events(csv_path, errors='raise')
+    agg = aggregate_event_log(events.copy())
+    agg.to_csv(os.path.join(output_dir, 'aggregated_data.csv'), index=False)
+
+    rules, default = load_rules(rules_config) if rules_config else (None, None)
+    heuristic_recommend(agg.copy(), rules, default).to_csv(os.path.join(output_dir, 'heuristic_recommendations.csv'), index=False)
+
+    with open(os.path.join(output_dir, 'process_insights.txt'), 'w') as f:
+        for line in process_insights(agg, event_log=events):
+            f.write(line + '\n')
+
+    app.run_reports(app.prepare_log(events), only, load_sla_rules(sla_config), output_dir=output_dir, report_format=report_format)
+    return {'cases': len(agg), 'events': len(events), 'seconds': round(time.perf_counter() - start, 3)}
+
+def _quiet():
+    # Per-report "Saved: ..." lines from many processes would interleave
+    sys.stdout = open(os.devnull, 'w')
+
+def run_batch(logs, output_root, workers=None, only=None, sla_config=None, rules_config=None, report_format='json'):
+    dirs = output_dirs(logs, output_root)
+    results = [None] * len(logs)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_quiet) as pool:
+        futures = {
+            pool.submit(run_log, log, output_dir, only, sla_config, rules_config, report_format): i
+            for i, (log, output_dir) in enumerate(zip(logs, dirs))
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            log, output_dir = logs[i], dirs[i]
+            result = {'log': log, 'output_dir': output_dir}
+            try:
+                result.update(future.result())
+                print(f"Done: {log} -> {output_dir} ({result['cases']} cases, {result['seconds']:.1f}s)")
+            except Exception as e:
+                result['error'] = str(e)
+                print(f"Failed: {log}: {e}")
+            results[i] = result
+    elapsed = time.perf_counter() - start
+    succeeded = sum('error' not in result for result in results)
+    return {
+        'logs': len(logs),
+        'succeeded': succeeded,
+        'failed': len(logs) - succeeded,
+        'workers': workers or os.cpu_count(),
+        'seconds': round(elapsed, 3),
+        'logs_per_minute': round(succeeded / elapsed * 60, 2) if elapsed > 0 else None,
+        'results': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Run aggregation, recommendations, insights and analytics reports for many event logs in parallel.')
+    parser.add_argument('inputs', nargs='+', help='Event log CSV files and/or directories of them')
+    parser.add_argument('--output_root', type=str, default=os.path.join('output', 'batch'), help='Each log gets a subdirectory here')
+    parser.add_argument('--workers', type=int, default=None, help='Logs processed at once (default: CPU count)')
+    parser.add_argument('--only', type=str, default=None, help=f"Comma-separated reports to build (default: all). Choices: {', '.join(app.REPORTS)}")
+    parser.add_argument('--sla_config', type=str, default=None, help='JSON file with per-activity, per-role and per-story-point SLA limits')
+    parser.add_argument('--rules_config', type=str, default=None, help='JSON file with recommendation rules')
+    parser.add_argument('--report_format', type=str, choices=FORMATS, default='json', help="Report file format (see app.py --report_format)")
+    args = parser.parse_args()
+    only = [name.strip() for name in args.only.split(',') if name.strip()] if args.only else None
+    unknown = [name for name in only or [] if name not in app.REPORTS]
+    if unknown:
+        parser.error(f"Unknown report(s): {', '.join(unknown)}")
+
+    logs = find_logs(args.inputs)
+    if not logs:
+        parser.error("No event logs found")
+    summary = run_batch(logs, args.output_root, args.workers, only, args.sla_config, args.rules_config, args.report_format)
+    os.makedirs(args.output_root, exist_ok=True)
+    summary_path = os.path.join(args.output_root, 'batch_summary.json')
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"{summary['succeeded']}/{summary['logs']} logs in {summary['seconds']:.1f}s "
+          f"({summary['logs_per_minute']} logs/min, {summary['workers']} workers)")
+    print(f"Summary saved to {summary_path}")
+
+if __name__ == '__main__':
+    main()
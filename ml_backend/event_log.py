@@ -0,0 +1,275 @@
+import hashlib
+import math
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:  # the columnar cache is optional
+    pa = None
+    feather = None
+
+# Explicit dtypes for the event-log columns; anything else is left to inference.
+# Label columns are dictionary-encoded: integer codes into one sorted
+# vocabulary per column, so code order is label order and grouping works on
+# the codes. Labels are only materialized when a report or CSV is written.
+# A column whose labels are all numbers (e.g. integer ticket ids) keeps them
+# as numbers, in numeric order, as read_csv would have inferred them.
+CATEGORY_COLUMNS = ['case_id', 'activity', 'user', 'role']
+
+DEFAULT_CHUNKSIZE = 200000
+# A partition's working set (sort, groupby, copies) relative to its raw frame
+WORKING_SET_FACTOR = 4
+SAMPLE_ROWS = 5000
+
+# Typed columnar artifacts of parsed uploads, keyed by content hash; set
+# EVENT_CACHE_DIR to an empty string to disable. Bump CACHE_VERSION when the
+# parsed representation changes, so older artifacts are not read back.
+CACHE_VERSION = 3
+CACHE_DIR = os.environ.get('EVENT_CACHE_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache'))
+
+# Limits on the cache directory (parsed uploads, per-user state, analytics
+# stores, training features), enforced by evict_cache: files unused for longer
+# than EVENT_CACHE_MAX_AGE_DAYS go first, then the least recently used until
+# the directory fits in EVENT_CACHE_MAX_SIZE.
+CACHE_MAX_SIZE = os.environ.get('EVENT_CACHE_MAX_SIZE', '2GB')
+CACHE_MAX_AGE_DAYS = float(os.environ.get('EVENT_CACHE_MAX_AGE_DAYS', 30))
+
+_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+def parse_memory_budget(text):
+    # "512MB", "2GB", "1048576" -> bytes
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*', str(text).upper())
+    if not match:
+        raise ValueError(f"Invalid memory budget: {text}")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+def _read_options(path):
+    header = pd.read_csv(path, nrows=0).columns
+    names = [col.lower().strip() for col in header]
+    dtype = {}
+    for original, name in zip(header, names):
+        if name in CATEGORY_COLUMNS:
+            dtype[original] = 'category'
+        elif name == 'story_points':
+            dtype[original] = 'float64'
+    return names, dtype
+
+def read_event_chunks(path, chunksize=DEFAULT_CHUNKSIZE, errors='coerce'):
+    names, dtype = _read_options(path)
+    for chunk in pd.read_csv(path, dtype=dtype, chunksize=chunksize):
+        chunk.columns = names
+        if 'timestamp' in chunk.columns:
+            chunk['timestamp'] = pd.to_datetime(chunk['timestamp'], errors=errors)
+        yield chunk
+
+def _integral(values):
+    # Would read_csv have inferred an integer column for these values?
+    return not values.isna().any() and bool((values == np.round(values)).all())
+
+def numeric_categories(categories):
+    # The labels as numbers (int64 when all integral) if every one parses as
+    # a number and no two parse to the same one; None otherwise
+    if len(categories) == 0:
+        return None
+    numbers = pd.to_numeric(pd.Series(np.asarray(categories, dtype=object)), errors='coerce')
+    if numbers.isna().any():
+        return None
+    if _integral(numbers):
+        numbers = numbers.astype('int64')
+    if numbers.duplicated().any():
+        return None
+    return pd.Index(numbers)
+
+def decode_numeric_labels(df, columns=None):
+    # Turn string categories that are all numbers back into numeric ones in
+    # numeric order (1, 2, 10 rather than 1, 10, 2). columns: the columns to
+    # convert, decided over the whole log; by default, those of this frame
+    # whose labels are all numeric.
+    for col in CATEGORY_COLUMNS if columns is None else columns:
+        if col not in df.columns or not isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        numbers = numeric_categories(df[col].cat.categories)
+        if numbers is not None:
+            df[col] = df[col].cat.rename_categories(numbers).cat.reorder_categories(numbers.sort_values())
+    return df
+
+def compact_integers(values):
+    # Integral values in the smallest signed integer dtype that holds them
+    # (story points fit int8)
+    return pd.to_numeric(values.astype('int64'), downcast='signed')
+
+def concat_events(pieces, integral_story_points=False, numeric_columns=None):
+    # Concatenate chunks, unifying the per-chunk category vocabularies;
+    # numeric_columns as in decode_numeric_labels
+    pieces = [piece for piece in pieces if len(piece)]
+    if not pieces:
+        return pd.DataFrame()
+    df = pd.concat(pieces, ignore_index=True)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = union_categoricals([piece[col] for piece in pieces], sort_categories=True)
+    if integral_story_points and 'story_points' in df.columns:
+        df['story_points'] = compact_integers(df['story_points'])
+    return decode_numeric_labels(df, numeric_columns)
+
+def read_events(path, chunksize=DEFAULT_CHUNKSIZE, errors='coerce'):
+    # Whole log in memory, read chunk-wise with explicit dtypes
+    chunks = list(read_event_chunks(path, chunksize, errors))
+    integral = all(_integral(chunk['story_points']) for chunk in chunks if 'story_points' in chunk.columns)
+    return concat_events(chunks, integral)
+
+_content_hashes = {}
+
+def content_hash(path, block_size=1 << 20):
+    # Remembered per (path, size, mtime), so stages of one run hash a file once
+    info = os.stat(path)
+    key = (os.path.abspath(path), info.st_size, info.st_mtime_ns)
+    if key not in _content_hashes:
+        if len(_content_hashes) >= 1024:
+            _content_hashes.clear()
+        _content_hashes[key] = _hash_file(path, block_size)
+    return _content_hashes[key]
+
+def _hash_file(path, block_size):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_path(path, cache_dir=None):
+    # The columnar artifact load_events keeps for this file (None when caching
+    # is off); it may not exist yet
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    if feather is None or not cache_dir:
+        return None
+    return os.path.join(cache_dir, f'{content_hash(path)}-v{CACHE_VERSION}.feather')
+
+def evict_cache(cache_dir=None, max_size=None, max_age_days=None):
+    # Delete cached files unused for max_age_days, then the least recently used
+    # ones until the rest fit in max_size. Files being written (*.tmp) only
+    # expire by age. Returns the deleted paths.
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    max_size = parse_memory_budget(CACHE_MAX_SIZE if max_size is None else max_size)
+    max_age_days = CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return []
+    files = []
+    for root, _, names in os.walk(cache_dir):
+        for name in names:
+            file_path = os.path.join(root, name)
+            try:
+                info = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            files.append((info.st_mtime, info.st_size, file_path))
+    files.sort()
+    expired = time.time() - max_age_days * 86400
+    total = sum(size for _, size, _ in files)
+    removed = []
+    for mtime, size, file_path in files:
+        if mtime >= expired and (total <= max_size or file_path.endswith('.tmp')):
+            continue
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(file_path)
+    return removed
+
+def load_events(path, errors='coerce', cache_dir=None):
+    # read_events through the columnar cache: the first run for an upload
+    # parses the CSV and writes an uncompressed Feather file (categorical
+    # case_id/activity/user/role, datetime64 timestamps); later runs and other stages
+    # memory-map that file instead of parsing again
+    artifact = cache_path(path, cache_dir)
+    if artifact is None:
+        return read_events(path, errors=errors)
+    cache_dir = os.path.dirname(artifact)
+    if os.path.exists(artifact):
+        # Mark it used, for evict_cache
+        os.utime(artifact)
+        table = feather.read_table(artifact, memory_map=True)
+        bad_timestamps = int((table.schema.metadata or {}).get(b'bad_timestamps', b'0'))
+        if errors == 'raise' and bad_timestamps:
+            raise ValueError(f"{bad_timestamps} timestamp(s) in {path} could not be parsed")
+        # split_blocks keeps each column in its own block, so the null-free
+        # datetime64 column stays a view of the mapped file; the dictionary
+        # codes and the nullable story_points column are still converted
+        return table.to_pandas(split_blocks=True)
+
+    df = read_events(path, errors=errors)
+    bad_timestamps = 0
+    if errors != 'raise' and 'timestamp' in df.columns and df['timestamp'].isna().any():
+        raw = pd.read_csv(path, usecols=lambda col: col.lower().strip() == 'timestamp').iloc[:, 0]
+        bad_timestamps = int((df['timestamp'].isna() & raw.notna()).sum())
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'bad_timestamps': str(bad_timestamps).encode()})
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{artifact}.{os.getpid()}.tmp'
+    # One record batch, so each column is a single contiguous buffer that
+    # to_pandas can wrap rather than concatenate
+    feather.write_feather(table, tmp_path, compression='uncompressed', chunksize=max(1, table.num_rows))
+    os.replace(tmp_path, artifact)
+    return df
+
+def plan_partitions(path, memory_budget):
+    # Estimate how many case partitions keep each one's working set within the
+    # budget, and a chunk size that keeps the reader within it too
+    names, dtype = _read_options(path)
+    sample = pd.read_csv(path, dtype=dtype, nrows=SAMPLE_ROWS)
+    bytes_per_row = max(1, sample.memory_usage(deep=True).sum() / max(1, len(sample)))
+    with open(path, 'rb') as f:
+        head = f.read(1 << 20)
+    line_bytes = len(head) / max(1, head.count(b'\n'))
+    est_rows = os.path.getsize(path) / line_bytes
+    n_partitions = max(1, math.ceil(est_rows * bytes_per_row * WORKING_SET_FACTOR / memory_budget))
+    chunksize = int(max(1000, min(DEFAULT_CHUNKSIZE, memory_budget // (WORKING_SET_FACTOR * bytes_per_row))))
+    return n_partitions, chunksize
+
+def iter_case_partitions(path, memory_budget, errors='coerce'):
+    # Yield the log as frames that each hold every event of a disjoint set of
+    # cases, so cases spanning chunk boundaries are reassembled before any
+    # per-case computation. Events keep their file position in '_row'.
+    n_partitions, chunksize = plan_partitions(path, memory_budget)
+    with tempfile.TemporaryDirectory(prefix='event_partitions_') as workdir:
+        files = [[] for _ in range(n_partitions)]
+        integral = True
+        # Label columns that are numeric in every chunk, so all partitions
+        # decode the same columns
+        numeric = set(CATEGORY_COLUMNS)
+        offset = 0
+        for i, chunk in enumerate(read_event_chunks(path, chunksize, errors)):
+            chunk['_row'] = np.arange(offset, offset + len(chunk))
+            offset += len(chunk)
+            if 'story_points' in chunk.columns:
+                integral = integral and _integral(chunk['story_points'])
+            numeric = {col for col in numeric if col in chunk.columns and (
+                chunk[col].isna().all() or numeric_categories(chunk[col].cat.categories) is not None)}
+            buckets = pd.util.hash_array(chunk['case_id'].to_numpy(dtype=object)) % n_partitions
+            for p, piece in chunk.groupby(buckets):
+                piece_path = os.path.join(workdir, f'part-{p:05d}-{i:06d}.pkl')
+                piece.to_pickle(piece_path)
+                files[p].append(piece_path)
+        for piece_paths in files:
+            if piece_paths:
+                yield concat_events([pd.read_pickle(piece_path) for piece_path in piece_paths], integral, sorted(numeric))
+
+def split_cases(df, n_shards):
+    # Hash-partition an in-memory log by case_id into n_shards frames, each
+    # holding every event of its cases (rows without a case_id together) in
+    # their original order. Each distinct case is hashed once.
+    codes, cases = pd.factorize(df['case_id'], use_na_sentinel=False)
+    shard = (pd.util.hash_array(np.asarray(cases, dtype=object)) % n_shards)[codes]
+    order = np.argsort(shard, kind='stable')
+    bounds = np.searchsorted(shard[order], np.arange(1, n_shards))
+    return [df.iloc[rows] for rows in np.split(order, bounds) if len(rows)]
@@ -1,47 +1,107 @@
 import pandas as pd
+import numpy as np
 import argparse
+import json
+import operator
 import os
+import sys
 
-def heuristic_recommend(df):
-    recs = []
-    rec_texts = []
-    for _, row in df.iterrows():
-        reasons = []
-        texts = []
-        if row.get('total_duration_hours', 0) > 24:
-            reasons.append('Long cycle time')
-            texts.append('This ticket took significantly longer than average to complete. Consider investigating process delays.')
-        if row.get('num_reopens', 0) > 1:
-            reasons.append('Multiple reopens')
-            texts.append('This ticket was reopened multiple times, suggesting recurring issues or incomplete resolutions.')
-        if row.get('total_steps', 0) > 8:
-            reasons.append('Too many steps')
-            texts.append('This ticket required an unusually high number of workflow steps, which may indicate process complexity.')
-        if row.get('unique_users', 0) > 4:
-            reasons.append('Too many users involved')
-            texts.append('This ticket involved many different users, which could slow down progress or cause miscommunication.')
-        if row.get('num_qareviews', 0) == 0:
-            reasons.append('No QA review')
-            texts.append('This ticket did not go through a QA review, which may impact quality assurance.')
-        if not reasons:
-            reasons.append('No major bottleneck detected')
-            texts.append('No major bottlenecks or issues detected for this ticket.')
-        recs.append('; '.join(reasons))
-        rec_texts.append(' '.join(texts))
-    df['heuristic_recommendation'] = recs
-    df['recommendation_text'] = rec_texts
-    return df
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_backend import instrument
+from ml_backend.instrument import stage, timings_path
+
+COMPARISONS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# Evaluated in order; a case gets the reason and text of every rule it matches.
+# A column missing from the input compares as 0.
+RULES = [
+    {'column': 'total_duration_hours', 'op': '>', 'threshold': 24, 'reason': 'Long cycle time',
+     'text': 'This ticket took significantly longer than average to complete. Consider investigating process delays.'},
+    {'column': 'num_reopens', 'op': '>', 'threshold': 1, 'reason': 'Multiple reopens',
+     'text': 'This ticket was reopened multiple times, suggesting recurring issues or incomplete resolutions.'},
+    {'column': 'total_steps', 'op': '>', 'threshold': 8, 'reason': 'Too many steps',
+     'text': 'This ticket required an unusually high number of workflow steps, which may indicate process complexity.'},
+    {'column': 'unique_users', 'op': '>', 'threshold': 4, 'reason': 'Too many users involved',
+     'text': 'This ticket involved many different users, which could slow down progress or cause miscommunication.'},
+    {'column': 'num_qareviews', 'op': '==', 'threshold': 0, 'reason': 'No QA review',
+     'text': 'This ticket did not go through a QA review, which may impact quality assurance.'},
+]
+
+# Used when no rule matches
+DEFAULT_RECOMMENDATION = {
+    'reason': 'No major bottleneck detected',
+    'text': 'No major bottlenecks or issues detected for this ticket.',
+}
+
+def load_rules(path):
+    # JSON: {"rules": [{"column", "op", "threshold", "reason", "text"}, ...],
+    #        "default": {"reason", "text"}}; either key may be omitted
+    with open(path, 'r') as f:
+        config = json.load(f)
+    rules = config.get('rules', RULES)
+    for rule in rules:
+        missing = {'column', 'op', 'threshold', 'reason', 'text'} - set(rule)
+        if missing:
+            raise ValueError(f"Rule {rule} is missing {', '.join(sorted(missing))}")
+        if rule['op'] not in COMPARISONS:
+            raise ValueError(f"Unknown comparison '{rule['op']}' in rule {rule}")
+    return rules, config.get('default', DEFAULT_RECOMMENDATION)
 
-parser = argparse.ArgumentParser(description='Generate heuristic recommendations from aggregated Jira data.')
-parser.add_argument('--agg_csv', type=str, required=True, help='Path to aggregated CSV (from aggregate_event_log.py)')
-parser.add_argument('--output_csv', type=str, default='heuristic_recommendations.csv', help='Path to save recommendations CSV')
-args = parser.parse_args()
+def rule_masks(df, rules):
+    masks = np.zeros((len(rules), len(df)), dtype=bool)
+    for i, rule in enumerate(rules):
+        values = df[rule['column']].to_numpy() if rule['column'] in df.columns else np.zeros(len(df))
+        masks[i] = COMPARISONS[rule['op']](values, rule['threshold'])
+    return masks
+
+def heuristic_recommend(df, rules=None, default=None):
+    rules = RULES if rules is None else rules
+    default = DEFAULT_RECOMMENDATION if default is None else default
+    masks = rule_masks(df, rules)
+
+    # Each case's set of matched rules as one integer, so the strings are put
+    # together once per distinct combination rather than once per case
+    combos = np.zeros(len(df), dtype=object if len(rules) > 62 else np.int64)
+    for i in range(len(rules)):
+        combos = combos + masks[i].astype(combos.dtype) * (1 << i)
+    unique_combos, inverse = np.unique(combos, return_inverse=True)
+
+    reasons = []
+    texts = []
+    for combo in unique_combos:
+        matched = [rule for i, rule in enumerate(rules) if (int(combo) >> i) & 1] or [default]
+        reasons.append('; '.join(rule['reason'] for rule in matched))
+        texts.append(' '.join(rule['text'] for rule in matched))
+    df['heuristic_recommendation'] = np.array(reasons, dtype=object)[inverse]
+    df['recommendation_text'] = np.array(texts, dtype=object)[inverse]
+    return df
 
 def main():
-    df = pd.read_csv(args.agg_csv)
-    df = heuristic_recommend(df)
-    df.to_csv(args.output_csv, index=False)
+    parser = argparse.ArgumentParser(description='Generate heuristic recommendations from aggregated Jira data.')
+    parser.add_argument('--agg_csv', type=str, required=True, help='Path to aggregated CSV (from aggregate_event_log.py)')
+    parser.add_argument('--output_csv', type=str, default='heuristic_recommendations.csv', help='Path to save recommendations CSV')
+    parser.add_argument('--rules_config', type=str, default=None, help='JSON file with custom recommendation rules and thresholds')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_from_args(args)
+
+    rules, default = load_rules(args.rules_config) if args.rules_config else (None, None)
+    with stage('read_csv') as record:
+        df = pd.read_csv(args.agg_csv)
+        record['rows'] = len(df)
+    with stage('heuristic_recommend', rows=len(df)):
+        df = heuristic_recommend(df, rules, default)
+    with stage('write_csv', rows=len(df)):
+        df.to_csv(args.output_csv, index=False)
     print(f"Heuristic recommendations saved to {args.output_csv}")
+    instrument.finish(timings_path(args.output_csv))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,115 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Persisted per-case state for incremental runs. A state file holds a
+# fingerprint of every case's events and the per-case tables a stage derived
+# from them; the next run recomputes only the cases whose fingerprint is new
+# or different and reuses the saved rows of the rest.
+
+STATE_VERSION = 1
+
+def case_hashes(df):
+    # Order-independent fingerprint of each case's events: the wrapping sum of
+    # its row hashes. Rows without a case_id are fingerprinted as one group.
+    rows = pd.util.hash_pandas_object(df[sorted(df.columns)], index=False).to_numpy()
+    codes, cases = pd.factorize(df['case_id'], use_na_sentinel=False)
+    sums = np.zeros(len(cases), dtype=np.uint64)
+    np.add.at(sums, codes, rows)
+    return pd.Series(sums, index=pd.Index(cases, dtype=object))
+
+def _dtype_name(dtype):
+    # Categoricals with their label type, so state saved with text ids is
+    # not reused for a log whose ids are now read as numbers
+    if isinstance(dtype, pd.CategoricalDtype):
+        return f'category[{dtype.categories.dtype}]'
+    return str(dtype)
+
+def state_key(df, **settings):
+    # Saved rows are only reusable by a run with the same columns, dtypes and
+    # stage settings; anything else starts from scratch
+    return json.dumps({
+        'version': STATE_VERSION,
+        'dtypes': {col: _dtype_name(dtype) for col, dtype in df.dtypes.items()},
+        **settings,
+    }, sort_keys=True, default=str)
+
+def load_state(path):
+    if not path or not os.path.exists(path):
+        return None
+    return pd.read_pickle(path)
+
+def save_state(path, key, hashes, tables):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    pd.to_pickle({'key': key, 'hashes': hashes, 'tables': tables}, tmp_path)
+    os.replace(tmp_path, path)
+
+def changed_cases(state, hashes, key):
+    # Cases whose saved rows cannot be reused: new or edited since the state
+    # was saved, or all of them when the state is missing or incompatible
+    if state is None or state['key'] != key:
+        return hashes.index
+    old = state['hashes']
+    common = hashes.index.intersection(old.index)
+    same = old[common].to_numpy() == hashes[common].to_numpy()
+    return hashes.index.difference(common[same], sort=False)
+
+def _case_keys(table):
+    if isinstance(table, pd.DataFrame) and 'case_id' in table.columns:
+        return table['case_id']
+    return pd.Series(table.index.get_level_values(0), index=table.index)
+
+def _with_case_keys(table, keys):
+    if isinstance(table, pd.DataFrame) and 'case_id' in table.columns:
+        return table.assign(case_id=keys).reset_index(drop=True)
+    index = table.index
+    if isinstance(index, pd.MultiIndex):
+        levels = [keys] + [index.get_level_values(i) for i in range(1, index.nlevels)]
+        table.index = pd.MultiIndex.from_arrays(levels, names=index.names)
+    else:
+        table.index = pd.CategoricalIndex(keys, name=index.name)
+    return table
+
+def _case_positions(keys, labels):
+    # Position of every key in labels, -1 when absent; categorical keys are
+    # looked up once per category
+    if isinstance(keys.dtype, pd.CategoricalDtype):
+        lookup = np.append(labels.get_indexer(keys.cat.categories), -1)
+        return lookup[keys.cat.codes.to_numpy()]
+    return labels.get_indexer(keys)
+
+def _case_labels(cases):
+    return pd.Index(cases.dropna(), dtype=object).sort_values()
+
+def _in_case_order(parts, positions, labels):
+    # Concatenate per-case tables and sort their rows by case position, keeping
+    # each case's rows in the order they had; rows without a case_id go last
+    merged = pd.concat(parts)
+    position = np.concatenate(positions)
+    order = np.argsort(np.where(position < 0, len(labels), position), kind='stable')
+    keys = pd.Categorical.from_codes(position[order], categories=labels)
+    return _with_case_keys(merged.iloc[order], keys)
+
+def concat_case_tables(parts, cases):
+    # Per-case tables computed over disjoint sets of cases (e.g. shards of one
+    # log), as the single table the whole log would have given
+    labels = _case_labels(cases)
+    return _in_case_order(parts, [_case_positions(_case_keys(part), labels) for part in parts], labels)
+
+def merge_case_tables(old, new, changed, cases):
+    # The saved rows of unchanged cases that are still in the log (`cases`),
+    # plus the freshly computed rows of the changed ones, back in case order.
+    # Case keys come back categorical over the sorted cases, so the next run
+    # matches them by code rather than by string.
+    labels = _case_labels(cases)
+    # reusable[p]: may the saved rows at position p be kept; the last slot
+    # (position -1) stands for rows without a case_id
+    reusable = np.ones(len(labels) + 1, dtype=bool)
+    reusable[-1] = cases.hasnans
+    reusable[labels.get_indexer(changed)] = False
+    old_position = _case_positions(_case_keys(old), labels)
+    kept = reusable[old_position]
+    return _in_case_order([old[kept], new], [old_position[kept], _case_positions(_case_keys(new), labels)], labels)
@@ -0,0 +1,118 @@
+import cProfile
+import datetime
+import json
+import os
+import re
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+# Stage-level timing for app.py and the ml_backend scripts. Code marks its
+# stages with `with stage(name) as record:` and may set record['rows'] to the
+# rows the stage processed. Recording is off by default, and a stage then
+# costs next to nothing. After start(), every stage appends a record with its
+# wall and CPU seconds and the process's peak RSS. With a profile directory,
+# each stage also runs under cProfile and dumps a profile there. A stage
+# nested in a profiled one is part of the outer profile.
+
+_session = None
+
+def max_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def start(profile_dir=None):
+    global _session
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+    _session = {
+        'started': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'argv': sys.argv,
+        'profile_dir': profile_dir,
+        'records': [],
+        'depth': 0,
+        'profiling': False,
+        'wall': time.perf_counter(),
+        'cpu': time.process_time(),
+    }
+
+def stop():
+    # The finished session's timings, or None if recording was off
+    global _session
+    session, _session = _session, None
+    if session is None:
+        return None
+    return {
+        'started': session['started'],
+        'argv': session['argv'],
+        'wall_seconds': round(time.perf_counter() - session['wall'], 4),
+        'cpu_seconds': round(time.process_time() - session['cpu'], 4),
+        'peak_rss_mb': round(max_rss_mb(), 1),
+        'stages': session['records'],
+    }
+
+@contextmanager
+def stage(name, rows=None):
+    session = _session
+    if session is None:
+        yield {}
+        return
+    # Records are listed in the order stages start; depth shows nesting
+    record = {'stage': name, 'depth': session['depth']}
+    if rows is not None:
+        record['rows'] = rows
+    index = len(session['records'])
+    session['records'].append(record)
+    profiler = None
+    if session['profile_dir'] and not session['profiling']:
+        profiler = cProfile.Profile()
+        session['profiling'] = True
+    session['depth'] += 1
+    rss_before = max_rss_mb()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler:
+            profiler.disable()
+        record['wall_seconds'] = round(time.perf_counter() - wall, 4)
+        record['cpu_seconds'] = round(time.process_time() - cpu, 4)
+        peak = max_rss_mb()
+        record['peak_rss_mb'] = round(peak, 1)
+        record['peak_rss_increase_mb'] = round(peak - rss_before, 1)
+        session['depth'] -= 1
+        if profiler:
+            session['profiling'] = False
+            slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', name)
+            path = os.path.join(session['profile_dir'], f"{index:03d}-{slug}.prof")
+            profiler.dump_stats(path)
+            record['profile'] = path
+
+def timings_path(output_path):
+    # Timing file for a script whose main output is output_path
+    return os.path.splitext(output_path)[0] + '.timings.json'
+
+def save_timings(timings, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(timings, f, indent=2)
+    print(f"Timings saved to {path}")
+
+def add_arguments(parser):
+    parser.add_argument('--timings', action='store_true', help='Record wall/CPU time, rows and peak RSS per stage to a JSON file next to the outputs')
+    parser.add_argument('--profile_dir', type=str, default=None, help='Also run each stage under cProfile and save its profile in this directory')
+
+def start_from_args(args):
+    if args.timings or args.profile_dir:
+        start(args.profile_dir)
+
+def finish(path):
+    # End the session started from the command line and save its timings
+    timings = stop()
+    if timings is not None:
+        save_timings(timings, path)
@@ -1,38 +1,38 @@
 import pandas as pd
-import joblib
 import argparse
-from train_model import feature_engineering
+import os
+import sys
 
-parser = argparse.ArgumentParser(description='Make model-based predictions using trained classifier.')
-parser.add_argument('--agg_csv', type=str, required=True, help='Path to aggregated input CSV')
-parser.add_argument('--model_path', type=str, default='ml_backend/model.joblib', help='Path to trained model file')
-parser.add_argument('--output_csv', type=str, default='model_recommendations.csv', help='Path to save output CSV with predictions')
-args = parser.parse_args()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_backend import instrument
+from ml_backend.instrument import stage, timings_path
+from ml_backend.predict import load_model, predict
 
 def main():
-    df = pd.read_csv(args.agg_csv)
-    
-    # Load model and feature list
-    model_bundle = joblib.load(args.model_path)
-    model = model_bundle['model']
-    feature_names = model_bundle['features']
-    
-    # Feature engineering
-    df_features = feature_engineering(df)
+    parser = argparse.ArgumentParser(description='Make model-based predictions using trained classifier.')
+    parser.add_argument('--agg_csv', type=str, required=True, help='Path to aggregated input CSV')
+    parser.add_argument('--model_path', type=str, default='ml_backend/model.joblib', help='Path to trained model file')
+    parser.add_argument('--output_csv', type=str, default='model_recommendations.csv', help='Path to save output CSV with predictions')
+    parser.add_argument('--mmap', action='store_true', help='Memory-map the model arrays instead of loading them')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_from_args(args)
 
-    # Match features exactly
-    if not all(f in df_features.columns for f in feature_names):
-        raise ValueError("Mismatch between expected model features and CSV columns")
+    with stage('read_csv') as record:
+        df = pd.read_csv(args.agg_csv)
+        record['rows'] = len(df)
 
-    X = df_features[feature_names]
-
-    # Predict using the model
-    preds = model.predict(X)
-    df['model_recommendation'] = preds
+    # Load model and predict, matching the model's features exactly
+    with stage('load_model'):
+        model_bundle = load_model(args.model_path, 'r' if args.mmap else None)
+    with stage('predict', rows=len(df)):
+        df['model_recommendation'] = predict(df, model_bundle, strict=True)
 
     # Save the output CSV
-    df.to_csv(args.output_csv, index=False)
+    with stage('write_csv', rows=len(df)):
+        df.to_csv(args.output_csv, index=False)
     print(f"Model-based recommendations saved to {args.output_csv}")
+    instrument.finish(timings_path(args.output_csv))
 
 if __name__ == '__main__':
     main()
@@ -1,47 +1,80 @@
 import pandas as pd
 import numpy as np
-import joblib
 import argparse
-from sklearn.preprocessing import LabelEncoder
-
-def feature_engineering(df, feature_names=None):
-    df = df.copy()
-    # Example: parse durations if present
-    if 'Created' in df.columns and 'Resolved' in df.columns:
-        df['Created'] = pd.to_datetime(df['Created'], errors='coerce')
-        df['Resolved'] = pd.to_datetime(df['Resolved'], errors='coerce')
-        df['ResolutionTime'] = (df['Resolved'] - df['Created']).dt.total_seconds() / 3600.0
-        df['ResolutionTime'] = df['ResolutionTime'].fillna(-1)
-    if 'Comments' in df.columns:
-        df['NumComments'] = df['Comments'].apply(lambda x: len(str(x).split(';')) if pd.notnull(x) else 0)
-    for col in df.select_dtypes(include=['object']).columns:
-        if col != 'recommendation_label':
-            df[col] = LabelEncoder().fit_transform(df[col].astype(str))
-    df = df.fillna(-1)
-    if feature_names:
-        # Ensure columns match training features
-        for col in feature_names:
-            if col not in df.columns:
-                df[col] = -1
-        df = df[feature_names]
-    return df
-
-parser = argparse.ArgumentParser(description='Predict recommendations using a trained model with feature engineering.')
-parser.add_argument('--csv_path', type=str, required=True, help='Path to new Jira CSV file')
-parser.add_argument('--model_path', type=str, default='model.joblib', help='Path to trained model')
-args = parser.parse_args()
+import functools
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_backend import instrument
+from ml_backend.instrument import stage, timings_path
+from ml_backend.train_model import feature_engineering
+
+# Loaded model bundles kept in memory by cached_model
+MODEL_CACHE_SIZE = 4
+# Rows scored per model.predict call
+BATCH_SIZE = 50000
+
+def load_model(model_path, mmap_mode=None):
+    # mmap_mode='r' memory-maps the arrays stored in the file rather than
+    # reading them in, which lowers peak memory when loading large forests;
+    # joblib (and sklearn, to unpickle the model) load only here
+    import joblib
+
+    return joblib.load(model_path, mmap_mode=mmap_mode)
+
+@functools.lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _cached_model(model_path, mtime_ns, mmap_mode):
+    return load_model(model_path, mmap_mode)
+
+def cached_model(model_path, mmap_mode=None):
+    # load_model for the most recently used models; keyed by the file's
+    # modification time too, so a model retrained to the same path is reloaded
+    model_path = os.path.abspath(model_path)
+    return _cached_model(model_path, os.stat(model_path).st_mtime_ns, mmap_mode)
+
+def predict(df, bundle, strict=False, batch_size=BATCH_SIZE):
+    # strict: refuse input missing any training feature instead of filling it with -1
+    features = bundle['features']
+    # Bundles saved before the encoders were stored refit them on this input
+    encoders = bundle.get('encoders')
+    if strict:
+        df_fe = feature_engineering(df, encoders)
+        if not all(f in df_fe.columns for f in features):
+            raise ValueError("Mismatch between expected model features and CSV columns")
+        df_fe = df_fe[features]
+    else:
+        df_fe = feature_engineering(df, encoders, feature_names=features)
+    model = bundle['model']
+    if len(df_fe) <= batch_size:
+        return model.predict(df_fe)
+    return np.concatenate([
+        model.predict(df_fe.iloc[start:start + batch_size])
+        for start in range(0, len(df_fe), batch_size)
+    ])
 
 def main():
-    df = pd.read_csv(args.csv_path)
-    model_bundle = joblib.load(args.model_path)
-    clf = model_bundle['model']
-    features = model_bundle['features']
-    df_fe = feature_engineering(df, feature_names=features)
-    preds = clf.predict(df_fe)
+    parser = argparse.ArgumentParser(description='Predict recommendations using a trained model with feature engineering.')
+    parser.add_argument('--csv_path', type=str, required=True, help='Path to new Jira CSV file')
+    parser.add_argument('--model_path', type=str, default='model.joblib', help='Path to trained model')
+    parser.add_argument('--mmap', action='store_true', help='Memory-map the model arrays instead of loading them')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_from_args(args)
+
+    with stage('read_csv') as record:
+        df = pd.read_csv(args.csv_path)
+        record['rows'] = len(df)
+    with stage('load_model'):
+        model_bundle = load_model(args.model_path, 'r' if args.mmap else None)
+    with stage('predict', rows=len(df)):
+        preds = predict(df, model_bundle)
     df['predicted_recommendation'] = preds
     print(df[['predicted_recommendation']])
-    df.to_csv('predictions_with_recommendations.csv', index=False)
+    with stage('write_csv', rows=len(df)):
+        df.to_csv('predictions_with_recommendations.csv', index=False)
     print("Predictions saved to predictions_with_recommendations.csv")
+    instrument.finish(timings_path('predictions_with_recommendations.csv'))
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
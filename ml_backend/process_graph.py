@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+# Directly-follows graph of an event log: for every pair of consecutive
+# events in a case, an edge from the first event's activity (or role) to the
+# second's, weighted by how often it occurs and by the time between the two
+# events. The statistics live in sparse label x label matrices, so a log
+# with many activities or roles stores only the edges that occur.
+
+QUANTILE = 0.9
+
+class FollowsMatrix:
+    # count, total_minutes, timed (edges with a known duration) and
+    # p90_minutes as CSR matrices over the same labels, sources in rows
+    def __init__(self, labels, count, total_minutes, timed, p90_minutes):
+        self.labels = labels
+        self.count = count
+        self.total_minutes = total_minutes
+        self.timed = timed
+        self.p90_minutes = p90_minutes
+
+    @classmethod
+    def from_pairs(cls, labels, source, target, minutes):
+        # source/target: label codes of each consecutive pair; minutes: the
+        # time between them (NaN when unknown)
+        n = len(labels)
+        keys = source.astype(np.int64) * n + target
+        known = ~np.isnan(minutes)
+        # Sorted by edge, then duration with unknown durations last
+        order = np.lexsort((minutes, keys))
+        keys, minutes, known = keys[order], minutes[order], known[order]
+        edges, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+        timed = np.add.reduceat(known.astype(np.int64), starts) if len(keys) else np.zeros(0, dtype=np.int64)
+        totals = np.add.reduceat(np.where(known, minutes, 0), starts) if len(keys) else np.zeros(0)
+
+        # Linear-interpolated quantile of each edge's known durations, as
+        # numpy and pandas compute it
+        p90 = np.full(len(edges), np.nan)
+        has = timed > 0
+        at = (timed[has] - 1) * QUANTILE
+        lower = np.floor(at).astype(np.int64)
+        upper = np.minimum(lower + 1, timed[has] - 1)
+        base = starts[has]
+        p90[has] = minutes[base + lower] + (minutes[base + upper] - minutes[base + lower]) * (at - lower)
+
+        rows, cols = edges // n, edges % n
+        # scipy is only needed once a graph is built
+        from scipy import sparse
+
+        def matrix(values):
+            return sparse.csr_matrix((values, (rows, cols)), shape=(n, n))
+
+        return cls(np.asarray(labels, dtype=object), matrix(counts), matrix(totals), matrix(timed), matrix(p90))
+
+    def edges(self):
+        # One row per edge, most frequent first
+        count = self.count.tocoo()
+        rows, cols = count.row, count.col
+        timed = np.asarray(self.timed[rows, cols]).ravel()
+        total = np.asarray(self.total_minutes[rows, cols]).ravel()
+        p90 = np.asarray(self.p90_minutes[rows, cols]).ravel()
+        edges = pd.DataFrame({
+            'source': self.labels[rows],
+            'target': self.labels[cols],
+            'count': count.data.astype(np.int64),
+            'total_minutes': total,
+            'mean_minutes': np.divide(total, timed, out=np.full(len(total), np.nan), where=timed > 0),
+            'p90_minutes': np.where(timed > 0, p90, np.nan),
+        })
+        order = np.lexsort((cols, rows, -edges['count'].to_numpy()))
+        return edges.iloc[order].reset_index(drop=True)
+
+def directly_follows(df):
+    # Activity and role graphs of a frame sorted by case and time, with
+    # categorical case_id, activity and role. A pair is skipped when either
+    # event lacks the label in question.
+    case = df['case_id'].cat.codes.to_numpy()
+    same = (case[1:] == case[:-1]) & (case[1:] >= 0)
+    minutes = (df['timestamp'].diff().dt.total_seconds() / 60).to_numpy()[1:][same]
+
+    graphs = {}
+    for col in ('activity', 'role'):
+        codes = df[col].cat.codes.to_numpy()
+        source, target = codes[:-1][same], codes[1:][same]
+        labelled = (source >= 0) & (target >= 0)
+        graphs[col] = FollowsMatrix.from_pairs(
+            df[col].cat.categories, source[labelled], target[labelled], minutes[labelled].astype(float))
+
+    # Activities that open and close each case
+    activity = df['activity'].cat.codes.to_numpy()
+    first = np.r_[True, case[1:] != case[:-1]] & (case >= 0)
+    last = np.r_[case[1:] != case[:-1], True] & (case >= 0)
+    n = len(df['activity'].cat.categories)
+    starts = np.bincount(activity[first & (activity >= 0)], minlength=n)
+    ends = np.bincount(activity[last & (activity >= 0)], minlength=n)
+    return graphs['activity'], graphs['role'], starts, ends
@@ -1,10 +1,17 @@
 import pandas as pd
 import argparse
-from collections import Counter
 import numpy as np
-from datetime import datetime
+import os
+import sys
+import tempfile
 
-def process_level_insights(df):
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_backend import instrument
+from ml_backend.event_log import iter_case_partitions, load_events, parse_memory_budget, plan_partitions
+from ml_backend.instrument import stage, timings_path
+from ml_backend.time_windows import WindowedMetrics
+
+def process_level_insights(df, windows=None):
     insights = []
     # Average, median, and variance of cycle time
     avg_duration = df['total_duration_hours'].mean()
@@ -32,79 +39,282 @@ def process_level_insights(df):
     never_closed = (df['num_closed'] == 0).sum() if 'num_closed' in df.columns else 0
     if never_closed > 0:
         insights.append(f"{never_closed} tickets were never closed. Review these for completion.")
-    # Trend: is cycle time increasing over time?
-    if 'case_id' in df.columns and 'total_duration_hours' in df.columns:
-        try:
-            df_sorted = df.copy()
-            df_sorted['case_num'] = df_sorted['case_id'].str.extract(r'(\d+)').astype(float)
-            df_sorted = df_sorted.sort_values('case_num')
-            if len(df_sorted) > 3:
-                trend = np.polyfit(df_sorted['case_num'], df_sorted['total_duration_hours'], 1)[0]
-                if trend > 0:
-                    insights.append("Average cycle time is increasing over time. Investigate recent process changes.")
-                elif trend < 0:
-                    insights.append("Average cycle time is decreasing over time. Recent improvements may be working.")
-        except Exception:
-            pass
+    # Trend: is cycle time increasing over time? Cases completed in the later
+    # half of the log's days against those completed in the earlier half
+    trend = windows.cycle_time_trend() if windows is not None else None
+    if trend is not None:
+        if trend > 1:
+            insights.append("Average cycle time is increasing over time. Investigate recent process changes.")
+        elif trend < 1:
+            insights.append("Average cycle time is decreasing over time. Recent improvements may be working.")
     return insights
 
-def user_level_insights(event_log):
+# Delay distributions are kept as counts of each distinct (key, delay), which
+# merge across partitions by adding the counts and give the same percentiles
+# as the raw values. A key with more than MAX_DISTINCT_DELAYS distinct delays
+# has them rounded to log-spaced bins instead, DELAY_ACCURACY apart in
+# relative terms, so a distribution never takes more than a few thousand rows
+# however many events it covers.
+MAX_DISTINCT_DELAYS = 4096
+DELAY_ACCURACY = 0.01
+_LOG_GAMMA = np.log((1 + DELAY_ACCURACY) / (1 - DELAY_ACCURACY))
+
+def _delay_bins(delays):
+    # Each positive delay as the midpoint of its log-spaced bin; a bin's
+    # midpoint falls in the same bin, so binning twice changes nothing
+    values = np.asarray(delays, dtype=float).copy()
+    positive = values > 0
+    bins = np.ceil(np.log(values[positive]) / _LOG_GAMMA)
+    values[positive] = np.exp((bins - 0.5) * _LOG_GAMMA)
+    return values
+
+def _sum_delays(table):
+    return table.groupby(['key', 'delay'], sort=True).agg(count=('count', 'sum'), binned=('binned', 'any')).reset_index()
+
+def _bound_delays(table):
+    # Sum the counts per (key, delay), binning the keys that were binned in
+    # any part or have too many distinct delays
+    table = _sum_delays(table)
+    per_key = table.groupby('key', sort=False).agg(distinct=('delay', 'size'), binned=('binned', 'any'))
+    over = per_key.index[(per_key['distinct'] > MAX_DISTINCT_DELAYS) | per_key['binned']]
+    rows = table['key'].isin(over).to_numpy() & ~table['binned'].to_numpy()
+    if not rows.any():
+        return table
+    table.loc[rows, 'delay'] = _delay_bins(table.loc[rows, 'delay'])
+    table.loc[rows, 'binned'] = True
+    return _sum_delays(table)
+
+def delay_counts(keys, delays):
+    # Mergeable distribution of delays per key; rows missing either are skipped
+    table = pd.DataFrame({'key': np.asarray(keys, dtype=object), 'delay': np.asarray(delays, dtype=float)}).dropna()
+    return _bound_delays(table.assign(count=1, binned=False))
+
+def merge_delay_counts(tables):
+    return _bound_delays(pd.concat(tables, ignore_index=True))
+
+def user_delay_counts(times):
+    # Gaps between each user's consecutive actions, in hours, from a frame of
+    # (user, timestamp) holding all of those users' actions
+    times = times.dropna().sort_values(['user', 'timestamp'], kind='mergesort')
+    gaps = times.groupby('user', observed=True, sort=False)['timestamp'].diff().dt.total_seconds() / 3600.0
+    return delay_counts(times['user'], gaps)
+
+def event_log_stats(event_log, user_delays=True):
+    # Per-user and per-activity partial aggregates of a set of complete cases.
+    # Every table merges across partitions with MERGE_OPS, so the insights of a
+    # streamed log match the in-memory ones. first_row (file position) and
+    # first_key (case/timestamp position) keep the tie-breaking of Counter and
+    # value_counts, which prefer the value seen first. A user's gaps span cases,
+    # and so partitions: with user_delays=False they are left out, for the
+    # caller to compute from all of the users' timestamps.
+    rows = event_log['_row'] if '_row' in event_log.columns else pd.RangeIndex(len(event_log))
+    events = pd.DataFrame({
+        'case_id': event_log['case_id'].to_numpy(),
+        'user': event_log['user'].to_numpy(),
+        'activity': event_log['activity'].to_numpy(),
+        'timestamp': pd.to_datetime(event_log['timestamp'], errors='coerce').to_numpy(),
+        'row': np.asarray(rows),
+    })
+
+    def counts(frame, key):
+        return frame.groupby(key, dropna=False, sort=False).agg(count=('row', 'size'), first_row=('row', 'min'))
+
+    user_times = events.groupby('user', sort=False).agg(
+        first_ts=('timestamp', 'min'), last_ts=('timestamp', 'max'), n_ts=('timestamp', 'count'))
+
+    # Inter-event delays within each case, credited to the later activity
+    ordered = events.sort_values(['case_id', 'timestamp'], kind='mergesort')
+    delays = ordered.groupby('case_id', sort=False)['timestamp'].diff().dt.total_seconds() / 3600.0
+    activity_delays = delays.groupby(ordered['activity'], sort=False).agg(delay_sum='sum', delay_n='count')
+
+    weekdays = ordered.dropna(subset=['timestamp'])
+    days = weekdays['timestamp'].dt.day_name()
+    weekday_counts = days.groupby(days, sort=False).size().to_frame('count')
+    # Rows are in (case, timestamp) order, so a weekday's first row has its
+    # smallest key; only those few rows are formatted
+    first = ~days.duplicated().to_numpy()
+    first_keys = weekdays['case_id'][first].astype(str) + '\x00' + weekdays['timestamp'][first].dt.strftime('%Y-%m-%dT%H:%M:%S.%f')
+    weekday_counts['first_key'] = pd.Series(first_keys.to_numpy(), index=days.to_numpy()[first])
+
+    # Only the cycle time trend is read, so the SLA checks are skipped
+    windows = WindowedMetrics('day', breaches=False)
+    windows.update(event_log)
+
+    stats = {
+        'users': counts(events, 'user'),
+        'reopens': counts(events[events['activity'] == 'Reopened'], 'user'),
+        'user_times': user_times,
+        'activities': counts(events, 'activity'),
+        'activity_delays': activity_delays,
+        'weekdays': weekday_counts,
+        # Delay distributions behind the percentiles
+        'activity_delay_counts': delay_counts(ordered['activity'], delays),
+        # Per-day counts and per-case spans, for the cycle time trend
+        'windows': windows,
+    }
+    if user_delays:
+        stats['user_delay_counts'] = user_delay_counts(events[['user', 'timestamp']])
+    return stats
+
+# Delay distributions, merged with merge_delay_counts rather than MERGE_OPS
+DELAY_TABLES = ['user_delay_counts', 'activity_delay_counts']
+
+PERCENTILES = [0.5, 0.9, 0.99]
+
+MERGE_OPS = {
+    'count': 'sum', 'first_row': 'min', 'first_ts': 'min', 'last_ts': 'max', 'n_ts': 'sum',
+    'delay_sum': 'sum', 'delay_n': 'sum', 'first_key': 'min',
+}
+
+def merge_event_log_stats(parts):
+    merged = {}
+    for name in parts[0]:
+        if name == 'windows':
+            merged[name] = WindowedMetrics.merge([part[name] for part in parts])
+            continue
+        if name in DELAY_TABLES:
+            merged[name] = merge_delay_counts([part[name] for part in parts])
+            continue
+        table = pd.concat([part[name] for part in parts])
+        merged[name] = table.groupby(level=0, dropna=False, sort=False).agg({col: MERGE_OPS[col] for col in table.columns})
+    return merged
+
+def stream_event_log_stats(path, memory_budget):
+    # event_log_stats of a log read in case partitions that fit the budget.
+    # Partitions are folded in one at a time. Users' timestamps are spilled to
+    # files bucketed by user, and each bucket's gaps are counted on its own,
+    # so memory holds one partition or one bucket of (user, timestamp) pairs
+    # at a time; a single user with a very large share of the events still
+    # needs all of their timestamps in one bucket.
+    n_buckets = plan_partitions(path, memory_budget)[0]
+    merged = None
+    windows = []
+    with tempfile.TemporaryDirectory(prefix='user_timestamps_') as workdir:
+        buckets = [[] for _ in range(n_buckets)]
+        for i, part in enumerate(iter_case_partitions(path, memory_budget)):
+            stats = event_log_stats(part, user_delays=False)
+            windows.append(stats.pop('windows'))
+            merged = stats if merged is None else merge_event_log_stats([merged, stats])
+            times = pd.DataFrame({'user': part['user'].to_numpy(dtype=object), 'timestamp': pd.to_datetime(part['timestamp'], errors='coerce').to_numpy()}).dropna()
+            for b, piece in times.groupby(pd.util.hash_array(times['user'].to_numpy()) % n_buckets):
+                piece_path = os.path.join(workdir, f'bucket-{b:05d}-{i:06d}.pkl')
+                piece.to_pickle(piece_path)
+                buckets[b].append(piece_path)
+        merged['windows'] = WindowedMetrics.merge(windows)
+        merged['user_delay_counts'] = merge_delay_counts([
+            user_delay_counts(pd.concat([pd.read_pickle(piece_path) for piece_path in piece_paths], ignore_index=True))
+            for piece_paths in buckets if piece_paths
+        ] or [delay_counts([], [])])
+    return merged
+
+def _percentiles(counts, name):
+    # Linearly interpolated quantiles of each key's delays, as pandas computes
+    # them from the raw values, read off the cumulative counts
+    rows = {}
+    for key, group in counts.groupby('key', sort=True):
+        values = group['delay'].to_numpy()
+        ends = np.cumsum(group['count'].to_numpy())
+        n = int(ends[-1])
+        row = {'n': n}
+        for q in PERCENTILES:
+            position = (n - 1) * q
+            lower = int(np.floor(position))
+            below, above = values[np.searchsorted(ends, [lower, min(lower + 1, n - 1)], side='right')]
+            row[f'p{round(q * 100)}'] = below + (above - below) * (position - lower)
+        rows[key] = row
+    columns = ['n'] + [f'p{round(q * 100)}' for q in PERCENTILES]
+    return pd.DataFrame.from_dict(rows, orient='index', columns=columns).rename_axis(name)
+
+def user_delay_percentiles(stats):
+    # Gaps between each user's consecutive actions, in hours
+    return _percentiles(stats['user_delay_counts'], 'user')
+
+def activity_delay_percentiles(stats):
+    # Time from the previous event of the case to each activity, in hours
+    return _percentiles(stats['activity_delay_counts'], 'activity')
+
+def delay_percentiles(stats):
+    # Both tables in one frame, for export
+    tables = {'user': user_delay_percentiles(stats), 'activity': activity_delay_percentiles(stats)}
+    return pd.concat([
+        table.rename_axis('name').reset_index().assign(level=level) for level, table in tables.items()
+    ])[['level', 'name', 'n'] + [f'p{round(q * 100)}' for q in PERCENTILES]]
+
+def _slowest_line(table, subject):
+    # The key with the highest p90 (first in name order on ties)
+    if table.empty:
+        return None
+    slowest = table['p90'].idxmax()
+    row = table.loc[slowest]
+    return f"{subject.format(slowest)} ({row['p90']:.1f} hours; median {row['p50']:.1f}, p99 {row['p99']:.1f})."
+
+def _most_common(table, n, tie_break='first_row'):
+    # Counter.most_common order: highest count first, ties by first appearance
+    return table.sort_values(tie_break, kind='mergesort').sort_values('count', ascending=False, kind='mergesort').head(n)
+
+def user_level_insights(event_log, stats=None):
+    if stats is None:
+        stats = event_log_stats(event_log)
     insights = []
     # Most active users
-    user_counts = Counter(event_log['user'])
-    top_users = user_counts.most_common(3)
-    for user, count in top_users:
+    for user, count in _most_common(stats['users'], 3)['count'].items():
         insights.append(f"User {user} participated in {count} activities.")
     # Users with most reopens
-    reopens = event_log[event_log['activity'] == 'Reopened']
-    if not reopens.empty:
-        reopen_counts = Counter(reopens['user'])
-        for user, count in reopen_counts.most_common(2):
-            insights.append(f"User {user} was involved in {count} ticket reopens.")
-    # User with most delays (longest avg time between their actions)
-    event_log['timestamp'] = pd.to_datetime(event_log['timestamp'], errors='coerce')
-    user_delays = {}
-    for user, group in event_log.groupby('user'):
-        times = group['timestamp'].sort_values().tolist()
-        if len(times) > 1:
-            delays = [(times[i] - times[i-1]).total_seconds() / 3600.0 for i in range(1, len(times))]
-            user_delays[user] = np.mean(delays)
-    if user_delays:
-        slowest_user = max(user_delays, key=user_delays.get)
+    for user, count in _most_common(stats['reopens'], 2)['count'].items():
+        insights.append(f"User {user} was involved in {count} ticket reopens.")
+    # User with most delays (longest avg time between their actions); the
+    # mean gap between a user's sorted actions is their span over the gaps
+    times = stats['user_times'].sort_index()
+    times = times[times['n_ts'] > 1]
+    if not times.empty:
+        user_delays = (times['last_ts'] - times['first_ts']).dt.total_seconds() / 3600.0 / (times['n_ts'] - 1)
+        slowest_user = user_delays.idxmax()
         insights.append(f"User {slowest_user} has the longest average delay between actions ({user_delays[slowest_user]:.1f} hours). Consider workload balancing.")
+    line = _slowest_line(user_delay_percentiles(stats), "User {} has the longest 90th-percentile delay between actions")
+    if line:
+        insights.append(line)
     return insights
 
-def activity_level_insights(event_log):
+def activity_level_insights(event_log, stats=None):
+    if stats is None:
+        stats = event_log_stats(event_log)
     insights = []
     # Most common activity
-    activity_counts = Counter(event_log['activity'])
-    most_common = activity_counts.most_common(1)
-    if most_common:
-        act, count = most_common[0]
+    most_common = _most_common(stats['activities'], 1)['count']
+    for act, count in most_common.items():
         insights.append(f"The most common activity is '{act}' ({count} occurrences).")
     # Activity with most delays (longest avg time between steps)
-    event_log = event_log.sort_values(['case_id', 'timestamp'])
-    event_log['timestamp'] = pd.to_datetime(event_log['timestamp'], errors='coerce')
-    delays = []
-    for case_id, group in event_log.groupby('case_id'):
-        times = group['timestamp'].tolist()
-        acts = group['activity'].tolist()
-        for i in range(1, len(times)):
-            delay = (times[i] - times[i-1]).total_seconds() / 3600.0
-            delays.append((acts[i], delay))
-    if delays:
-        delay_df = pd.DataFrame(delays, columns=['activity', 'delay_hours'])
-        avg_delays = delay_df.groupby('activity')['delay_hours'].mean().sort_values(ascending=False)
+    delays = stats['activity_delays'].sort_index()
+    delays = delays[delays['delay_n'] > 0]
+    if not delays.empty:
+        avg_delays = (delays['delay_sum'] / delays['delay_n']).sort_values(ascending=False, kind='mergesort')
         top_delay = avg_delays.head(1)
         for act, delay in top_delay.items():
             insights.append(f"The activity with the longest average delay is '{act}' ({delay:.1f} hours between steps).")
+    line = _slowest_line(activity_delay_percentiles(stats), "The activity with the longest 90th-percentile delay is '{}'")
+    if line:
+        insights.append(line)
     # Busiest day of week
-    if 'timestamp' in event_log.columns:
-        event_log['weekday'] = event_log['timestamp'].dt.day_name()
-        weekday_counts = event_log['weekday'].value_counts()
-        if not weekday_counts.empty:
-            busiest = weekday_counts.idxmax()
-            insights.append(f"The busiest day of the week is {busiest}.")
+    if not stats['weekdays'].empty:
+        busiest = _most_common(stats['weekdays'], 1, tie_break='first_key').index[0]
+        insights.append(f"The busiest day of the week is {busiest}.")
+    # Busiest calendar day
+    days = stats['windows'].windows['events'] if 'windows' in stats else pd.Series(dtype=np.int64)
+    if not days.empty:
+        insights.append(f"The busiest day was {days.idxmax():%Y-%m-%d} ({days.max()} events).")
+    return insights
+
+def process_insights(agg, event_log=None, stats=None):
+    # All insight lines, in the sectioned layout the upload route parses
+    if stats is None:
+        stats = event_log_stats(event_log)
+    insights = []
+    insights.append('--- Process-level Insights ---')
+    insights.extend(process_level_insights(agg, stats.get('windows')))
+    insights.append('\n--- User-level Insights ---')
+    insights.extend(user_level_insights(event_log, stats))
+    insights.append('\n--- Activity-level Insights ---')
+    insights.extend(activity_level_insights(event_log, stats))
     return insights
 
 def main():
@@ -112,23 +322,36 @@ def main():
     parser.add_argument('--agg_csv', type=str, required=True, help='Path to aggregated CSV')
     parser.add_argument('--event_log', type=str, required=True, help='Path to event log CSV')
     parser.add_argument('--output_txt', type=str, default='process_insights.txt', help='Path to save insights text file')
+    parser.add_argument('--memory_budget', type=str, default=None, help='Stream the event log in case partitions that fit this budget (e.g. 512MB)')
+    parser.add_argument('--percentiles_csv', type=str, default=None, help='Also save p50/p90/p99 delays per user and per activity to this CSV')
+    instrument.add_arguments(parser)
     args = parser.parse_args()
+    instrument.start_from_args(args)
 
-    agg = pd.read_csv(args.agg_csv)
-    event_log = pd.read_csv(args.event_log)
-
-    insights = []
-    insights.append('--- Process-level Insights ---')
-    insights.extend(process_level_insights(agg))
-    insights.append('\n--- User-level Insights ---')
-    insights.extend(user_level_insights(event_log))
-    insights.append('\n--- Activity-level Insights ---')
-    insights.extend(activity_level_insights(event_log))
+    with stage('read_csv') as record:
+        agg = pd.read_csv(args.agg_csv)
+        record['rows'] = len(agg)
+    if args.memory_budget:
+        with stage('event_log_stats_streaming'):
+            stats = stream_event_log_stats(args.event_log, parse_memory_budget(args.memory_budget))
+    else:
+        with stage('load_events') as record:
+            events = load_events(args.event_log)
+            record['rows'] = len(events)
+        with stage('event_log_stats', rows=len(events)):
+            stats = event_log_stats(events)
+    with stage('process_insights', rows=len(agg)):
+        insights = process_insights(agg, stats=stats)
 
-    with open(args.output_txt, 'w') as f:
+    with stage('write_text', rows=len(insights)), open(args.output_txt, 'w') as f:
         for line in insights:
             f.write(line + '\n')
     print(f"Process/user/activity insights saved to {args.output_txt}")
+    if args.percentiles_csv:
+        with stage('delay_percentiles'):
+            delay_percentiles(stats).to_csv(args.percentiles_csv, index=False)
+        print(f"Delay percentiles saved to {args.percentiles_csv}")
+    instrument.finish(timings_path(args.output_txt))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # the faster serializer is optional
+    orjson = None
+
+# Report file formats: 'json' is the indented document app.py has always
+# written; 'compact' is the same document without whitespace; 'pages' also
+# writes the large record lists as a directory of fixed-size JSON pages plus
+# an index.json, streamed as the records are produced.
+FORMATS = ['json', 'compact', 'pages']
+PAGE_SIZE = 5000
+INDEX_FILE = 'index.json'
+
+def _default(value):
+    # numpy scalars that reach a report
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _without_nan(value):
+    # NaN as null: orjson writes null for it and json a bare NaN, which is not
+    # valid JSON, so both encoders get None instead
+    if isinstance(value, (float, np.floating)):
+        return None if value != value else value
+    if isinstance(value, dict):
+        return {key: _without_nan(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_without_nan(item) for item in value]
+    return value
+
+def dumps(data):
+    # Compact encoding; orjson when it is installed
+    data = _without_nan(data)
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, separators=(',', ':'), default=_default).encode()
+
+def write_json(data, path, report_format='json'):
+    if report_format == 'json':
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+    else:
+        with open(path, 'wb') as f:
+            f.write(dumps(data))
+
+def write_pages(records, directory, page_size=PAGE_SIZE, summary=None):
+    # Consume records page by page, so at most one page is held in memory.
+    # summary: fields for the index, or a function returning them once the
+    # records are exhausted (for totals that depend on every record).
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    pages = []
+    page = []
+
+    def flush():
+        name = f'page-{len(pages):05d}.json'
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(dumps(page))
+        pages.append({'file': name, 'count': len(page)})
+        page.clear()
+
+    total = 0
+    for record in records:
+        page.append(record)
+        total += 1
+        if len(page) == page_size:
+            flush()
+    if page or not pages:
+        flush()
+    index = {'total': total, 'page_size': page_size, 'pages': pages}
+    index.update((summary() if callable(summary) else summary) or {})
+    with open(os.path.join(directory, INDEX_FILE), 'wb') as f:
+        f.write(dumps(index))
+    return index
@@ -0,0 +1,110 @@
+import json
+import numpy as np
+import pandas as pd
+
+# Default per-activity SLA limits, in minutes
+SLA_LIMITS = {
+    'Created': 30,
+    'Assigned': 30,
+    'In Progress': 240,
+    'Waiting for Customer': 1440,
+    'Code Review': 180,
+    'QA Review': 180,
+    'Resolved': 60,
+    'Closed': 60,
+    'Reopened': 120
+}
+
+RULE_COLUMNS = ['activity', 'role', 'min_story_points', 'max_story_points', 'limit_minutes']
+VIOLATION_COLUMNS = ['case_id', 'activity', 'user', 'role', 'duration_minutes', 'sla_limit', 'story_points']
+
+# Above this many violations the report is streamed to disk in chunks
+STREAM_THRESHOLD = 100000
+
+def default_sla_rules():
+    return pd.DataFrame(
+        [(activity, None, None, None, limit) for activity, limit in SLA_LIMITS.items()],
+        columns=RULE_COLUMNS,
+    )
+
+def load_sla_rules(path=None):
+    # Config format (JSON):
+    #   {"activities": {"Created": 30, ...},
+    #    "rules": [{"activity": "In Progress", "role": "Developer",
+    #               "min_story_points": 8, "limit_minutes": 480}, ...]}
+    # "activities" replaces the default per-activity table when present.
+    # Every key of a rule except limit_minutes is optional; when several
+    # rules match an event the one with the most conditions wins, and among
+    # equally specific rules the later one in "rules" wins.
+    if path is None:
+        return default_sla_rules()
+    with open(path, 'r') as f:
+        config = json.load(f)
+    activities = config.get('activities', SLA_LIMITS)
+    rows = [(activity, None, None, None, limit) for activity, limit in activities.items()]
+    for rule in config.get('rules', []):
+        if 'limit_minutes' not in rule:
+            raise ValueError(f"SLA rule without limit_minutes: {rule}")
+        rows.append(tuple(rule.get(col) for col in RULE_COLUMNS))
+    return pd.DataFrame(rows, columns=RULE_COLUMNS)
+
+def sla_limit_column(events, rules):
+    # Resolve the applicable limit for every event; NaN where no rule applies
+    conditions = rules[RULE_COLUMNS[:-1]].notna()
+    specificity = conditions.sum(axis=1).to_numpy()
+
+    # Activity-only rules are a plain join on the activity column
+    plain = rules[(specificity == 1) & conditions['activity'].to_numpy()]
+    activity_limits = dict(zip(plain['activity'], plain['limit_minutes'].astype(float)))
+    limit = np.array(events['activity'].astype(object).map(activity_limits), dtype=float)
+    rank = np.where(np.isnan(limit), -1, 1)
+
+    # Role and story-point rules are few; each one is a single masked overwrite
+    story_points = events['story_points'].to_numpy(dtype=float, na_value=np.nan)
+    for i in np.flatnonzero(~((specificity == 1) & conditions['activity'].to_numpy())):
+        rule = rules.iloc[i]
+        mask = np.ones(len(events), dtype=bool)
+        if pd.notna(rule['activity']):
+            mask &= (events['activity'] == rule['activity']).to_numpy()
+        if pd.notna(rule['role']):
+            mask &= (events['role'] == rule['role']).to_numpy()
+        if pd.notna(rule['min_story_points']):
+            mask &= story_points >= rule['min_story_points']
+        if pd.notna(rule['max_story_points']):
+            mask &= story_points <= rule['max_story_points']
+        mask &= specificity[i] >= rank
+        limit[mask] = rule['limit_minutes']
+        rank[mask] = specificity[i]
+    return limit
+
+def find_sla_violations(events, rules=None):
+    # events needs a duration_minutes column; rows without one are ignored
+    if rules is None:
+        rules = default_sla_rules()
+    limit = sla_limit_column(events, rules)
+    minutes = events['duration_minutes'].to_numpy(dtype=float)
+    breached = (limit > 0) & (minutes > limit)
+
+    violations = events.loc[breached, ['case_id', 'activity', 'user', 'role', 'story_points']].copy()
+    violations['duration_minutes'] = np.round(minutes[breached]).astype(np.int64)
+    limits = limit[breached]
+    violations['sla_limit'] = limits.astype(np.int64) if np.all(limits == np.round(limits)) else limits
+    return violations[VIOLATION_COLUMNS].reset_index(drop=True)
+
+def violation_records(violations):
+    return violations.astype({col: object for col in ('case_id', 'activity', 'user', 'role')}).to_dict('records')
+
+def iter_violation_records(violations, chunk_size=50000):
+    # Records built chunk by chunk so the full record list never exists at once
+    for start in range(0, len(violations), chunk_size):
+        yield from violation_records(violations.iloc[start:start + chunk_size])
+
+def stream_violations(violations, path, chunk_size=50000):
+    with open(path, 'w') as f:
+        f.write('[')
+        first = True
+        for record in iter_violation_records(violations, chunk_size):
+            f.write('\n' if first else ',\n')
+            f.write(json.dumps(record))
+            first = False
+        f.write('\n]\n')
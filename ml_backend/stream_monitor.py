@@ -0,0 +1,395 @@
+import argparse
+import datetime
+import heapq
+import itertools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_backend.aggregate_event_log import COUNT_ACTIVITIES
+from ml_backend.heuristic_recommend import COMPARISONS, RULES, load_rules
+from ml_backend.sla import RULE_COLUMNS, load_sla_rules
+from ml_backend.time_windows import CLOSING_ACTIVITIES
+
+# Live scoring of an event feed, one event at a time. Each open case keeps a
+# small state (its last event and running counts) in a bounded LRU map, and
+# every event is checked as it arrives:
+#   sla_breach  the step into the event took longer than the event's SLA
+#               limit, as find_sla_violations judges it
+#   heuristic   a case matches a heuristic_recommend rule. Rules on a growing
+#               feature ('>' and '>=') fire as soon as they match; the others
+#               ('==', '<', ...) could still change, so they are judged when
+#               the case closes
+#   overdue     a timer: no event arrived within the SLA limit of the
+#               activity the case is in
+# A closing event moves the case to a second LRU map of closed cases, with no
+# timer, so a reopened case carries on from its earlier events; the oldest
+# closed cases are evicted beyond max_closed_cases. An open case is dropped
+# once it has been idle for max_idle_hours, or when max_cases newer cases
+# push it out.
+
+DEFAULT_MAX_CASES = 100000
+DEFAULT_MAX_CLOSED_CASES = 100000
+DEFAULT_MAX_IDLE_HOURS = 24 * 30
+QUEUE_SIZE = 10000
+# Rules that stay matched once they match, since every case feature only grows
+GROWING_OPS = {'>', '>='}
+
+class SlaMatcher:
+    # sla_limit_column for a single event: the most specific matching rule
+    # wins, and among equally specific rules the later one
+    def __init__(self, rules):
+        conditions = rules[RULE_COLUMNS[:-1]].notna()
+        specificity = conditions.sum(axis=1).to_numpy()
+        plain = (specificity == 1) & conditions['activity'].to_numpy()
+        self.activity_limits = {
+            rule['activity']: float(rule['limit_minutes']) for _, rule in rules[plain].iterrows()
+        }
+        self.rules = [
+            (int(specificity[i]), *(None if pd.isna(rules.iloc[i][col]) else rules.iloc[i][col] for col in RULE_COLUMNS))
+            for i in np.flatnonzero(~plain)
+        ]
+
+    def limit(self, activity, role=None, story_points=None):
+        # Minutes, or None where no rule applies
+        limit = self.activity_limits.get(activity)
+        rank = -1 if limit is None else 1
+        for specificity, rule_activity, rule_role, min_points, max_points, limit_minutes in self.rules:
+            if specificity < rank:
+                continue
+            if rule_activity is not None and rule_activity != activity:
+                continue
+            if rule_role is not None and rule_role != role:
+                continue
+            if min_points is not None and not (story_points is not None and story_points >= min_points):
+                continue
+            if max_points is not None and not (story_points is not None and story_points <= max_points):
+                continue
+            limit, rank = float(limit_minutes), specificity
+        return limit
+
+class CaseState:
+    __slots__ = ('start', 'last', 'activity', 'user', 'role', 'story_points', 'steps',
+                 'users', 'roles', 'counts', 'fired', 'seq')
+
+    def __init__(self, timestamp):
+        self.start = self.last = timestamp
+        self.activity = self.user = self.role = self.story_points = None
+        self.steps = 0
+        self.users = set()
+        self.roles = set()
+        self.counts = {}
+        # Indexes of the heuristic rules already reported
+        self.fired = set()
+        # Identifies the case's live timer; older heap entries are stale
+        self.seq = None
+
+    def feature(self, column):
+        # The case's value of an aggregate_event_log column; 0 when unknown
+        if column == 'total_duration_hours':
+            return (self.last - self.start).total_seconds() / 3600
+        if column == 'total_steps':
+            return self.steps
+        if column == 'unique_users':
+            return len(self.users)
+        if column == 'unique_roles':
+            return len(self.roles)
+        if column == 'total_story_points':
+            return 0 if self.story_points is None else self.story_points
+        return self.counts.get(column, 0)
+
+def parse_event(line):
+    # One NDJSON event in the upload's columns (case_id, timestamp, activity,
+    # user, role, story_points), keys in any case. Aware timestamps are
+    # converted to local time, so they compare with the wall clock.
+    record = {str(key).lower().strip(): value for key, value in json.loads(line).items()}
+    if record.get('case_id') is None or record.get('timestamp') is None:
+        raise ValueError('event without case_id or timestamp')
+    timestamp = datetime.datetime.fromisoformat(str(record['timestamp']))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    story_points = record.get('story_points')
+    return {
+        'case_id': str(record['case_id']),
+        'timestamp': timestamp,
+        'activity': record.get('activity'),
+        'user': record.get('user'),
+        'role': record.get('role'),
+        'story_points': None if story_points in (None, '') else float(story_points),
+    }
+
+def _minutes(value):
+    # Whole minutes as find_sla_violations reports them
+    return int(value) if value == int(value) else value
+
+def _time(timestamp):
+    return timestamp.isoformat(sep=' ')
+
+class StreamMonitor:
+    def __init__(self, sla_rules=None, rules=None, max_cases=DEFAULT_MAX_CASES,
+                 max_closed_cases=DEFAULT_MAX_CLOSED_CASES, max_idle_hours=DEFAULT_MAX_IDLE_HOURS,
+                 count_activities=COUNT_ACTIVITIES, closing_activities=CLOSING_ACTIVITIES):
+        self.sla = SlaMatcher(sla_rules if sla_rules is not None else load_sla_rules())
+        self.rules = RULES if rules is None else rules
+        self.max_cases = max_cases
+        self.max_closed_cases = max_closed_cases
+        self.max_idle = datetime.timedelta(hours=max_idle_hours)
+        self.count_features = {}
+        for feature, activity in count_activities.items():
+            self.count_features.setdefault(activity, []).append(feature)
+        self.closing_activities = set(closing_activities)
+        self.cases = OrderedDict()
+        self.closed = OrderedDict()
+        # (deadline, seq, case_id, kind) with kind 'overdue' or 'expire'
+        self.timers = []
+        self._seq = itertools.count()
+        # Latest event time seen, the clock of replayed feeds
+        self.watermark = None
+        self.stats = dict.fromkeys(['events', 'bad_lines', 'out_of_order', 'closed', 'reopened', 'expired', 'evicted'], 0)
+
+    def process(self, event):
+        # Take one parsed event; returns the alerts it triggers
+        self.stats['events'] += 1
+        case_id, timestamp, activity = event['case_id'], event['timestamp'], event['activity']
+        if self.watermark is None or timestamp > self.watermark:
+            self.watermark = timestamp
+        alerts = []
+        state = self.cases.get(case_id)
+        first = False
+        if state is None:
+            state = self.closed.pop(case_id, None)
+            if state is not None:
+                self.stats['reopened'] += 1
+            else:
+                state, first = CaseState(timestamp), True
+            self.cases[case_id] = state
+            if len(self.cases) > self.max_cases:
+                self.cases.popitem(last=False)
+                self.stats['evicted'] += 1
+        else:
+            self.cases.move_to_end(case_id)
+        if not first:
+            if timestamp < state.last:
+                # The step is unknown; the event still counts toward the case
+                self.stats['out_of_order'] += 1
+            else:
+                minutes = (timestamp - state.last).total_seconds() / 60
+                limit = self.sla.limit(activity, event['role'], event['story_points'])
+                if limit is not None and limit > 0 and minutes > limit:
+                    alerts.append({
+                        'type': 'sla_breach', 'case_id': case_id, 'timestamp': _time(timestamp),
+                        'activity': activity, 'user': event['user'], 'role': event['role'],
+                        'duration_minutes': round(minutes), 'sla_limit': _minutes(limit),
+                        'story_points': event['story_points'],
+                    })
+
+        if timestamp >= state.last:
+            state.last = timestamp
+            state.activity, state.user, state.role = activity, event['user'], event['role']
+        state.start = min(state.start, timestamp)
+        if activity is not None:
+            state.steps += 1
+            for feature in self.count_features.get(activity, ()):
+                state.counts[feature] = state.counts.get(feature, 0) + 1
+        if event['user'] is not None:
+            state.users.add(event['user'])
+        if event['role'] is not None:
+            state.roles.add(event['role'])
+        if event['story_points'] is not None:
+            state.story_points = event['story_points'] if state.story_points is None else max(state.story_points, event['story_points'])
+
+        closing = state.activity in self.closing_activities
+        alerts.extend(self._rule_alerts(case_id, state, final=closing))
+        if closing:
+            del self.cases[case_id]
+            state.seq = None
+            self.closed[case_id] = state
+            if len(self.closed) > self.max_closed_cases:
+                self.closed.popitem(last=False)
+            self.stats['closed'] += 1
+        else:
+            self._schedule(case_id, state)
+        return alerts
+
+    def _rule_alerts(self, case_id, state, final):
+        alerts = []
+        for i, rule in enumerate(self.rules):
+            if i in state.fired or not (final or rule['op'] in GROWING_OPS):
+                continue
+            value = state.feature(rule['column'])
+            if COMPARISONS[rule['op']](value, rule['threshold']):
+                state.fired.add(i)
+                alerts.append({
+                    'type': 'heuristic', 'case_id': case_id, 'timestamp': _time(state.last),
+                    'reason': rule['reason'], 'text': rule['text'], 'column': rule['column'],
+                    'value': round(value, 2) if isinstance(value, float) else value, 'threshold': rule['threshold'],
+                })
+        return alerts
+
+    def _schedule(self, case_id, state):
+        # One live timer per case: overdue at the current activity's limit,
+        # then expiry once the case has been idle for max_idle
+        state.seq = next(self._seq)
+        limit = self.sla.limit(state.activity, state.role, state.story_points)
+        if limit is not None and limit > 0:
+            heapq.heappush(self.timers, (state.last + datetime.timedelta(minutes=limit), state.seq, case_id, 'overdue'))
+        else:
+            heapq.heappush(self.timers, (state.last + self.max_idle, state.seq, case_id, 'expire'))
+        # Entries of cases that moved on are skipped when they come due; drop
+        # them in bulk once they outnumber the live ones
+        if len(self.timers) > 2 * len(self.cases) + 1024:
+            self.timers = [timer for timer in self.timers if self._live(timer)]
+            heapq.heapify(self.timers)
+
+    def _live(self, timer):
+        state = self.cases.get(timer[2])
+        return state is not None and state.seq == timer[1]
+
+    def due(self, now):
+        # Fire the timers due by `now`; returns the overdue alerts
+        alerts = []
+        while self.timers and self.timers[0][0] <= now:
+            timer = heapq.heappop(self.timers)
+            if not self._live(timer):
+                continue
+            deadline, seq, case_id, kind = timer
+            state = self.cases[case_id]
+            if kind == 'expire':
+                del self.cases[case_id]
+                self.stats['expired'] += 1
+                continue
+            limit = (deadline - state.last).total_seconds() / 60
+            alerts.append({
+                'type': 'overdue', 'case_id': case_id, 'timestamp': _time(deadline),
+                'activity': state.activity, 'user': state.user, 'role': state.role,
+                'since': _time(state.last), 'idle_minutes': round((now - state.last).total_seconds() / 60),
+                'sla_limit': _minutes(limit),
+            })
+            heapq.heappush(self.timers, (state.last + self.max_idle, seq, case_id, 'expire'))
+        return alerts
+
+def read_lines(path, follow, poll_seconds, lines):
+    # Reader thread: puts each line on `lines`, then None at the end of the
+    # input. A followed file is read from its end and never ends;
+    # if it shrinks (truncated or rotated) it is read again from the start.
+    if path is None:
+        for line in sys.stdin:
+            lines.put(line)
+        lines.put(None)
+        return
+    with open(path, 'r') as f:
+        if follow:
+            f.seek(0, os.SEEK_END)
+        pending = ''
+        while True:
+            chunk = f.readline()
+            if chunk:
+                pending += chunk
+                if pending.endswith('\n'):
+                    lines.put(pending)
+                    pending = ''
+                continue
+            if not follow:
+                break
+            if os.path.getsize(path) < f.tell():
+                f.seek(0)
+                pending = ''
+            time.sleep(poll_seconds)
+        if pending:
+            lines.put(pending)
+    lines.put(None)
+
+def run(monitor, lines, emit, clock='event', tick_seconds=1.0, latencies=None):
+    # Score events from the reader's queue until it ends, checking timers
+    # after every event and, when the feed is quiet, every tick. With the
+    # event clock, time is the latest event time seen (for replays); with the
+    # wall clock, it is now. Appends the per-event latencies in ms (from
+    # taking the line off the queue to emitting its alerts) to `latencies`.
+    def now():
+        return datetime.datetime.now() if clock == 'wall' else monitor.watermark
+
+    latencies = [] if latencies is None else latencies
+    while True:
+        try:
+            item = lines.get(timeout=tick_seconds)
+        except queue.Empty:
+            if now() is not None:
+                for alert in monitor.due(now()):
+                    emit(alert)
+            continue
+        if item is None:
+            break
+        received = time.perf_counter()
+        line = item
+        if not line.strip():
+            continue
+        try:
+            event = parse_event(line)
+        except (ValueError, TypeError, AttributeError) as e:
+            monitor.stats['bad_lines'] += 1
+            print(f"Skipped line: {e}", file=sys.stderr)
+            continue
+        alerts = monitor.process(event) + monitor.due(now())
+        latency = (time.perf_counter() - received) * 1000
+        latencies.append(latency)
+        for alert in alerts:
+            emit({**alert, 'latency_ms': round(latency, 3)})
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a live event feed (NDJSON on stdin or a followed file) and emit SLA-breach, heuristic and overdue alerts as NDJSON.')
+    parser.add_argument('--input', type=str, default=None, help='NDJSON file of events (default: stdin)')
+    parser.add_argument('--follow', action='store_true', help='Keep reading --input as it grows, from its current end')
+    parser.add_argument('--output', type=str, default=None, help='Append alerts to this file (default: stdout)')
+    parser.add_argument('--clock', type=str, choices=['event', 'wall'], default='event', help='Time for the overdue timers: the latest event time (replays) or the wall clock (live feeds)')
+    parser.add_argument('--sla_config', type=str, default=None, help='JSON file with per-activity, per-role and per-story-point SLA limits')
+    parser.add_argument('--rules_config', type=str, default=None, help='JSON file with custom recommendation rules and thresholds')
+    parser.add_argument('--max_cases', type=int, default=DEFAULT_MAX_CASES, help='Open cases kept; the least recently active is dropped beyond this')
+    parser.add_argument('--max_closed_cases', type=int, default=DEFAULT_MAX_CLOSED_CASES, help='Closed cases kept for reopenings; the least recently closed is dropped beyond this')
+    parser.add_argument('--max_idle_hours', type=float, default=DEFAULT_MAX_IDLE_HOURS, help='Drop a case after this long without events')
+    parser.add_argument('--tick', type=float, default=1.0, help='Seconds between timer checks while the feed is quiet')
+    parser.add_argument('--poll', type=float, default=0.2, help='With --follow, seconds between checks for new lines')
+    args = parser.parse_args()
+    if args.follow and not args.input:
+        parser.error('--follow needs --input')
+
+    rules = load_rules(args.rules_config)[0] if args.rules_config else None
+    monitor = StreamMonitor(load_sla_rules(args.sla_config), rules, args.max_cases, args.max_closed_cases, args.max_idle_hours)
+    out = open(args.output, 'a') if args.output else sys.stdout
+    counts = {}
+
+    def emit(alert):
+        counts[alert['type']] = counts.get(alert['type'], 0) + 1
+        out.write(json.dumps(alert) + '\n')
+        out.flush()
+
+    # Bounded, so a replayed file is read only as fast as it is scored
+    lines = queue.Queue(maxsize=QUEUE_SIZE)
+    threading.Thread(target=read_lines, args=(args.input, args.follow, args.poll, lines), daemon=True).start()
+    latencies = []
+    try:
+        run(monitor, lines, emit, args.clock, args.tick, latencies)
+    except KeyboardInterrupt:
+        pass
+    if args.output:
+        out.close()
+
+    # Summary on stderr, as stdout may carry the alerts
+    print(f"Events: {monitor.stats['events']} ({monitor.stats['bad_lines']} bad lines skipped), open cases: {len(monitor.cases)}, "
+          f"closed: {monitor.stats['closed']}, reopened: {monitor.stats['reopened']}, expired: {monitor.stats['expired']}, evicted: {monitor.stats['evicted']}", file=sys.stderr)
+    print(f"Alerts: {', '.join(f'{kind} {n}' for kind, n in sorted(counts.items())) or 'none'}", file=sys.stderr)
+    if latencies:
+        print(f"Latency per event: p50 {np.percentile(latencies, 50):.3f} ms, p99 {np.percentile(latencies, 99):.3f} ms", file=sys.stderr)
+    if args.output:
+        print(f"Saved: {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_backend import instrument
+from ml_backend.event_log import load_events
+from ml_backend.incremental import case_hashes, state_key
+from ml_backend.instrument import stage, timings_path
+from ml_backend.sla import default_sla_rules, load_sla_rules, sla_limit_column
+
+# Calendar-windowed process metrics. Events are binned by day or week in one
+# pass; the state kept between updates is an entry per case and window
+# (events, SLA breaches) and an entry per case (first and last event), in
+# dicts keyed by case, so new events are folded in without going back over the
+# old ones. Every series (throughput,
+# cycle time, WIP, breach rate and their rolling versions) is derived from
+# those two tables.
+
+FREQS = {'day': 'D', 'week': 'W'}
+# A case is complete once its latest event is one of these
+CLOSING_ACTIVITIES = ['Closed']
+ROLLING_WINDOWS = 4
+STATE_VERSION = 3
+
+# Span of a case not seen before: no previous event
+_NAT = np.datetime64('NaT', 'ns').view(np.int64)
+_NO_SPAN = (_NAT, _NAT, None)
+
+class WindowedMetrics:
+    # breaches=False skips the SLA checks (breaches stay 0), for callers that
+    # only read the throughput and cycle time series
+    def __init__(self, freq='week', sla_rules=None, breaches=True):
+        self.freq = freq
+        self.sla_rules = sla_rules if sla_rules is not None else default_sla_rules()
+        self.breaches = breaches
+        # (case_id, window) -> [events, breaches], and case_id -> [start, end,
+        # last_activity]; times as int64 nanoseconds
+        self.window_counts = {}
+        self.case_spans = {}
+        # Fingerprint of each case's events as of the last refresh()
+        self.hashes = None
+        # state_key of the log's columns, the window length and the SLA rules
+        # the saved state was built with; a run with other settings must not
+        # reuse it
+        self.key = None
+
+    def window_of(self, timestamps):
+        return pd.Series(timestamps).dt.to_period(FREQS[self.freq]).dt.start_time.to_numpy()
+
+    @property
+    def case_windows(self):
+        # Events and breaches per case and window
+        keys = list(self.window_counts)
+        counts = np.array(list(self.window_counts.values()), dtype=np.int64).reshape(-1, 2)
+        return pd.DataFrame({
+            'case_id': np.array([case_id for case_id, _ in keys], dtype=object),
+            'window': np.array([window for _, window in keys], dtype=np.int64).view('datetime64[ns]'),
+            'events': counts[:, 0],
+            'breaches': counts[:, 1],
+        })
+
+    @property
+    def cases(self):
+        # First and last event and last activity per case
+        spans = list(self.case_spans.values())
+        return pd.DataFrame({
+            'start': np.array([span[0] for span in spans], dtype=np.int64).view('datetime64[ns]'),
+            'end': np.array([span[1] for span in spans], dtype=np.int64).view('datetime64[ns]'),
+            'last_activity': np.array([span[2] for span in spans], dtype=object),
+        }, index=pd.Index(np.array(list(self.case_spans), dtype=object), name='case_id'))
+
+    @property
+    def windows(self):
+        # Events and breaches per window
+        return self.case_windows.groupby('window')[['events', 'breaches']].sum()
+
+    def update(self, events):
+        # Fold in new events (case_id, timestamp, activity, plus role and
+        # story_points for role/size SLA rules). A case's new events must come
+        # after the ones it already has. Only the new events are grouped; their
+        # counts are added to the state by key, so an update costs time in
+        # proportion to the new events, not to the state. Returns the number of
+        # events taken.
+        events = events[events['case_id'].notna() & events['timestamp'].notna()]
+        if events.empty:
+            return 0
+        events = events.sort_values(['case_id', 'timestamp'], kind='stable')
+        codes, labels = pd.factorize(events['case_id'].astype(object))
+        labels = np.asarray(labels, dtype=object)
+        timestamps = events['timestamp'].to_numpy(dtype='datetime64[ns]')
+        first = np.r_[True, codes[1:] != codes[:-1]]
+        last = np.r_[codes[1:] != codes[:-1], True]
+
+        counts = pd.DataFrame({
+            'case': codes,
+            'window': self.window_of(timestamps).astype('datetime64[ns]').view(np.int64),
+            'events': 1,
+        })
+        if self.breaches:
+            # Time since the case's previous event, which for a case's first
+            # new event may come from an earlier update
+            previous = np.r_[timestamps[:1], timestamps[:-1]]
+            known_end = [self.case_spans.get(case_id, _NO_SPAN)[1] for case_id in labels] if self.case_spans else _NAT
+            previous[first] = np.array(known_end, dtype=np.int64).view('datetime64[ns]')
+            minutes = (timestamps - previous) / np.timedelta64(1, 'm')
+            limit = sla_limit_column(events, self.sla_rules)
+            counts['breaches'] = ((limit > 0) & (minutes > limit)).astype(np.int64)
+        else:
+            counts['breaches'] = 0
+        counts = counts.groupby(['case', 'window'], sort=False).sum().reset_index()
+        keys = zip(labels[counts['case'].to_numpy()].tolist(), counts['window'].tolist())
+        rows = zip(counts['events'].tolist(), counts['breaches'].tolist())
+        for key, (n_events, n_breaches) in zip(keys, rows):
+            row = self.window_counts.get(key)
+            if row is None:
+                self.window_counts[key] = [n_events, n_breaches]
+            else:
+                row[0] += n_events
+                row[1] += n_breaches
+
+        # A known case keeps its start; its end and last activity move on
+        times = timestamps.view(np.int64)
+        activities = events['activity'].astype(object).to_numpy()[last].tolist()
+        for case_id, start, end, activity in zip(labels.tolist(), times[first].tolist(), times[last].tolist(), activities):
+            span = self.case_spans.get(case_id)
+            if span is None:
+                self.case_spans[case_id] = [start, end, activity]
+            else:
+                span[1] = end
+                span[2] = activity
+        return len(events)
+
+    def refresh(self, events):
+        # Bring the metrics up to date with the full log: cases whose events
+        # are new or changed since the last refresh are recomputed, cases no
+        # longer in the log are dropped and the rest are kept as they are.
+        # Returns the number of recomputed cases.
+        events = events[events['case_id'].notna()]
+        hashes = case_hashes(events)
+        if self.hashes is None:
+            changed = hashes.index
+        else:
+            old = self.hashes.reindex(hashes.index)
+            changed = hashes.index[old.isna().to_numpy() | (old.to_numpy() != hashes.to_numpy())]
+        keep = set(hashes.index.difference(changed))
+        self.case_spans = {case_id: span for case_id, span in self.case_spans.items() if case_id in keep}
+        self.window_counts = {key: row for key, row in self.window_counts.items() if key[0] in keep}
+        self.update(events[events['case_id'].isin(changed)])
+        self.hashes = hashes
+        return len(changed)
+
+    @classmethod
+    def merge(cls, parts):
+        # Metrics of logs with disjoint cases, e.g. case partitions of one log
+        merged = cls(parts[0].freq, parts[0].sla_rules, parts[0].breaches)
+        for part in parts:
+            merged.window_counts.update(part.window_counts)
+            merged.case_spans.update(part.case_spans)
+        return merged
+
+    def series(self, rolling=ROLLING_WINDOWS):
+        # One row per window from the first to the last, empty ones included.
+        # wip counts the cases started and not yet complete at a window's end.
+        windows = self.windows
+        if windows.empty:
+            return pd.DataFrame()
+        index = pd.period_range(windows.index.min(), windows.index.max(), freq=FREQS[self.freq]).start_time
+        cases = self.cases
+        closed = cases['last_activity'].isin(CLOSING_ACTIVITIES).to_numpy()
+        done = cases[closed]
+        cycle_hours = (done['end'] - done['start']).dt.total_seconds() / 3600
+
+        frame = windows.reindex(index, fill_value=0)
+        frame['started'] = pd.Series(1, index=self.window_of(cases['start'])).groupby(level=0).sum()
+        frame['completed'] = pd.Series(1, index=self.window_of(done['end'])).groupby(level=0).sum()
+        frame['cycle_hours_sum'] = pd.Series(cycle_hours.to_numpy(), index=self.window_of(done['end'])).groupby(level=0).sum()
+        frame = frame.fillna(0)
+        for col in ('started', 'completed'):
+            frame[col] = frame[col].astype(np.int64)
+        frame['wip'] = frame['started'].cumsum() - frame['completed'].cumsum()
+        frame['cycle_time_hours'] = frame['cycle_hours_sum'] / frame['completed'].where(frame['completed'] > 0)
+        frame['breach_rate'] = frame['breaches'] / frame['events'].where(frame['events'] > 0)
+
+        sums = frame[['events', 'breaches', 'completed', 'cycle_hours_sum']].rolling(rolling, min_periods=1).sum()
+        frame['rolling_throughput'] = frame['completed'].rolling(rolling, min_periods=1).mean()
+        frame['rolling_cycle_time_hours'] = sums['cycle_hours_sum'] / sums['completed'].where(sums['completed'] > 0)
+        frame['rolling_breach_rate'] = sums['breaches'] / sums['events'].where(sums['events'] > 0)
+        frame.index.name = 'window'
+        return frame
+
+    def cycle_time_trend(self):
+        # Mean cycle time of the cases completed in the later half of the
+        # windows over that of the earlier half; None without completions in
+        # both halves
+        series = self.series()
+        if len(series) < 2:
+            return None
+        half = len(series) // 2
+        earlier, later = series.iloc[:half], series.iloc[half:]
+        if earlier['completed'].sum() == 0 or later['completed'].sum() == 0:
+            return None
+        before = earlier['cycle_hours_sum'].sum() / earlier['completed'].sum()
+        after = later['cycle_hours_sum'].sum() / later['completed'].sum()
+        return after / before if before > 0 else None
+
+    def to_json(self, rolling=ROLLING_WINDOWS):
+        # Column-per-series layout: one list per metric, aligned with "windows"
+        series = self.series(rolling)
+
+        def values(col, digits=None):
+            data = series[col] if digits is None else series[col].round(digits)
+            return [None if pd.isna(v) else v for v in data.tolist()]
+
+        return {
+            'freq': self.freq,
+            'rolling_windows': rolling,
+            'windows': [window.strftime('%Y-%m-%d') for window in series.index],
+            'events': values('events'),
+            'started': values('started'),
+            'completed': values('completed'),
+            'wip': values('wip'),
+            'breaches': values('breaches'),
+            'cycle_time_hours': values('cycle_time_hours', 2),
+            'breach_rate': values('breach_rate', 4),
+            'rolling': {
+                'throughput': values('rolling_throughput', 2),
+                'cycle_time_hours': values('rolling_cycle_time_hours', 2),
+                'breach_rate': values('rolling_breach_rate', 4),
+            },
+        } if not series.empty else {'freq': self.freq, 'rolling_windows': rolling, 'windows': []}
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        pd.to_pickle({'version': STATE_VERSION, **self.__dict__}, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        state = pd.read_pickle(path)
+        if state.pop('version', None) != STATE_VERSION:
+            return None
+        metrics = cls.__new__(cls)
+        metrics.__dict__.update(state)
+        return metrics
+
+def main():
+    parser = argparse.ArgumentParser(description='Bin an event log into day or week windows and save throughput, cycle time, WIP and SLA breach series as JSON.')
+    parser.add_argument('--event_log', type=str, required=True, help='Path to event log CSV')
+    parser.add_argument('--output', type=str, default='trends.json', help='Path to save the time series JSON')
+    parser.add_argument('--freq', type=str, choices=list(FREQS), default='week', help='Window length')
+    parser.add_argument('--rolling', type=int, default=ROLLING_WINDOWS, help='Windows in each rolling series')
+    parser.add_argument('--sla_config', type=str, default=None, help='JSON file with per-activity, per-role and per-story-point SLA limits')
+    parser.add_argument('--state_path', type=str, default=None, help='Keep the window state here and recompute only the cases that are new or changed since the last run')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_from_args(args)
+
+    sla_rules = load_sla_rules(args.sla_config)
+    with stage('load_events') as record:
+        events = load_events(args.event_log)
+        record['rows'] = len(events)
+    key = state_key(events, freq=args.freq, sla_rules=sla_rules.to_json())
+    metrics = WindowedMetrics.load(args.state_path) if args.state_path and os.path.exists(args.state_path) else None
+    if metrics is None or metrics.key != key:
+        metrics = WindowedMetrics(args.freq, sla_rules)
+        metrics.key = key
+    with stage('update_windows', rows=len(events)):
+        changed = metrics.refresh(events)
+    print(f"Recomputed {changed} of {events['case_id'].nunique()} cases")
+    if args.state_path:
+        metrics.save(args.state_path)
+    with stage('write_json'), open(args.output, 'w') as f:
+        json.dump(metrics.to_json(args.rolling), f, separators=(',', ':'))
+    print(f"Saved: {args.output}")
+    instrument.finish(timings_path(args.output))
+
+if __name__ == '__main__':
+    main()
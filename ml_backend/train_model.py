@@ -1,20 +1,47 @@
 import pandas as pd
 import numpy as np
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report
-from sklearn.preprocessing import LabelEncoder
-import joblib
 import argparse
+import json
+import os
+import sys
+import time
 
-parser = argparse.ArgumentParser(description='Train a classifier on labeled Jira CSV data with feature engineering.')
-parser.add_argument('--csv_path', type=str, required=True, help='Path to labeled CSV file')
-parser.add_argument('--model_path', type=str, default='model.joblib', help='Path to save the trained model')
-parser.add_argument('--model_type', type=str, default='decision_tree', choices=['decision_tree', 'random_forest'], help='Type of model to train')
-args = parser.parse_args()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_backend import event_log, instrument
+from ml_backend.event_log import content_hash
+from ml_backend.instrument import stage, timings_path
+
+# sklearn and joblib take about a second to import, so they are imported in
+# the functions that use them: importing ml_backend (or predict.py's
+# feature_engineering) for other stages does not pay for them.
+
+# Bump when feature_engineering changes, so cached feature matrices are rebuilt
+FEATURE_VERSION = 1
+# Hyperparameters tried by --search, per model type
+SEARCH_SPACE = {
+    'decision_tree': {
+        'max_depth': [3, 5, 7, 10, None],
+        'min_samples_leaf': [1, 2, 5, 10],
+        'criterion': ['gini', 'entropy'],
+    },
+    'random_forest': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [5, 7, 10, None],
+        'min_samples_leaf': [1, 2, 5],
+        'max_features': ['sqrt', 0.5],
+    },
+}
+
+def encode_labels(encoder, values):
+    # Codes from an already fitted encoder; labels it never saw become -1
+    codes = pd.Index(encoder.classes_).get_indexer(values.astype(str))
+    return pd.Series(codes, index=values.index)
+
+def feature_engineering(df, encoders=None, feature_names=None, fitted=None):
+    # fitted: dict that receives the encoders fitted here, for columns the
+    # given encoders do not cover
+    from sklearn.preprocessing import LabelEncoder
 
-def feature_engineering(df):
     df = df.copy()
     # Example: parse durations if present
     if 'Created' in df.columns and 'Resolved' in df.columns:
@@ -25,31 +52,169 @@ def feature_engineering(df):
     # Count number of comments if present
     if 'Comments' in df.columns:
         df['NumComments'] = df['Comments'].apply(lambda x: len(str(x).split(';')) if pd.notnull(x) else 0)
-    # Encode categorical columns
-    for col in df.select_dtypes(include=['object']).columns:
+    # Encode categorical columns, with the given fitted encoders where there is one;
+    # typed frames (see event_log.load_events) encode like the raw CSV text
+    for col in df.select_dtypes(include=['object', 'category', 'datetime']).columns:
         if col != 'recommendation_label':
-            df[col] = LabelEncoder().fit_transform(df[col].astype(str))
+            if encoders and col in encoders:
+                df[col] = encode_labels(encoders[col], df[col])
+            else:
+                values = df[col].astype(str)
+                encoder = LabelEncoder().fit(values)
+                df[col] = encoder.transform(values)
+                if fitted is not None:
+                    fitted[col] = encoder
     # Fill missing values
     df = df.fillna(-1)
+    if feature_names:
+        # Ensure columns match training features
+        for col in feature_names:
+            if col not in df.columns:
+                df[col] = -1
+        df = df[feature_names]
     return df
 
-def main():
-    df = pd.read_csv(args.csv_path)
+def training_features(df):
+    # Engineered feature matrix of a labeled frame as float32 (the trees
+    # split on float32 values either way), its labels, and the fitted
+    # encoders; the bundle keeps the encoders, so prediction encodes every
+    # column exactly as training did
     if 'recommendation_label' not in df.columns:
         raise ValueError("CSV must contain a 'recommendation_label' column.")
-    df = feature_engineering(df)
+    encoders = {}
+    df = feature_engineering(df, fitted=encoders)
     X = df.drop('recommendation_label', axis=1)
-    y = df['recommendation_label']
+    return {
+        'X': X.to_numpy(dtype=np.float32),
+        'y': df['recommendation_label'].to_numpy(),
+        'features': list(X.columns),
+        'encoders': encoders,
+    }
+
+def cached_training_features(csv_path, cache_dir=None):
+    # training_features of a CSV, kept under the upload cache keyed by the
+    # file's content hash; returns the features and whether they were cached
+    import joblib
+
+    cache_dir = event_log.CACHE_DIR if cache_dir is None else cache_dir
+    if not cache_dir:
+        return training_features(pd.read_csv(csv_path)), False
+    path = os.path.join(cache_dir, 'features', f'{content_hash(csv_path)}-v{FEATURE_VERSION}.joblib')
+    if os.path.exists(path):
+        return joblib.load(path), True
+    features = training_features(pd.read_csv(csv_path))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    joblib.dump(features, tmp_path)
+    os.replace(tmp_path, path)
+    return features, False
+
+def make_model(model_type, n_jobs=None):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.tree import DecisionTreeClassifier
+
+    if model_type == 'random_forest':
+        return RandomForestClassifier(n_estimators=100, max_depth=7, random_state=42, n_jobs=n_jobs)
+    return DecisionTreeClassifier(max_depth=5, random_state=42)
+
+def search_model(model_type, X, y, candidates, cv=3, n_jobs=None):
+    # Successive halving: every candidate is scored by cross-validation on a
+    # small sample, and only the best third goes on to three times as many
+    # rows, so the budget goes to the promising settings
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+    from sklearn.model_selection import HalvingRandomSearchCV
+
+    search = HalvingRandomSearchCV(
+        make_model(model_type), SEARCH_SPACE[model_type], n_candidates=candidates, cv=cv,
+        factor=3, resource='n_samples', min_resources='smallest', random_state=42, n_jobs=n_jobs,
+    )
+    search.fit(X, y)
+    model = search.best_estimator_
+    if model_type == 'random_forest':
+        model.set_params(n_jobs=n_jobs)
+    return model, {
+        'candidates': candidates,
+        'cv': cv,
+        'iterations': int(search.n_iterations_),
+        'best_params': search.best_params_,
+        'cv_score': round(float(search.best_score_), 4),
+    }
+
+def inference_ms_per_1k(model, X, repeat=3):
+    # Best of `repeat` predictions over at least 1,000 rows
+    rows = X if len(X) >= 1000 else X.iloc[np.resize(np.arange(len(X)), 1000)]
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.predict(rows)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best / len(rows) * 1000 * 1000, 3)
+
+def train(df, model_type='decision_tree', n_jobs=None, search_candidates=0, cv=3, features=None):
+    # Returns the model bundle saved by main and the held-out classification
+    # report. features: training_features output to reuse instead of df.
+    # With search_candidates, hyperparameters are picked by a cross-validated
+    # search on the training split; bundle['training'] records the fit time,
+    # held-out accuracy and prediction latency either way.
+    from sklearn.metrics import accuracy_score, classification_report
+    from sklearn.model_selection import train_test_split
+
+    if features is None:
+        features = training_features(df)
+    X = pd.DataFrame(features['X'], columns=features['features'])
+    y = features['y']
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    if args.model_type == 'random_forest':
-        clf = RandomForestClassifier(n_estimators=100, max_depth=7, random_state=42)
+    start = time.perf_counter()
+    if search_candidates:
+        # The search refits its best candidate on the whole training split
+        clf, training = search_model(model_type, X_train, y_train, search_candidates, cv, n_jobs)
     else:
-        clf = DecisionTreeClassifier(max_depth=5, random_state=42)
-    clf.fit(X_train, y_train)
+        clf, training = make_model(model_type, n_jobs), {}
+        clf.fit(X_train, y_train)
+    training['fit_seconds'] = round(time.perf_counter() - start, 3)
     y_pred = clf.predict(X_test)
-    print(classification_report(y_test, y_pred))
-    joblib.dump({'model': clf, 'features': list(X.columns)}, args.model_path)
+    training['accuracy'] = round(float(accuracy_score(y_test, y_pred)), 4)
+    training['inference_ms_per_1k_rows'] = inference_ms_per_1k(clf, X_test)
+    training.update(model_type=model_type, train_rows=len(X_train), test_rows=len(X_test))
+    bundle = {'model': clf, 'features': features['features'], 'encoders': features['encoders'], 'training': training}
+    return bundle, classification_report(y_test, y_pred)
+
+def main():
+    parser = argparse.ArgumentParser(description='Train a classifier on labeled Jira CSV data with feature engineering.')
+    parser.add_argument('--csv_path', type=str, required=True, help='Path to labeled CSV file')
+    parser.add_argument('--model_path', type=str, default='model.joblib', help='Path to save the trained model')
+    parser.add_argument('--model_type', type=str, default='decision_tree', choices=['decision_tree', 'random_forest'], help='Type of model to train')
+    parser.add_argument('--n_jobs', type=int, default=-1, help='Cores for the random forest and the search (-1: all)')
+    parser.add_argument('--search', type=int, default=0, help='Pick hyperparameters from this many random candidates by cross-validated successive halving')
+    parser.add_argument('--cv', type=int, default=3, help='Folds for --search')
+    parser.add_argument('--no_feature_cache', action='store_true', help='Always rebuild the feature matrix instead of reusing the cached one for this CSV')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.start_from_args(args)
+
+    with stage('training_features') as record:
+        features, cached = cached_training_features(args.csv_path, '' if args.no_feature_cache else None)
+        record['rows'] = len(features['y'])
+    print(f"Feature matrix {'loaded from cache' if cached else 'built'}: {features['X'].shape[0]} rows x {features['X'].shape[1]} features")
+    with stage('train', rows=len(features['y'])):
+        bundle, report = train(None, args.model_type, args.n_jobs, args.search, args.cv, features)
+    print(report)
+    with stage('save_model'):
+        import joblib
+
+        joblib.dump(bundle, args.model_path)
     print(f"Model saved to {args.model_path}")
 
+    # Speed, accuracy and size side by side, for choosing a model to deploy
+    training = {**bundle['training'], 'model_size_mb': round(os.path.getsize(args.model_path) / (1024 * 1024), 3)}
+    for key, value in training.items():
+        print(f"{key}: {value}")
+    report_path = os.path.splitext(args.model_path)[0] + '.training.json'
+    with open(report_path, 'w') as f:
+        json.dump(training, f, indent=2)
+    print(f"Training report saved to {report_path}")
+    instrument.finish(timings_path(args.model_path))
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,169 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# File name of the saved index, next to the reports of the run that built it
+INDEX_FILE = 'variant_index.npz'
+
+class VariantIndex:
+    # Prefix trie of the cases' activity sequences, stored as flat arrays over
+    # integer-encoded activities. Node 0 is the root; every other node is a
+    # path prefix, with the number of cases that pass through it (count) and
+    # that end on it (ends). Nodes are numbered level by level, and within a
+    # level in order of first appearance, so siblings keep the order in which
+    # cases first reached them. pre/size give each node's subtree as a
+    # contiguous range of preorder positions.
+    ARRAYS = ['activities', 'case_ids', 'parent', 'label', 'depth', 'count', 'ends', 'first_end', 'case_node', 'pre', 'size']
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        # Children of every node, in sibling order
+        siblings = np.argsort(self.parent[1:], kind='stable') + 1
+        self.children = siblings
+        self.child_start = np.searchsorted(self.parent[siblings], np.arange(len(self.parent) + 1))
+
+    @classmethod
+    def from_paths(cls, paths):
+        # paths: Series of activity lists indexed by case, in case order
+        lengths = np.fromiter((len(path) for path in paths), dtype=np.int64, count=len(paths))
+        flat = list(itertools.chain.from_iterable(paths))
+        codes, activities = pd.factorize(pd.Series(flat, dtype=object), use_na_sentinel=False)
+        offsets = np.r_[0, np.cumsum(lengths)[:-1]].astype(np.int64)
+        n_codes = max(1, len(activities))
+
+        n_cases = len(lengths)
+        case_node = np.zeros(n_cases, dtype=np.int64)
+        parent, label, depth, count = [np.array([-1])], [np.array([-1])], [np.array([0])], [np.array([n_cases])]
+        n_nodes = 1
+        active = np.arange(n_cases)
+        level = 0
+        while True:
+            active = active[lengths[active] > level]
+            if not len(active):
+                break
+            # One node per distinct (parent node, activity) among the cases
+            # still running, numbered by the first case that reaches it
+            keys = case_node[active] * n_codes + codes[offsets[active] + level]
+            unique, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+            order = np.argsort(first, kind='stable')
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            parent.append(unique[order] // n_codes)
+            label.append(unique[order] % n_codes)
+            depth.append(np.full(len(order), level + 1))
+            count.append(counts[order])
+            case_node[active] = n_nodes + rank[inverse]
+            n_nodes += len(order)
+            level += 1
+
+        parent, label, depth, count = (np.concatenate(parts) for parts in (parent, label, depth, count))
+        ends = np.bincount(case_node, minlength=n_nodes)
+        first_end = np.full(n_nodes, n_cases, dtype=np.int64)
+        ended, first_case = np.unique(case_node, return_index=True)
+        first_end[ended] = first_case
+        pre, size = _preorder(parent, depth)
+        return cls(
+            activities=np.asarray(activities, dtype=object), case_ids=np.asarray(paths.index, dtype=object),
+            parent=parent, label=label, depth=depth, count=count, ends=ends, first_end=first_end,
+            case_node=case_node, pre=pre, size=size,
+        )
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        arrays['activities'] = arrays['activities'].astype(str)
+        # Numeric case ids are kept as numbers, anything else as text
+        numeric = pd.api.types.infer_dtype(arrays['case_ids']) in ('integer', 'floating')
+        arrays['case_ids'] = np.asarray(arrays['case_ids'].tolist()) if numeric else arrays['case_ids'].astype(str)
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in cls.ARRAYS}
+        arrays['activities'] = arrays['activities'].astype(object)
+        arrays['case_ids'] = np.asarray(arrays['case_ids'].tolist(), dtype=object)
+        return cls(**arrays)
+
+    def path(self, node):
+        labels = []
+        while node > 0:
+            labels.append(self.activities[self.label[node]])
+            node = self.parent[node]
+        return labels[::-1]
+
+    def top_variants(self, k):
+        # Most frequent complete paths; ties go to the variant seen first, as
+        # with Counter.most_common
+        ended = np.flatnonzero(self.ends)
+        best = ended[np.lexsort((self.first_end[ended], -self.ends[ended]))][:k]
+        return [(self.path(node), int(self.ends[node])) for node in best]
+
+    def find(self, prefix):
+        # Node of an activity prefix, or -1 if no case starts that way
+        node = 0
+        codes = {activity: code for code, activity in enumerate(self.activities)}
+        for activity in prefix:
+            if activity not in codes:
+                return -1
+            children = self.children[self.child_start[node]:self.child_start[node + 1]]
+            match = children[self.label[children] == codes[activity]]
+            if not len(match):
+                return -1
+            node = match[0]
+        return int(node)
+
+    def cases_with_prefix(self, prefix):
+        # Cases whose path starts with prefix, in case order
+        node = self.find(prefix)
+        if node < 0:
+            return []
+        position = self.pre[self.case_node]
+        inside = (position >= self.pre[node]) & (position < self.pre[node] + self.size[node])
+        return self.case_ids[inside].tolist()
+
+    def tree(self, node=0, max_depth=None):
+        # Nested {"name", "count", "children"} export of node's subtree. With
+        # max_depth, levels below it are cut off and every node carries its
+        # "id" and whether it has children, so a client can fetch deeper
+        # levels on demand with tree(id, ...).
+        names = self.activities[self.label].tolist()
+        counts = self.count.tolist()
+        children = self.children.tolist()
+        start = self.child_start.tolist()
+
+        def export(node, depth):
+            kids = children[start[node]:start[node + 1]]
+            if max_depth is not None and depth >= max_depth:
+                return [], bool(kids)
+            nodes = []
+            for kid in kids:
+                sub, more = export(kid, depth + 1)
+                entry = {"name": names[kid], "count": counts[kid], "children": sub}
+                if max_depth is not None:
+                    entry["id"] = kid
+                    entry["has_children"] = more
+                nodes.append(entry)
+            return nodes, bool(kids)
+
+        return export(node, 0)[0]
+
+def _preorder(parent, depth):
+    # Subtree sizes bottom-up, then preorder positions top-down: a node comes
+    # right after its parent plus the subtrees of its earlier siblings
+    n_nodes = len(parent)
+    size = np.ones(n_nodes, dtype=np.int64)
+    bounds = np.r_[0, np.flatnonzero(np.diff(depth)) + 1, n_nodes]
+    levels = [np.arange(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+    for nodes in reversed(levels[1:]):
+        np.add.at(size, parent[nodes], size[nodes])
+    pre = np.zeros(n_nodes, dtype=np.int64)
+    for nodes in levels[1:]:
+        nodes = nodes[np.argsort(parent[nodes], kind='stable')]
+        before = np.cumsum(size[nodes]) - size[nodes]
+        group_start = np.r_[True, parent[nodes][1:] != parent[nodes][:-1]]
+        before -= np.maximum.accumulate(np.where(group_start, before, 0))
+        pre[nodes] = pre[parent[nodes]] + 1 + before
+    return pre, size
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+ML_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(ML_BACKEND_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from ml_backend.aggregate_event_log import (
+    COUNT_ACTIVITIES,
+    aggregate_event_log,
+    aggregate_event_log_incremental,
+    aggregate_event_log_sharded,
+    aggregate_event_log_streaming,
+)
+from ml_backend.event_log import evict_cache as evict_cache_files, load_events, parse_memory_budget
+from ml_backend import analytics_store, instrument
+from ml_backend.heuristic_recommend import heuristic_recommend, load_rules
+from ml_backend.instrument import stage
+from ml_backend.predict import cached_model, predict as predict_labels
+from ml_backend.process_insights import delay_percentiles, event_log_stats, process_insights, stream_event_log_stats
+from ml_backend.variants import INDEX_FILE as VARIANT_INDEX_FILE, VariantIndex
+
+DEFAULT_MODEL_PATH = os.path.join(ML_BACKEND_DIR, 'model.joblib')
+
+# Long-lived worker for the Node routes. Requests and responses are JSON-RPC
+# 2.0 objects, one per line, on stdin/stdout:
+#   {"jsonrpc": "2.0", "id": 1, "method": "aggregate", "params": {...}}
+#   {"jsonrpc": "2.0", "id": 1, "result": {...}}
+# Jobs run in a process pool whose processes import pandas, sklearn and the
+# analytics modules and keep recently used models loaded (reloaded when the
+# file changes), so a request no longer pays interpreter startup or model
+# deserialization.
+
+# Variant indexes of the most recently queried output directories
+VARIANT_INDEX_CACHE_SIZE = 8
+_variant_indexes = OrderedDict()
+
+def _variant_index(index_path):
+    # Reloaded whenever the analytics run rewrites the file. Entries whose file
+    # is gone (the user's output was reset) are dropped, and the least recently
+    # used ones beyond VARIANT_INDEX_CACHE_SIZE.
+    for path in [path for path in _variant_indexes if not os.path.exists(path)]:
+        del _variant_indexes[path]
+    mtime = os.path.getmtime(index_path)
+    cached = _variant_indexes.get(index_path)
+    if cached is None or cached[0] != mtime:
+        _variant_indexes[index_path] = cached = (mtime, VariantIndex.load(index_path))
+    _variant_indexes.move_to_end(index_path)
+    while len(_variant_indexes) > VARIANT_INDEX_CACHE_SIZE:
+        _variant_indexes.popitem(last=False)
+    return cached[1]
+
+def _preload():
+    # Job output goes to stderr; stdout carries only protocol messages
+    sys.stdout = sys.stderr
+    import app  # noqa: F401
+    if os.path.exists(DEFAULT_MODEL_PATH):
+        cached_model(DEFAULT_MODEL_PATH)
+
+def _load_events(csv_path):
+    with stage('load_events') as record:
+        df = load_events(csv_path)
+        record['rows'] = len(df)
+    return df
+
+def _read_csv(csv_path):
+    with stage('read_csv') as record:
+        df = pd.read_csv(csv_path)
+        record['rows'] = len(df)
+    return df
+
+def aggregate(csv_path, output_path='aggregated_data.csv', memory_budget=None, count_activities=None, extra_features=False, state_path=None, workers=None):
+    count_activities = count_activities or COUNT_ACTIVITIES
+    if memory_budget:
+        with stage('aggregate_event_log_streaming'):
+            agg = aggregate_event_log_streaming(csv_path, parse_memory_budget(str(memory_budget)), count_activities, extra_features)
+    else:
+        df = _load_events(csv_path)
+        with stage('aggregate_event_log', rows=len(df)):
+            if state_path:
+                agg = aggregate_event_log_incremental(df, state_path, count_activities, extra_features, workers)
+            elif workers and workers > 1:
+                agg = aggregate_event_log_sharded(df, workers, count_activities, extra_features)
+            else:
+                agg = aggregate_event_log(df, count_activities, extra_features)
+    with stage('write_csv', rows=len(agg)):
+        agg.to_csv(output_path, index=False)
+    return {'output_path': output_path, 'cases': len(agg)}
+
+def recommend(agg_csv, output_csv='heuristic_recommendations.csv', rules_config=None):
+    rules, default = load_rules(rules_config) if rules_config else (None, None)
+    df = _read_csv(agg_csv)
+    with stage('heuristic_recommend', rows=len(df)):
+        df = heuristic_recommend(df, rules, default)
+    with stage('write_csv', rows=len(df)):
+        df.to_csv(output_csv, index=False)
+    return {'output_path': output_csv}
+
+def insights(agg_csv, event_log, output_txt='process_insights.txt', memory_budget=None, percentiles_csv=None):
+    if memory_budget:
+        with stage('event_log_stats_streaming'):
+            stats = stream_event_log_stats(event_log, parse_memory_budget(str(memory_budget)))
+    else:
+        events = _load_events(event_log)
+        with stage('event_log_stats', rows=len(events)):
+            stats = event_log_stats(events)
+    agg = _read_csv(agg_csv)
+    with stage('process_insights', rows=len(agg)):
+        lines = process_insights(agg, stats=stats)
+    with stage('write_text', rows=len(lines)), open(output_txt, 'w') as f:
+        for line in lines:
+            f.write(line + '\n')
+    if percentiles_csv:
+        with stage('delay_percentiles'):
+            delay_percentiles(stats).to_csv(percentiles_csv, index=False)
+    return {'output_path': output_txt}
+
+def predict(csv_path, model_path=DEFAULT_MODEL_PATH, output_csv='predictions_with_recommendations.csv', mmap=False):
+    df = _read_csv(csv_path)
+    with stage('load_model'):
+        bundle = cached_model(model_path, 'r' if mmap else None)
+    with stage('predict', rows=len(df)):
+        df['predicted_recommendation'] = predict_labels(df, bundle)
+    with stage('write_csv', rows=len(df)):
+        df.to_csv(output_csv, index=False)
+    return {'output_path': output_csv}
+
+def analytics(csv_path=None, only=None, sla_config=None, state_path=None, output_dir=None, workers=None, report_format='json', store_dir=None):
+    import app
+    from ml_backend.sla import load_sla_rules
+
+    if csv_path is None:
+        with open(os.path.join('uploads', 'latest.txt'), 'r') as f:
+            csv_path = f.read().strip()
+    with stage('load_log'):
+        df = app.load_log(csv_path)
+    if df is None:
+        raise RuntimeError(f"Could not load event log: {csv_path}")
+    app.run_reports(df, only, load_sla_rules(sla_config), state_path, output_dir or app.OUTPUT_DIR, workers, report_format, store_dir)
+    return {'reports': only or list(app.REPORTS)}
+
+def query_cases(output_dir, **filters):
+    # Cases of the user's last analytics run, from the store it saved
+    return analytics_store.query_cases(analytics_store.read_pointer(output_dir), **filters)
+
+def query_table(output_dir, table, **filters):
+    return {'rows': analytics_store.query_table(analytics_store.read_pointer(output_dir), table, **filters)}
+
+def path_tree(output_dir, node=0, depth=2):
+    # One level range of the variant tree of the user's last analytics run
+    # (app.py's path_tree report saves the index next to the reports); nodes
+    # carry ids for fetching deeper
+    return {'nodes': _variant_index(os.path.join(output_dir, VARIANT_INDEX_FILE)).tree(int(node), int(depth))}
+
+def variant_cases(output_dir, prefix):
+    # Cases whose path starts with the given activities
+    return {'cases': _variant_index(os.path.join(output_dir, VARIANT_INDEX_FILE)).cases_with_prefix(prefix)}
+
+def evict_cache(max_size=None, max_age_days=None):
+    # Keep the cache directory within its size and age limits
+    return {'removed': evict_cache_files(max_size=max_size, max_age_days=max_age_days)}
+
+METHODS = {
+    'aggregate': aggregate,
+    'recommend': recommend,
+    'insights': insights,
+    'predict': predict,
+    'analytics': analytics,
+    'query_cases': query_cases,
+    'query_table': query_table,
+    'path_tree': path_tree,
+    'variant_cases': variant_cases,
+    'evict_cache': evict_cache,
+}
+
+def run_job(method, params, timings=False, profile_dir=None):
+    # With timings (or a profile_dir), the result carries the job's per-stage
+    # timing records under "timings"
+    if not (timings or profile_dir):
+        return METHODS[method](**params)
+    instrument.start(profile_dir)
+    try:
+        with stage(method):
+            result = METHODS[method](**params)
+    finally:
+        records = instrument.stop()
+    return {**result, 'timings': records}
+
+def serve(pool_size, stdin=sys.stdin, stdout=sys.stdout):
+    lock = threading.Lock()
+
+    def respond(message):
+        with lock:
+            stdout.write(json.dumps({'jsonrpc': '2.0', **message}) + '\n')
+            stdout.flush()
+
+    def error(request_id, message, details=None):
+        respond({'id': request_id, 'error': {'message': message, 'data': details}})
+
+    def on_done(request_id, future):
+        try:
+            respond({'id': request_id, 'result': future.result()})
+        except Exception as e:
+            error(request_id, str(e), ''.join(traceback.format_exception(e)))
+
+    with ProcessPoolExecutor(max_workers=pool_size, initializer=_preload) as pool:
+        for line in stdin:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                error(None, f"Invalid request: {e}")
+                continue
+            request_id = request.get('id')
+            method = request.get('method')
+            if method == 'ping':
+                respond({'id': request_id, 'result': 'pong'})
+            elif method not in METHODS:
+                error(request_id, f"Unknown method: {method}")
+            else:
+                params = dict(request.get('params') or {})
+                timings = params.pop('timings', False)
+                profile_dir = params.pop('profile_dir', None)
+                future = pool.submit(run_job, method, params, timings, profile_dir)
+                future.add_done_callback(lambda f, request_id=request_id: on_done(request_id, f))
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve ml_backend pipeline stages as JSON-RPC jobs over stdin/stdout.')
+    parser.add_argument('--pool_size', type=int, default=int(os.environ.get('PY_WORKER_POOL_SIZE', 2)), help='Number of worker processes')
+    args = parser.parse_args()
+    serve(args.pool_size)
+
+if __name__ == '__main__':
+    main()
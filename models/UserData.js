@@ -16,6 +16,8 @@ const userDataSchema = new mongoose.Schema({
   userDelays: { type: Schema.Types.Mixed, default: {} },
   casePaths: { type: [Schema.Types.Mixed], default: [] },
   pathTree: { type: [Schema.Types.Mixed], default: [] },
+  processGraph: { type: Schema.Types.Mixed, default: {} },
+  trends: { type: Schema.Types.Mixed, default: {} },
   updatedAt: { type: Date, default: Date.now }
 });
 
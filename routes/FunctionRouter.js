@@ -1,29 +1,124 @@
 const express = require("express");
-const { exec } = require("child_process");
+const fs = require("fs");
 const path = require("path");
+const auth = require("../middleware/auth");
+const pythonWorker = require("../services/pythonWorker");
+const { outputDirFor, PAGED_REPORTS } = require("./UploadRoute");
 
 const router = express.Router();
 
-router.get("/runFile", (req, res) => {
-  const scriptPath = `"${path.join(__dirname, "..", "app.py")}"`; 
-  const command = `python ${scriptPath}`; 
-
-  exec(command, (error, stdout, stderr) => {
-    if (error) {
-      console.error(`Execution error: ${error.message}`);
-      return res.status(500).json({ error: "Failed to run Python script." });
-    }
-
-    if (stderr) {
-      console.error(`stderr: ${stderr}`);
-    }
-
-    console.log(`stdout: ${stdout}`);
+router.get("/runFile", async (req, res) => {
+  try {
+    // Full analytics (app.py reports) for uploads/latest.txt on the persistent worker
+    const result = await pythonWorker.call("analytics");
     res.json({
       message: "Python script executed successfully.",
-      output: stdout.trim(),
+      output: result,
     });
-  });
+  } catch (error) {
+    console.error(`Execution error: ${error.message}`);
+    if (error.details) console.error(error.details);
+    return res.status(500).json({ error: "Failed to run Python script." });
+  }
+});
+
+// Variant tree a few levels at a time: /run/pathTree?node=<id>&depth=2 returns
+// the levels below node (the root by default), each node with the id to
+// request next
+router.get("/pathTree", auth, async (req, res) => {
+  try {
+    const result = await pythonWorker.call("path_tree", {
+      node: Number(req.query.node || 0),
+      depth: Number(req.query.depth || 2),
+      output_dir: outputDirFor(req.user.userId),
+    });
+    res.json(result);
+  } catch (error) {
+    console.error(`Path tree error: ${error.message}`);
+    return res.status(500).json({ error: "Failed to load path tree." });
+  }
+});
+
+// Cases whose path starts with a prefix: /run/variantCases?prefix=Created,Assigned,Reopened
+router.get("/variantCases", auth, async (req, res) => {
+  const prefix = String(req.query.prefix || "").split(",").map((s) => s.trim()).filter(Boolean);
+  try {
+    res.json(await pythonWorker.call("variant_cases", { output_dir: outputDirFor(req.user.userId), prefix }));
+  } catch (error) {
+    console.error(`Variant cases error: ${error.message}`);
+    return res.status(500).json({ error: "Failed to query variants." });
+  }
+});
+
+// Cases of the user's last upload, from its analytics store:
+// /run/cases?role=QA&breached=true&since=2025-03-01&until=2025-03-31
+// Also user, activity, prefix (comma-separated activities), order_by,
+// descending, limit and offset.
+router.get("/cases", auth, async (req, res) => {
+  const q = req.query;
+  const params = { output_dir: outputDirFor(req.user.userId) };
+  for (const key of ["role", "user", "activity", "since", "until", "order_by"]) {
+    if (q[key] !== undefined) params[key] = String(q[key]);
+  }
+  if (q.breached !== undefined) params.breached = q.breached === "true";
+  if (q.descending !== undefined) params.descending = q.descending === "true";
+  if (q.prefix) params.prefix = String(q.prefix).split(",").map((s) => s.trim()).filter(Boolean);
+  params.limit = Math.min(Number(q.limit) || 100, 1000);
+  params.offset = Number(q.offset) || 0;
+  try {
+    res.json(await pythonWorker.call("query_cases", params));
+  } catch (error) {
+    console.error(`Case query error: ${error.message}`);
+    return res.status(500).json({ error: "Failed to query cases." });
+  }
+});
+
+// Per-user, per-activity and violation rows of the analytics store:
+// /run/stats/users?role=QA, /run/stats/activities, /run/stats/violations?case_id=TKT00001
+router.get("/stats/:table", auth, async (req, res) => {
+  const { table } = req.params;
+  if (!["users", "activities", "violations"].includes(table)) {
+    return res.status(404).json({ error: `No table named ${table}.` });
+  }
+  const filters = {};
+  for (const key of ["user", "role", "activity", "case_id"]) {
+    if (req.query[key] !== undefined) filters[key] = String(req.query[key]);
+  }
+  try {
+    res.json(await pythonWorker.call("query_table", { output_dir: outputDirFor(req.user.userId), table, ...filters }));
+  } catch (error) {
+    console.error(`Stats query error: ${error.message}`);
+    return res.status(500).json({ error: "Failed to query analytics store." });
+  }
+});
+
+// /run/reportPages/case_paths returns the report's index (total, page_size,
+// page files and summary fields); /run/reportPages/case_paths?page=3 returns
+// that page's records, so clients never fetch the whole document
+router.get("/reportPages/:report", auth, (req, res) => {
+  const report = req.params.report;
+  if (!PAGED_REPORTS.includes(report)) {
+    return res.status(404).json({ error: `No paged report named ${report}.` });
+  }
+  const dir = path.join(outputDirFor(req.user.userId), report);
+  const indexPath = path.join(dir, "index.json");
+  if (!fs.existsSync(indexPath)) {
+    return res.status(404).json({ error: "Report has not been generated in pages." });
+  }
+  if (req.query.page === undefined) {
+    return res.sendFile(path.resolve(indexPath));
+  }
+  try {
+    const index = JSON.parse(fs.readFileSync(indexPath, "utf8"));
+    const page = Number(req.query.page);
+    if (!Number.isInteger(page) || page < 0 || page >= index.pages.length) {
+      return res.status(400).json({ error: `Page must be between 0 and ${index.pages.length - 1}.` });
+    }
+    res.sendFile(path.resolve(dir, index.pages[page].file));
+  } catch (error) {
+    console.error(`Report page error: ${error.message}`);
+    return res.status(500).json({ error: "Failed to read report page." });
+  }
 });
 
 module.exports = router;
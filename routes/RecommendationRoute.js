@@ -63,4 +63,26 @@ router.get('/case-paths', auth, async (req, res) => {
   }
 });
 
+// Route to fetch the directly-follows graph (activity and role edges)
+router.get('/process-graph', auth, async (req, res) => {
+  try {
+    const data = await UserData.findOne({ user: req.user.userId }).lean();
+    if (!data) return res.status(404).json({ error: 'No process graph found for user' });
+    res.json(data.processGraph || {});
+  } catch (err) {
+    res.status(500).json({ error: err.message });
+  }
+});
+
+// Route to fetch weekly throughput, cycle time, WIP and SLA breach series
+router.get('/trends', auth, async (req, res) => {
+  try {
+    const data = await UserData.findOne({ user: req.user.userId }).lean();
+    if (!data) return res.status(404).json({ error: 'No trends found for user' });
+    res.json(data.trends || {});
+  } catch (err) {
+    res.status(500).json({ error: err.message });
+  }
+});
+
 module.exports = router;
@@ -2,13 +2,50 @@ const express = require("express");
 const multer = require("multer");
 const path = require("path");
 const fs = require("fs");
-const { exec } = require("child_process");
 const auth = require('../middleware/auth');
 const UserData = require('../models/UserData');
 const csv = require('csv-parser');
+const pythonWorker = require('../services/pythonWorker');
 
 const router = express.Router();
 
+// Files each upload writes to the user's output directory
+const REPORT_FILES = [
+  'cleaned_log.csv',
+  'common_paths.json',
+  'step_durations.json',
+  'user_delays.json',
+  'path_tree.json',
+  'process_graph.json',
+  'trends.json'
+];
+// Reports written as JSON pages (report_format 'pages'). The page directories
+// stay in the output directory for /run/reportPages to serve; the user's data
+// keeps the whole record lists, rebuilt from the pages, as before.
+const PAGED_REPORTS = ['case_durations', 'sla_violations', 'case_paths'];
+const INTERMEDIATE_FILES = ['aggregated_data.csv', 'heuristic_recommendations.csv', 'process_insights.txt'];
+
+function outputDirFor(userId) {
+  return path.join(__dirname, "..", "output", "users", String(userId));
+}
+
+// Per-user case state, so a re-upload only recomputes new or changed cases
+function stateFilesFor(userId) {
+  const stateDir = path.join(__dirname, "..", "cache", "state");
+  return {
+    aggregate: path.join(stateDir, `${userId}-aggregate.pkl`),
+    analytics: path.join(stateDir, `${userId}-analytics.pkl`)
+  };
+}
+
+// A paged report's index and all of its records, in page order
+function readPagedReport(userOutputDir, report) {
+  const dir = path.join(userOutputDir, report);
+  const index = JSON.parse(fs.readFileSync(path.join(dir, 'index.json'), 'utf-8'));
+  const records = index.pages.flatMap(page => JSON.parse(fs.readFileSync(path.join(dir, page.file), 'utf-8')));
+  return { index, records };
+}
+
 // Set up multer for file uploads
 const storage = multer.diskStorage({
   destination: function (req, file, cb) {
@@ -30,145 +67,143 @@ router.post("/upload_csv", auth, upload.single("csvfile"), async (req, res) => {
   const latestPath = path.join(__dirname, "..", "uploads", "latest.txt");
   fs.writeFileSync(latestPath, req.file.path, "utf-8");
 
-  // Run aggregation and recommendation pipeline
-  const aggScript = path.join(__dirname, "..", "ml_backend", "aggregate_event_log.py");
-  const recScript = path.join(__dirname, "..", "ml_backend", "heuristic_recommend.py");
-  const insightsScript = path.join(__dirname, "..", "ml_backend", "process_insights.py");
-  const aggOutput = path.join(__dirname, "..", "ml_backend", "aggregated_data.csv");
-  const recOutput = path.join(__dirname, "..", "ml_backend", "heuristic_recommendations.csv");
-  const insightsOutput = path.join(__dirname, "..", "ml_backend", "process_insights.txt");
+  // Run aggregation and recommendation pipeline. Every user gets their own
+  // output directory, so concurrent uploads do not overwrite each other.
+  const userOutputDir = outputDirFor(req.user.userId);
+  fs.mkdirSync(userOutputDir, { recursive: true });
+  const aggOutput = path.join(userOutputDir, "aggregated_data.csv");
+  const recOutput = path.join(userOutputDir, "heuristic_recommendations.csv");
+  const insightsOutput = path.join(userOutputDir, "process_insights.txt");
+  const { aggregate: aggState, analytics: analyticsState } = stateFilesFor(req.user.userId);
+  // Queryable tables of each analysed upload, shared by uploads with the same content
+  const storeDir = path.join(__dirname, "..", "cache", "analytics");
 
-  // Run aggregation first, then recommendation, then insights
-  exec(`python "${aggScript}" --csv_path "${req.file.path}" --output_path "${aggOutput}"`, (err, stdout, stderr) => {
-    if (err) {
-      return res.status(500).json({ error: "Aggregation failed", details: stderr });
-    }
-    exec(`python "${recScript}" --agg_csv "${aggOutput}" --output_csv "${recOutput}"`, (err2, stdout2, stderr2) => {
-      if (err2) {
-        return res.status(500).json({ error: "Recommendation failed", details: stderr2 });
-      }
-      // FIX: Add event_log argument for process_insights.py
-      exec(`python "${insightsScript}" --agg_csv "${aggOutput}" --event_log "${req.file.path}" --output_txt "${insightsOutput}"`, async (err3, stdout3, stderr3) => {
-        if (err3) {
-          return res.status(500).json({ error: "Insights generation failed", details: stderr3 });
+  // Run aggregation first, then recommendation, then insights, as jobs on the
+  // persistent Python worker
+  try {
+    await pythonWorker.call("aggregate", { csv_path: req.file.path, output_path: aggOutput, state_path: aggState });
+  } catch (err) {
+    return res.status(500).json({ error: "Aggregation failed", details: err.details || err.message });
+  }
+  try {
+    await pythonWorker.call("recommend", { agg_csv: aggOutput, output_csv: recOutput });
+  } catch (err) {
+    return res.status(500).json({ error: "Recommendation failed", details: err.details || err.message });
+  }
+  try {
+    await pythonWorker.call("insights", { agg_csv: aggOutput, event_log: req.file.path, output_txt: insightsOutput });
+  } catch (err) {
+    return res.status(500).json({ error: "Insights generation failed", details: err.details || err.message });
+  }
+
+  // Parse recommendations CSV
+  let recs;
+  try {
+    recs = await new Promise((resolve, reject) => {
+      const rows = [];
+      fs.createReadStream(recOutput)
+        .pipe(csv())
+        .on('data', (row) => rows.push(row))
+        .on('error', reject)
+        .on('end', () => resolve(rows));
+    });
+  } catch (err) {
+    console.error('Error parsing recommendations CSV', err);
+    return res.status(500).json({ error: 'Failed to parse recommendation CSV', details: err.message });
+  }
+
+  // Generate analytics JSON files via app.py
+  try {
+    await pythonWorker.call("analytics", { csv_path: req.file.path, state_path: analyticsState, output_dir: userOutputDir, store_dir: storeDir, report_format: 'pages' });
+  } catch (appErr) {
+    console.error('Error running app.py for JSON outputs', appErr.details || appErr.message);
+  }
+
+  // Now proceed to upsert including JSON analytics
+  try {
+    const text = fs.readFileSync(insightsOutput, 'utf-8');
+    // Parse insights text into sections
+    const process = [];
+    const user = [];
+    const activity = [];
+    let section = null;
+    text.split(/\r?\n/).forEach(line => {
+      if (line.includes('--- Process-level Insights')) section = process;
+      else if (line.includes('--- User-level Insights')) section = user;
+      else if (line.includes('--- Activity-level Insights')) section = activity;
+      else if (line.trim() && section) section.push(line.trim());
+    });
+    // Read analytics JSON files
+    let commonPaths = [];
+    let stepDurations = [];
+    let caseDurations = {};
+    let slaViolations = [];
+    let userDelays = {};
+    let pathTree = [];
+    let casePaths = [];
+    let processGraph = {};
+    let trends = {};
+    try { commonPaths = JSON.parse(fs.readFileSync(path.join(userOutputDir, 'common_paths.json'), 'utf-8')); } catch {}
+    try { stepDurations = JSON.parse(fs.readFileSync(path.join(userOutputDir, 'step_durations.json'), 'utf-8')); } catch {}
+    try {
+      const { index, records } = readPagedReport(userOutputDir, 'case_durations');
+      caseDurations = { cases: records, slowest_case: index.slowest_case };
+    } catch {}
+    try { slaViolations = readPagedReport(userOutputDir, 'sla_violations').records; } catch {}
+    try { userDelays = JSON.parse(fs.readFileSync(path.join(userOutputDir, 'user_delays.json'), 'utf-8')); } catch {}
+    try { pathTree = JSON.parse(fs.readFileSync(path.join(userOutputDir, 'path_tree.json'), 'utf-8'));  } catch {}
+    try { casePaths = readPagedReport(userOutputDir, 'case_paths').records; } catch {}
+    try { processGraph = JSON.parse(fs.readFileSync(path.join(userOutputDir, 'process_graph.json'), 'utf-8')); } catch {}
+    try { trends = JSON.parse(fs.readFileSync(path.join(userOutputDir, 'trends.json'), 'utf-8')); } catch {}
+    // Build payload
+    const payload = {
+      recommendations: recs,
+      insights: { process, user, activity },
+      commonPaths,
+      stepDurations,
+      caseDurations,
+      slaViolations,
+      userDelays,
+      pathTree,
+      casePaths,
+      processGraph,
+      trends,
+      updatedAt: new Date()
+    };
+    console.log('UploadRoute: upserting with full payload', payload);
+    UserData.findOneAndUpdate({ user: req.user.userId }, payload, { upsert: true, new: true })
+      .then(result => {
+        res.json({ message: 'CSV uploaded and data saved', data: result });
+        // Cleanup uploaded CSV and latest.txt
+        try {
+          if (fs.existsSync(req.file.path)) fs.unlinkSync(req.file.path);
+          const latestFile = path.join(__dirname, '..', 'uploads', 'latest.txt');
+          if (fs.existsSync(latestFile)) fs.unlinkSync(latestFile);
+        } catch (err) {
+          console.error('Cleanup error (uploads):', err);
         }
+        // Cleanup output JSON and CSV files and ml_backend intermediates
         try {
-          // Parse recommendations CSV
-          const recs = [];
-          fs.createReadStream(recOutput)
-            .pipe(csv())
-            .on('data', (row) => recs.push(row))
-            .on('error', err => {
-              console.error('Error parsing recommendations CSV', err);
-              return res.status(500).json({ error: 'Failed to parse recommendation CSV', details: err.message });
-            })
-            .on('end', async () => {
-              // Generate analytics JSON files via app.py
-              exec(`python "${path.join(__dirname, '..', 'app.py')}"`, (appErr, appStdout, appStderr) => {
-                if (appErr) console.error('Error running app.py for JSON outputs', appStderr);
-                // Now proceed to upsert including JSON analytics
-                try {
-                  const text = fs.readFileSync(insightsOutput, 'utf-8');
-                  // Parse insights text into sections
-                  const process = [];
-                  const user = [];
-                  const activity = [];
-                  let section = null;
-                  text.split(/\r?\n/).forEach(line => {
-                    if (line.includes('--- Process-level Insights')) section = process;
-                    else if (line.includes('--- User-level Insights')) section = user;
-                    else if (line.includes('--- Activity-level Insights')) section = activity;
-                    else if (line.trim() && section) section.push(line.trim());
-                  });
-                  // Read analytics JSON files
-                  let commonPaths = [];
-                  let stepDurations = [];
-                  let caseDurations = {};
-                  let slaViolations = [];
-                  let userDelays = {};
-                  let pathTree = [];
-                  let casePaths = [];
-                  try { commonPaths = JSON.parse(fs.readFileSync(path.join(__dirname, '..', 'output', 'common_paths.json'), 'utf-8')); } catch {}
-                  try { stepDurations = JSON.parse(fs.readFileSync(path.join(__dirname, '..', 'output', 'step_durations.json'), 'utf-8')); } catch {}
-                  try { caseDurations = JSON.parse(fs.readFileSync(path.join(__dirname, '..', 'output', 'case_durations.json'), 'utf-8')); } catch {}
-                  try { slaViolations = JSON.parse(fs.readFileSync(path.join(__dirname, '..', 'output', 'sla_violations.json'), 'utf-8')); } catch {}
-                  try { userDelays = JSON.parse(fs.readFileSync(path.join(__dirname, '..', 'output', 'user_delays.json'), 'utf-8')); } catch {}
-                  try { pathTree = JSON.parse(fs.readFileSync(path.join(__dirname, '..', 'output', 'path_tree.json'), 'utf-8'));  } catch {}
-                  try { casePaths = JSON.parse(fs.readFileSync(path.join(__dirname, '..', 'output', 'case_paths.json'), 'utf-8')); } catch {}
-                  // Build payload
-                  const payload = {
-                    recommendations: recs,
-                    insights: { process, user, activity },
-                    commonPaths,
-                    stepDurations,
-                    caseDurations,
-                    slaViolations,
-                    userDelays,
-                    pathTree,
-                    casePaths,
-                    updatedAt: new Date()
-                  };
-                  console.log('UploadRoute: upserting with full payload', payload);
-                  UserData.findOneAndUpdate({ user: req.user.userId }, payload, { upsert: true, new: true })
-                    .then(result => {
-                      res.json({ message: 'CSV uploaded and data saved', data: result });
-                      // Cleanup uploaded CSV and latest.txt
-                      try {
-                        if (fs.existsSync(req.file.path)) fs.unlinkSync(req.file.path);
-                        const latestFile = path.join(__dirname, '..', 'uploads', 'latest.txt');
-                        if (fs.existsSync(latestFile)) fs.unlinkSync(latestFile);
-                      } catch (err) {
-                        console.error('Cleanup error (uploads):', err);
-                      }
-                      // Cleanup output JSON and CSV files
-                      try {
-                        const outputDir = path.join(__dirname, '..', 'output');
-                        const filesToDelete = [
-                          'cleaned_log.csv',
-                          'common_paths.json',
-                          'step_durations.json',
-                          'case_durations.json',
-                          'sla_violations.json',
-                          'user_delays.json',
-                          'path_tree.json',
-                          'case_paths.json'
-                        ];
-                        filesToDelete.forEach(filename => {
-                          const filePath = path.join(outputDir, filename);
-                          if (fs.existsSync(filePath)) {
-                            fs.unlinkSync(filePath);
-                          }
-                        });
-                      } catch (err) {
-                        console.error('Cleanup error (output):', err);
-                      }
-                      // Cleanup ml_backend intermediate files
-                      try {
-                        const mlBackendDir = path.join(__dirname, '..', 'ml_backend');
-                        ['aggregated_data.csv', 'heuristic_recommendations.csv', 'process_insights.txt'].forEach(fn => {
-                          const fp = path.join(mlBackendDir, fn);
-                          if (fs.existsSync(fp)) fs.unlinkSync(fp);
-                        });
-                      } catch (err) {
-                        console.error('Cleanup error (ml_backend):', err);
-                      }
-                    })
-                     .catch(dbErr => {
-                       console.error('DB upsert error', dbErr);
-                       res.status(500).json({ error: 'DB upsert failed', details: dbErr.message });
-                     });
-                } catch (e) {
-                  console.error('UploadRoute processing error', e);
-                  res.status(500).json({ error: 'Error processing upload', details: e.message });
-                }
-              });
-            });
-        } catch (e) {
-          return res.status(500).json({ error: 'Failed to save user data', details: e.message });
+          [...REPORT_FILES, ...INTERMEDIATE_FILES].forEach(filename => {
+            const filePath = path.join(userOutputDir, filename);
+            if (fs.existsSync(filePath)) fs.unlinkSync(filePath);
+          });
+        } catch (err) {
+          console.error('Cleanup error (output):', err);
         }
+        // Keep cache/ within its size and age limits
+        pythonWorker.call("evict_cache").catch(err => {
+          console.error('Cleanup error (cache):', err.details || err.message);
+        });
+      })
+       .catch(dbErr => {
+         console.error('DB upsert error', dbErr);
+         res.status(500).json({ error: 'DB upsert failed', details: dbErr.message });
        });
-    });
-  });
+  } catch (e) {
+    console.error('UploadRoute processing error', e);
+    res.status(500).json({ error: 'Error processing upload', details: e.message });
+  }
 });
 
 // DELETE endpoint to clear user data and files
@@ -181,32 +216,13 @@ router.delete('/reset', auth, async (req, res) => {
     fs.readdirSync(uploadsDir).forEach(file => {
       fs.unlinkSync(path.join(uploadsDir, file));
     });
-    // Clear output analytics files
-    try {
-      const outputDir = path.join(__dirname, '..', 'output');
-      const filesToDelete = [
-        'cleaned_log.csv',
-        'common_paths.json',
-        'step_durations.json',
-        'case_durations.json',
-        'sla_violations.json',
-        'user_delays.json',
-        'path_tree.json',
-        'case_paths.json'
-      ];
-      filesToDelete.forEach(filename => {
-        const filePath = path.join(outputDir, filename);
-        if (fs.existsSync(filePath)) fs.unlinkSync(filePath);
-      });
-    } catch (err) {
-      console.error('Cleanup error (output files) in reset:', err);
-    }
-     // Clear ml_backend output files
-     const mlDir = path.join(__dirname, '..', 'ml_backend');
-     ['aggregated_data.csv', 'heuristic_recommendations.csv', 'process_insights.txt'].forEach(filename => {
-       const filePath = path.join(mlDir, filename);
-       if (fs.existsSync(filePath)) fs.unlinkSync(filePath);
-     });
+    // Clear this user's case state. Parsed uploads and analytics stores are
+    // keyed by content hash and may be shared with other users, so they are
+    // left to evict_cache.
+    Object.values(stateFilesFor(req.user.userId)).forEach(file => fs.rmSync(file, { force: true }));
+    const userOutputDir = outputDirFor(req.user.userId);
+    // Clear this user's output directory (reports, intermediates, variant index)
+    fs.rmSync(userOutputDir, { recursive: true, force: true });
     res.json({ message: 'User data and files reset successful' });
   } catch (err) {
     res.status(500).json({ error: 'Failed to reset user data', details: err.message });
@@ -214,3 +230,5 @@ router.delete('/reset', auth, async (req, res) => {
 });
 
 module.exports = router;
+module.exports.outputDirFor = outputDirFor;
+module.exports.PAGED_REPORTS = PAGED_REPORTS;
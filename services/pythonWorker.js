@@ -0,0 +1,61 @@
+const { spawn } = require("child_process");
+const path = require("path");
+const readline = require("readline");
+
+// Client for ml_backend/worker.py: one long-lived Python process (with its own
+// pool of job processes) instead of a fresh interpreter per pipeline step.
+const WORKER_SCRIPT = path.join(__dirname, "..", "ml_backend", "worker.py");
+const POOL_SIZE = process.env.PY_WORKER_POOL_SIZE || "2";
+
+let worker = null;
+let nextId = 1;
+const pending = new Map();
+
+function start() {
+  const proc = spawn("python", [WORKER_SCRIPT, "--pool_size", String(POOL_SIZE)], {
+    cwd: path.join(__dirname, ".."),
+    stdio: ["pipe", "pipe", "inherit"],
+  });
+
+  readline.createInterface({ input: proc.stdout }).on("line", (line) => {
+    let message;
+    try {
+      message = JSON.parse(line);
+    } catch {
+      return console.error("pythonWorker: unexpected output", line);
+    }
+    const job = pending.get(message.id);
+    if (!job) return;
+    pending.delete(message.id);
+    if (message.error) {
+      const err = new Error(message.error.message);
+      err.details = message.error.data;
+      job.reject(err);
+    } else {
+      job.resolve(message.result);
+    }
+  });
+
+  proc.on("exit", (code) => {
+    console.error("pythonWorker: exited with code", code);
+    if (worker === proc) worker = null;
+    for (const job of pending.values()) job.reject(new Error("Python worker exited"));
+    pending.clear();
+  });
+
+  return proc;
+}
+
+// Run a job ("aggregate", "recommend", "insights", "predict", "analytics",
+// "path_tree", "variant_cases", "evict_cache") and resolve
+// with its result; the worker is (re)started on demand.
+function call(method, params = {}) {
+  if (!worker) worker = start();
+  const id = nextId++;
+  return new Promise((resolve, reject) => {
+    pending.set(id, { resolve, reject });
+    worker.stdin.write(JSON.stringify({ jsonrpc: "2.0", id, method, params }) + "\n");
+  });
+}
+
+module.exports = { call };
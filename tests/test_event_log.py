@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from ml_backend import event_log
+from ml_backend.aggregate_event_log import aggregate_event_log
+from ml_backend.event_log import evict_cache, iter_case_partitions, load_events
+
+# Integer ticket ids must come out as numbers in numeric order (1, 2, 10),
+# as a plain read_csv of the log gives them, not as strings in text order.
+
+CASE_IDS = [10, 2, 1, 10, 2, 1, 100]
+
+def write_log(path):
+    pd.DataFrame({
+        'case_id': CASE_IDS,
+        'timestamp': pd.date_range('2025-06-01 08:00', periods=len(CASE_IDS), freq='h'),
+        'activity': ['Created', 'Created', 'Created', 'Closed', 'Assigned', 'Assigned', 'Created'],
+        'user': ['Sara', 'Sara', 'Sara', 'Dev_Alice', 'Dev_Alice', 'Dev_Alice', 'Sara'],
+        'role': ['Scrum Master', 'Scrum Master', 'Scrum Master', 'Developer', 'Developer', 'Developer', 'Scrum Master'],
+        'story_points': [5, 3, 1, 5, 3, 1, 2],
+    }).to_csv(path, index=False)
+    return path
+
+def test_integer_case_ids_stay_numeric(tmp_path):
+    path = write_log(tmp_path / 'events.csv')
+    events = load_events(path, cache_dir='')
+    assert list(events['case_id'].cat.categories) == [1, 2, 10, 100]
+    assert events['case_id'].cat.categories.dtype == 'int64'
+    # Labels that are not all numbers stay text
+    assert list(events['activity'].cat.categories) == ['Assigned', 'Closed', 'Created']
+
+def test_integer_case_ids_in_cache_and_partitions(tmp_path):
+    path = write_log(tmp_path / 'events.csv')
+    load_events(path, cache_dir=str(tmp_path / 'cache'))
+    cached = load_events(path, cache_dir=str(tmp_path / 'cache'))
+    assert list(cached['case_id'].cat.categories) == [1, 2, 10, 100]
+    # A tiny budget splits the log over several partitions; every one of them
+    # decodes the ids the same way
+    parts = list(iter_case_partitions(path, memory_budget=1))
+    assert len(parts) > 1
+    assert all(part['case_id'].cat.categories.dtype == 'int64' for part in parts)
+
+def test_integer_case_ids_in_outputs(tmp_path, monkeypatch):
+    monkeypatch.setattr(event_log, 'CACHE_DIR', '')
+    path = write_log(tmp_path / 'events.csv')
+    agg = aggregate_event_log(load_events(path))
+    assert agg['case_id'].tolist() == [1, 2, 10, 100]
+
+    output_dir = tmp_path / 'output'
+    app.run_reports(app.load_log(path), only=['case_durations'], output_dir=str(output_dir))
+    with open(output_dir / 'case_durations.json') as f:
+        durations = json.load(f)
+    # Case 100 has a single event, so no step durations
+    assert [case['case_id'] for case in durations['cases']] == [1, 2, 10]
+
+def test_evict_cache_drops_expired_then_least_recently_used(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    (cache_dir / 'state').mkdir(parents=True)
+    now = time.time()
+    for name, age_days in [('old.feather', 40), ('state/1-aggregate.pkl', 3), ('recent.feather', 1), ('new.feather', 0)]:
+        file_path = cache_dir / name
+        file_path.write_bytes(b'x' * 1000)
+        os.utime(file_path, (now - age_days * 86400, now - age_days * 86400))
+    removed = evict_cache(str(cache_dir), max_size='2500', max_age_days=30)
+    assert sorted(os.path.relpath(path, cache_dir) for path in removed) == ['old.feather', os.path.join('state', '1-aggregate.pkl')]
+    assert sorted(os.listdir(cache_dir)) == ['new.feather', 'recent.feather', 'state']
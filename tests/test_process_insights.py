@@ -0,0 +1,49 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_backend import event_log
+from ml_backend.event_log import load_events
+from ml_backend.process_insights import (
+    DELAY_ACCURACY, MAX_DISTINCT_DELAYS, delay_percentiles, event_log_stats, stream_event_log_stats,
+)
+
+# Delay percentiles are computed from mergeable counts: exact while a key has
+# few distinct delays, within DELAY_ACCURACY once they are binned, and the
+# same whether the log is read whole or streamed under a memory budget.
+
+def write_log(path, n=4 * MAX_DISTINCT_DELAYS):
+    rng = np.random.default_rng(0)
+    pd.DataFrame({
+        'case_id': [f'TKT{case:05d}' for case in rng.integers(0, n // 4, n)],
+        'timestamp': pd.Timestamp('2025-06-01') + pd.to_timedelta(np.sort(rng.uniform(0, 3e7, n)), unit='s'),
+        'activity': rng.choice(['Created', 'Assigned'], n),
+        'user': rng.choice(['Sara', 'Dev_Alice'], n),
+        'role': 'Developer',
+        'story_points': 3,
+    }).to_csv(path, index=False)
+    return path
+
+def raw_percentiles(events):
+    ordered = events.sort_values(['case_id', 'timestamp'], kind='mergesort')
+    delays = ordered.groupby('case_id', observed=True)['timestamp'].diff().dt.total_seconds() / 3600.0
+    return delays.groupby(ordered['activity'], observed=True).quantile([0.5, 0.9, 0.99]).unstack()
+
+def test_streamed_percentiles_match_in_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(event_log, 'CACHE_DIR', '')
+    path = write_log(tmp_path / 'events.csv')
+    events = load_events(path)
+    stats = event_log_stats(events)
+    # Enough distinct delays per activity that they are binned
+    assert stats['activity_delay_counts']['binned'].all()
+    in_memory = delay_percentiles(stats)
+    streamed = delay_percentiles(stream_event_log_stats(path, memory_budget=64 * 1024))
+    pd.testing.assert_frame_equal(in_memory.reset_index(drop=True), streamed.reset_index(drop=True))
+
+    activities = in_memory[in_memory['level'] == 'activity'].set_index('name')
+    raw = raw_percentiles(events)
+    error = (activities[['p50', 'p90', 'p99']].to_numpy() - raw.to_numpy()) / raw.to_numpy()
+    assert np.abs(error).max() <= DELAY_ACCURACY